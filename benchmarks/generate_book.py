@@ -0,0 +1,95 @@
+"""
+generates synthetic .ibf books for benchmarks
+
+    python benchmarks/generate_book.py book.ibf --text 700 --quiz 100 --flashcards 100 --images 100
+"""
+import argparse
+import json
+import os
+import random
+from typing import List
+
+WORDS = ('if the weather is nice at the weekend we will go for a walk have time visit you plane delayed '
+         'arrive home evening were slimmer would become model lived england speak english better').split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def generate_images(image_dir: str, count: int, size=(1600, 1200)) -> List[str]:
+    """
+    writes count distinct png files, they are shared by all image cells of the book
+    """
+    from PIL import Image, ImageDraw
+
+    os.makedirs(image_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(image_dir, f'synthetic_{i}_{size[0]}x{size[1]}.png')
+        if not os.path.exists(path):
+            img = Image.linear_gradient('L').resize(size).convert('RGB')
+            draw = ImageDraw.Draw(img)
+            draw.rectangle((i * 40, i * 30, size[0] // 2 + i * 40, size[1] // 2), fill=(40 * i % 255, 90, 160))
+            img.save(path)
+        paths.append(os.path.abspath(path))
+    return paths
+
+
+def generate_cells(text: int = 0, quiz: int = 0, flashcards: int = 0, images: int = 0,
+                   image_paths: List[str] = (), seed: int = 0) -> List[dict]:
+    """
+    :return: cells in file format, kinds are shuffled like in a real course book
+    """
+    rng = random.Random(seed)
+    kinds = ['plain text'] * text + ['quiz'] * quiz + ['flash cards'] * flashcards + ['image'] * images
+    rng.shuffle(kinds)
+
+    cells = []
+    for kind in kinds:
+        match kind:
+            case 'plain text':
+                data = {"text": '\n'.join(sentence(rng, rng.randint(8, 30)) for _ in range(rng.randint(1, 6)))}
+            case 'quiz':
+                answers = [sentence(rng, rng.randint(1, 4)) for _ in range(rng.randint(2, 6))]
+                data = {"text": sentence(rng, 8), "answers": answers,
+                        "correct_answers": rng.sample(answers, rng.randint(1, len(answers)))}
+            case 'flash cards':
+                data = [{"front": sentence(rng, 3), "back": sentence(rng, 6), "color": rng.choice(('#336', '#363', '#633'))}
+                        for _ in range(rng.randint(2, 12))]
+            case _:
+                data = {"path": rng.choice(image_paths)}
+        cells.append({"cell_type": kind, "data": data})
+    return cells
+
+
+def generate_book(filename: str, text: int = 0, quiz: int = 0, flashcards: int = 0, images: int = 0,
+                  unique_images: int = 4, seed: int = 0) -> str:
+    image_paths = []
+    if images:
+        image_paths = generate_images(os.path.join(os.path.dirname(os.path.abspath(filename)), 'images'),
+                                      unique_images)
+    with open(filename, 'w') as file:
+        json.dump(generate_cells(text, quiz, flashcards, images, image_paths, seed), file, indent=4)
+    return filename
+
+
+def mixed_counts(cells: int) -> dict:
+    """
+    cell counts of a typical book: mostly text, some quizzes, flashcards and images
+    """
+    quiz = flashcards = images = cells // 10
+    return {"text": cells - quiz - flashcards - images, "quiz": quiz, "flashcards": flashcards, "images": images}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('filename')
+    parser.add_argument('--text', type=int, default=0)
+    parser.add_argument('--quiz', type=int, default=0)
+    parser.add_argument('--flashcards', type=int, default=0)
+    parser.add_argument('--images', type=int, default=0)
+    parser.add_argument('--unique-images', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate_book(args.filename, args.text, args.quiz, args.flashcards, args.images, args.unique_images, args.seed)
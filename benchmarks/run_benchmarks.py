@@ -0,0 +1,225 @@
+"""
+benchmarks of opening, drawing, editing and saving books of 10, 1k and 10k cells
+
+every size runs in its own process so peak RSS isn't shared between them. GUI benchmarks need
+a display, on a headless box run them under a virtual X server:
+
+    xvfb-run -a python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --model-only          # no display needed
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/<older run>.json
+
+results are stored in benchmarks/results/<timestamp>.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+SIZES = (10, 1000, 10000)
+REGRESSION_THRESHOLD = 1.2  # slower by more than 20% is reported as a regression
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+def peak_rss_kb() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def count_widgets(widget) -> int:
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+class Recorder:
+    def __init__(self):
+        self.results = {}
+
+    @contextmanager
+    def measure(self, name: str, repeat: int = 1):
+        """
+        wall time of the block (divided by repeat) and peak RSS after it
+        """
+        start = time.perf_counter()
+        yield
+        self.results[name] = {"seconds": (time.perf_counter() - start) / repeat, "peak_rss_kb": peak_rss_kb()}
+
+    def add(self, name: str, **values):
+        self.results.setdefault(name, {}).update(values)
+
+
+def run_model(book: str, recorder: Recorder):
+    from document import Document
+    from journal import BookJournal
+    from search import SearchIndex
+
+    with recorder.measure('model.load'):
+        document = Document.load(book)
+    with recorder.measure('model.search_index'):
+        index = SearchIndex(document)
+    with recorder.measure('model.search', repeat=20):
+        for _ in range(20):
+            index.search('weather wee')
+    with recorder.measure('model.move', repeat=100):
+        for i in range(100):
+            document.move(i % len(document), (i * 7) % len(document))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'book.ibf')
+        with recorder.measure('model.save_full'):
+            document.save(filename)
+        journal = BookJournal(document, filename)
+        first_text = next(record for record in document if record.cell_type == 'plain text')
+        document.update(first_text, text=first_text.text + ' word')
+        with recorder.measure('model.save_journal'):
+            journal.save()
+        with recorder.measure('model.compact'):
+            journal.compact()
+
+
+def pump(app, until=None, timeout: float = 120):
+    """
+    runs Tk event loop until condition is met (or everything pending got processed)
+    """
+    deadline = time.perf_counter() + timeout
+    app.update()
+    while until is not None and not until() and time.perf_counter() < deadline:
+        app.update()
+    app.update_idletasks()
+
+
+def run_gui(book: str, recorder: Recorder):
+    import main
+
+    app = main.App()
+    app.geometry('900x900')
+    pump(app, until=lambda: app.first_paint_ms is not None, timeout=10)
+    recorder.add('gui.startup', widgets=count_widgets(app), first_paint_ms=app.first_paint_ms)
+
+    with recorder.measure('gui.open_file'):
+        app.load_file(book)
+        pump(app, until=lambda: app.loader is None)
+    recorder.add('gui.open_file', widgets=count_widgets(app), cells=len(app.viewer.document))
+
+    viewer = app.viewer
+    with recorder.measure('gui.draw', repeat=10):
+        for _ in range(10):
+            viewer.__draw__()
+            app.update_idletasks()
+
+    viewer.scroll_to(0)
+    pump(app)
+    with recorder.measure('gui.shift_cell_down', repeat=20):
+        for _ in range(20):
+            viewer.shift_cell_down()
+            app.update_idletasks()
+
+    if viewer.selected_cell is not None:
+        first = viewer.cells.index(viewer.selected_cell)
+        viewer.selection_end = viewer.cells[min(first + 499, len(viewer.cells) - 1)]
+        with recorder.measure('gui.move_block', repeat=10):
+            for i in range(10):
+                viewer.move_selection(len(viewer.cells) // 2 if i % 2 == 0 else first)
+                app.update_idletasks()
+        viewer.selection_end = viewer.selected_cell
+
+    text_slot = next((slot for slot in viewer.built if slot.record.cell_type == 'plain text'), None)
+    if text_slot is not None:
+        with recorder.measure('gui.edit_open', repeat=10):
+            for _ in range(10):
+                text_slot.widget._edit_()
+                app.update_idletasks()
+                text_slot.widget._open_()
+                app.update_idletasks()
+
+    with recorder.measure('gui.scroll', repeat=10):
+        for i in range(10):
+            viewer._on_scrollbar('moveto', i / 10)  # as if the scrollbar was dragged through the book
+            pump(app)
+    recorder.add('gui.scroll', widgets=count_widgets(app), **viewer.pool.stats())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with recorder.measure('gui.save_file'):
+            viewer.document.save(os.path.join(tmp, 'book.ibf'))
+    recorder.add('gui.latency', **app.watchdog.stats())
+    app.watchdog.stop()
+    app.destroy()
+
+
+def worker(cells: int, model_only: bool) -> dict:
+    from generate_book import generate_book, mixed_counts
+
+    recorder = Recorder()
+    with tempfile.TemporaryDirectory() as tmp:
+        book = generate_book(os.path.join(tmp, f'book_{cells}.ibf'), **mixed_counts(cells))
+        recorder.add('book', bytes=os.path.getsize(book))
+        run_model(book, recorder)
+        if not model_only:
+            run_gui(book, recorder)
+    return recorder.results
+
+
+def compare(current: dict, baseline: dict) -> list:
+    """
+    :return: (size, benchmark, baseline seconds, current seconds) of benchmarks slower than the threshold
+    """
+    regressions = []
+    for size, results in current['sizes'].items():
+        for name, values in results.items():
+            old = baseline.get('sizes', {}).get(size, {}).get(name, {}).get('seconds')
+            new = values.get('seconds')
+            if old and new and new > old * REGRESSION_THRESHOLD:
+                regressions.append((size, name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--model-only', action='store_true', help="skip benchmarks which need a display")
+    parser.add_argument('--compare', help="earlier results file to check for regressions")
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        json.dump(worker(args.worker, args.model_only), sys.stdout)
+        return
+
+    if not args.model_only and not os.environ.get('DISPLAY') and sys.platform.startswith('linux'):
+        parser.error('no display, run under xvfb-run or pass --model-only')
+
+    run = {"started": time.strftime('%Y-%m-%dT%H:%M:%S'), "python": platform.python_version(),
+           "platform": platform.platform(), "sizes": {}}
+    for size in args.sizes:
+        command = [sys.executable, __file__, '--worker', str(size)] + (['--model-only'] if args.model_only else [])
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        run['sizes'][str(size)] = results = json.loads(output)
+        print(f'{size} cells')
+        for name, values in results.items():
+            print(f'  {name:24}', '  '.join(f'{key}={value:.4f}' if isinstance(value, float) else f'{key}={value}'
+                                            for key, value in values.items()))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    results_file = os.path.join(RESULTS_DIR, run['started'].replace(':', '') + '.json')
+    with open(results_file, 'w') as file:
+        json.dump(run, file, indent=4)
+    print(f'results saved to {results_file}')
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(run, json.load(file))
+        for size, name, old, new in regressions:
+            print(f'REGRESSION {size} cells {name}: {old:.4f}s -> {new:.4f}s')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
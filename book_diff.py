@@ -0,0 +1,375 @@
+"""
+cell level diff and three-way merge of books
+
+cells are compared by the hash of their saved form (see CellRecord._import_), so identical cells
+are paired in O(n) wherever they moved. Order of the paired cells is kept for the longest increasing
+run of their positions (O(n log n)), the other paired cells are reported as moved. Unpaired cells
+next to paired ones (or between two kept ones) are paired with cells of the same type as edits, so
+changed text, quiz answers or flashcards are reported field by field instead of as a delete and an
+insert.
+
+    python book_diff.py diff old.ibf new.ibf
+    python book_diff.py merge base.ibf ours.ibf theirs.ibf -o merged.ibf
+
+merge applies changes of both sides to the base: cells edited on one side take that edit, cells
+edited on both sides are merged field by field (and flashcards or answers item by item), only
+fields changed differently on both sides are conflicts, resolved in favour of --prefer side.
+"""
+import argparse
+import hashlib
+import json
+import sys
+from bisect import bisect_left
+from collections import defaultdict, deque
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+from journal import load_book, write_book
+from sequence import IndexedSequence, SequenceNode
+
+
+def item_hash(item) -> str:
+    return hashlib.sha1(json.dumps(item, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()).hexdigest()
+
+
+def _kind(item) -> str:
+    # only items of the same kind are paired as edits of each other
+    return item.get('cell_type') if isinstance(item, dict) else type(item).__name__
+
+
+def _increasing(pairs: List[Tuple[int, int]]) -> Set[int]:
+    """
+    :param pairs: (old position, new position) sorted by old position
+    :return: old positions of the longest run of pairs whose new positions increase too
+    """
+    tails = []  # tails[k]: smallest new position ending a run of length k + 1
+    tail_pairs = []  # pair ending that run
+    previous = [None] * len(pairs)
+    for i, (_, new) in enumerate(pairs):
+        k = bisect_left(tails, new)
+        if k == len(tails):
+            tails.append(new)
+            tail_pairs.append(i)
+        else:
+            tails[k] = new
+            tail_pairs[k] = i
+        previous[i] = tail_pairs[k - 1] if k else None
+    run = set()
+    i = tail_pairs[-1] if tail_pairs else None
+    while i is not None:
+        run.add(pairs[i][0])
+        i = previous[i]
+    return run
+
+
+class Matching(NamedTuple):
+    pairs: Dict[int, int]  # old position -> new position of kept items, edited ones included
+    moved: Set[int]  # old positions of kept items whose order changed relative to the others
+    old_hashes: List[str]
+    new_hashes: List[str]
+
+    def edited(self, old_index: int) -> bool:
+        return self.old_hashes[old_index] != self.new_hashes[self.pairs[old_index]]
+
+
+def match(old: list, new: list) -> Matching:
+    """
+    pairs items of two versions of a list (cells of a book, cards of a deck, answers of a quiz)
+    """
+    old_hashes = [item_hash(item) for item in old]
+    new_hashes = [item_hash(item) for item in new]
+
+    # identical items, n-th copy of an item is paired with its n-th copy
+    positions = defaultdict(deque)
+    for j, digest in enumerate(new_hashes):
+        positions[digest].append(j)
+    pairs = {}
+    for i, digest in enumerate(old_hashes):
+        queue = positions.get(digest)
+        if queue:
+            pairs[i] = queue.popleft()
+
+    # edited items next to paired ones are paired too (in both directions, so runs of edits are followed)
+    matched_new = set(pairs.values())
+
+    def pair_same_kind(i: int, j: int):
+        if 0 <= i < len(old) and 0 <= j < len(new) and i not in pairs and j not in matched_new and \
+                _kind(old[i]) == _kind(new[j]):
+            pairs[i] = j
+            matched_new.add(j)
+
+    pair_same_kind(0, 0)
+    for i in range(len(old)):
+        if i in pairs:
+            pair_same_kind(i + 1, pairs[i] + 1)
+    pair_same_kind(len(old) - 1, len(new) - 1)
+    for i in range(len(old) - 1, -1, -1):
+        if i in pairs:
+            pair_same_kind(i - 1, pairs[i] - 1)
+
+    # the rest of unpaired items of the same kind are paired in order between two kept ones
+    anchors = sorted(_increasing(sorted(pairs.items())))
+    bounds = [(-1, -1)] + [(i, pairs[i]) for i in anchors] + [(len(old), len(new))]
+    for (old_start, new_start), (old_end, new_end) in zip(bounds, bounds[1:]):
+        unpaired = defaultdict(deque)
+        for i in range(old_start + 1, old_end):
+            if i not in pairs:
+                unpaired[_kind(old[i])].append(i)
+        if not unpaired:
+            continue
+        for j in range(new_start + 1, new_end):
+            if j not in matched_new:
+                candidates = unpaired.get(_kind(new[j]))
+                if candidates:
+                    pairs[candidates.popleft()] = j
+
+    moved = set(pairs) - _increasing(sorted(pairs.items()))
+    return Matching(pairs, moved, old_hashes, new_hashes)
+
+
+class FieldChange(NamedTuple):
+    path: str  # e.g. 'text', 'answers[2]', 'cards[0].back', 'answers[3->1]' for moved items
+    old: object  # None for added values
+    new: object  # None for removed values
+
+
+class Edit(NamedTuple):
+    kind: str  # 'insert', 'delete', 'move' or 'update'
+    old_index: int  # None for inserts
+    new_index: int  # None for deletes
+    cell: dict  # cell in the new book (in the old one for deletes)
+    changes: Tuple[FieldChange, ...] = ()  # changed fields of updates
+
+
+def list_changes(field: str, old: list, new: list) -> List[FieldChange]:
+    matching = match(old, new)
+    changes = []
+    for i, item in enumerate(old):
+        j = matching.pairs.get(i)
+        if j is None:
+            changes.append(FieldChange(f'{field}[{i}]', item, None))
+        elif matching.edited(i):
+            if isinstance(item, dict) and isinstance(new[j], dict):
+                changes.extend(FieldChange(f'{field}[{j}].{key}', item.get(key), new[j].get(key))
+                               for key in sorted(item.keys() | new[j].keys()) if item.get(key) != new[j].get(key))
+            else:
+                changes.append(FieldChange(f'{field}[{j}]', item, new[j]))
+        elif i in matching.moved:
+            changes.append(FieldChange(f'{field}[{i}->{j}]', item, item))
+    matched_new = set(matching.pairs.values())
+    changes.extend(FieldChange(f'{field}[{j}]', None, item) for j, item in enumerate(new) if j not in matched_new)
+    return changes
+
+
+def field_changes(old_cell: dict, new_cell: dict) -> List[FieldChange]:
+    """
+    changes between two versions of a cell, lists (answers, flashcards) are compared item by item
+    """
+    if old_cell.get('cell_type') != new_cell.get('cell_type'):
+        return [FieldChange('cell_type', old_cell.get('cell_type'), new_cell.get('cell_type'))]
+    old_data, new_data = old_cell.get('data'), new_cell.get('data')
+    if isinstance(old_data, list) and isinstance(new_data, list):
+        return list_changes('cards', old_data, new_data)
+    if not isinstance(old_data, dict) or not isinstance(new_data, dict):
+        return [FieldChange('data', old_data, new_data)]
+    changes = []
+    for key in [*old_data, *(key for key in new_data if key not in old_data)]:
+        old_value, new_value = old_data.get(key), new_data.get(key)
+        if old_value == new_value:
+            continue
+        if isinstance(old_value, list) and isinstance(new_value, list):
+            changes.extend(list_changes(key, old_value, new_value))
+        else:
+            changes.append(FieldChange(key, old_value, new_value))
+    return changes
+
+
+def diff(old_cells: List[dict], new_cells: List[dict]) -> List[Edit]:
+    """
+    :param old_cells: cells as saved in file (Document.to_file_data)
+    :return: deletes (by old position) followed by the other edits by new position
+    """
+    matching = match(old_cells, new_cells)
+    edits = []
+    for i, cell in enumerate(old_cells):
+        j = matching.pairs.get(i)
+        if j is None:
+            edits.append(Edit('delete', i, None, cell))
+            continue
+        if i in matching.moved:
+            edits.append(Edit('move', i, j, new_cells[j]))
+        if matching.edited(i):
+            edits.append(Edit('update', i, j, new_cells[j], tuple(field_changes(cell, new_cells[j]))))
+    matched_new = set(matching.pairs.values())
+    edits.extend(Edit('insert', None, j, cell) for j, cell in enumerate(new_cells) if j not in matched_new)
+    edits.sort(key=lambda edit: (edit.kind != 'delete', edit.old_index if edit.kind == 'delete' else edit.new_index))
+    return edits
+
+
+# three-way merge
+
+class Conflict(NamedTuple):
+    path: str  # e.g. 'cells[12]', 'cells[12].data.cards[3].back' (positions in base)
+    base: object  # None if the value wasn't in base
+    ours: object  # None if deleted on our side
+    theirs: object  # None if deleted on their side
+
+
+class MergeResult(NamedTuple):
+    cells: List[dict]
+    conflicts: List[Conflict]
+
+
+class _Merged(SequenceNode):
+    __slots__ = ('item',)
+
+    def __init__(self, item):
+        super().__init__()
+        self.item = item
+
+
+def merge_item(path: str, base, ours, theirs, prefer: str = 'ours') -> Tuple[object, List[Conflict]]:
+    """
+    three-way merge of a json value, dicts are merged key by key and lists item by item
+    """
+    if ours == theirs or theirs == base:
+        return ours, []
+    if ours == base:
+        return theirs, []
+    if isinstance(base, dict) and isinstance(ours, dict) and isinstance(theirs, dict):
+        merged = {}
+        conflicts = []
+        for key in [*ours, *(key for key in theirs if key not in ours)]:
+            value, key_conflicts = merge_item(f'{path}.{key}', base.get(key), ours.get(key), theirs.get(key), prefer)
+            conflicts.extend(key_conflicts)
+            if value is not None:
+                merged[key] = value
+        return merged, conflicts
+    if isinstance(base, list) and isinstance(ours, list) and isinstance(theirs, list):
+        return merge_lists(path, base, ours, theirs, prefer)
+    return (ours if prefer == 'ours' else theirs), [Conflict(path, base, ours, theirs)]
+
+
+def merge_lists(path: str, base: list, ours: list, theirs: list, prefer: str = 'ours') -> Tuple[list, List[Conflict]]:
+    """
+    three-way merge of lists, our order is kept and items moved or inserted only on their side are
+    placed after the item they follow on their side
+    """
+    to_ours = match(base, ours)
+    to_theirs = match(base, theirs)
+    conflicts = []
+    nodes = [_Merged(item) for item in ours]
+    merged = IndexedSequence(nodes)
+    restored = set()  # base positions deleted by us but kept (edited) by them
+
+    for i, base_item in enumerate(base):
+        o = to_ours.pairs.get(i)
+        t = to_theirs.pairs.get(i)
+        if o is None:
+            if t is not None and to_theirs.edited(i):
+                conflicts.append(Conflict(f'{path}[{i}]', base_item, None, theirs[t]))
+                if prefer == 'theirs':
+                    restored.add(i)
+            continue
+        if t is None:
+            if to_ours.edited(i):
+                conflicts.append(Conflict(f'{path}[{i}]', base_item, ours[o], None))
+                if prefer == 'ours':
+                    continue
+            merged.delete(merged.index(nodes[o]))
+            continue
+        nodes[o].item, item_conflicts = merge_item(f'{path}[{i}]', base_item, ours[o], theirs[t], prefer)
+        conflicts.extend(item_conflicts)
+
+    # items inserted on both sides are kept once
+    paired_ours = set(to_ours.pairs.values())
+    inserted_by_us = defaultdict(deque)
+    for j, node in enumerate(nodes):
+        if j not in paired_ours:
+            inserted_by_us[to_ours.new_hashes[j]].append(node)
+
+    base_of_theirs = {t: i for i, t in to_theirs.pairs.items()}
+    previous = None  # node of the last item of theirs already placed
+    for j, item in enumerate(theirs):
+        i = base_of_theirs.get(j)
+        if i is None or i in restored:
+            same = inserted_by_us.get(to_theirs.new_hashes[j]) if i is None else None
+            if same:
+                previous = same.popleft()
+                continue
+            node = _Merged(item)
+            merged.insert(merged.index(previous) + 1 if previous is not None else 0, [node])
+            previous = node
+            continue
+        o = to_ours.pairs.get(i)
+        if o is None or nodes[o] not in merged:
+            continue
+        node = nodes[o]
+        if i in to_theirs.moved and i not in to_ours.moved:
+            merged.delete(merged.index(node))
+            merged.insert(merged.index(previous) + 1 if previous is not None else 0, [node])
+        previous = node
+    return [node.item for node in merged], conflicts
+
+
+def merge(base_cells: List[dict], ours_cells: List[dict], theirs_cells: List[dict], prefer: str = 'ours') -> MergeResult:
+    """
+    :param prefer: side ('ours' or 'theirs') whose value is taken for conflicting changes
+    """
+    if prefer not in ('ours', 'theirs'):
+        raise ValueError("prefer must be 'ours' or 'theirs'")
+    return MergeResult(*merge_lists('cells', base_cells, ours_cells, theirs_cells, prefer))
+
+
+def read_cells(filename: str) -> List[dict]:
+    document = load_book(filename)
+    if document.pack is not None:
+        document.pack.close()
+    return document.to_file_data()
+
+
+def format_edit(edit: Edit) -> List[str]:
+    cell_type = edit.cell.get('cell_type') if isinstance(edit.cell, dict) else None
+    match edit.kind:
+        case 'delete':
+            return [f'delete  cell {edit.old_index} ({cell_type})']
+        case 'insert':
+            return [f'insert  cell {edit.new_index} ({cell_type})']
+        case 'move':
+            return [f'move    cell {edit.old_index} -> {edit.new_index} ({cell_type})']
+    return [f'update  cell {edit.old_index} -> {edit.new_index} ({cell_type}) {change.path}: '
+            f'{change.old!r} -> {change.new!r}' for change in edit.changes]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='cell level diff and three-way merge of books')
+    commands = parser.add_subparsers(dest='command', required=True)
+    diff_command = commands.add_parser('diff', help='list changes between two versions of a book')
+    diff_command.add_argument('old')
+    diff_command.add_argument('new')
+    merge_command = commands.add_parser('merge', help='merge changes of two versions of a book into one')
+    merge_command.add_argument('base', help='common ancestor of both versions')
+    merge_command.add_argument('ours')
+    merge_command.add_argument('theirs')
+    merge_command.add_argument('-o', '--output', required=True, help='merged book (.ibf or .ibfp)')
+    merge_command.add_argument('--prefer', choices=('ours', 'theirs'), default='ours',
+                               help='side taken for conflicting changes (default: ours)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'diff':
+        edits = diff(read_cells(args.old), read_cells(args.new))
+        for edit in edits:
+            print('\n'.join(format_edit(edit)))
+        counts = {kind: sum(edit.kind == kind for edit in edits) for kind in ('insert', 'delete', 'move', 'update')}
+        print(', '.join(f'{count} {kind}s' for kind, count in counts.items()), file=sys.stderr)
+        return 1 if edits else 0
+
+    result = merge(read_cells(args.base), read_cells(args.ours), read_cells(args.theirs), args.prefer)
+    write_book(args.output, result.cells)
+    for conflict in result.conflicts:
+        print(f'conflict {conflict.path}: base {conflict.base!r}, ours {conflict.ours!r}, theirs {conflict.theirs!r}')
+    print(f'{len(result.cells)} cells, {len(result.conflicts)} conflicts resolved as {args.prefer}', file=sys.stderr)
+    return 1 if result.conflicts else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+registry of cell types
+
+every cell type declares its type tag (saved in file as "cell_type"), record class (see document.py)
+and widget class. Widget modules are imported only when the first cell of their type is built, so
+dependencies of cell types a book doesn't use are never loaded. New cell types are added with
+
+    register_cell_type(CellType('poll', PollRecord, 'cells.poll:PollCell', icon='poll'))
+
+widget classes have to implement Cell (see cells/base.py) and may provide classmethod
+new_record(viewer) returning the record of a newly created cell (or None if the user cancelled)
+"""
+import importlib
+import os
+from typing import Callable, Dict, List
+
+from document import (CELL_RECORDS, CellRecord, FlashcardsRecord, ImageRecord, PlainTextRecord, QuizRecord,
+                      UnknownRecord)
+
+
+class CellType:
+    __slots__ = ('tag', 'record', 'widget_path', 'icon', 'estimate_height', 'title', '_widget')
+
+    def __init__(self, tag: str, record: type, widget_path: str, icon: str = None,
+                 estimate_height: Callable[[CellRecord], int] = None, title: Callable[[CellRecord], str] = None):
+        """
+        :param widget_path: '<module>:<class>' of the widget
+        :param icon: toolbar icon (name in icons.py) of the button creating cells of this type, None for no button
+        :param estimate_height: rough height (in pixels, including grid padding) of a cell which hasn't been built yet
+        :param title: short one line description of a cell, shown in the outline
+        """
+        self.tag = tag
+        self.record = record
+        self.widget_path = widget_path
+        self.icon = icon
+        self.estimate_height = estimate_height or (lambda record: 100)
+        self.title = title or (lambda record: record.cell_type or 'unknown cell')
+        self._widget = None
+
+    @property
+    def widget(self) -> type:
+        """
+        widget class, its module is imported on first access
+        """
+        if self._widget is None:
+            module_name, class_name = self.widget_path.split(':')
+            self._widget = getattr(importlib.import_module(module_name), class_name)
+        return self._widget
+
+    @property
+    def loaded(self) -> bool:
+        return self._widget is not None
+
+    def __repr__(self):
+        return f'CellType({self.tag!r}, {self.record.__name__}, {self.widget_path!r})'
+
+
+# cell type tag -> CellType, in order of toolbar buttons
+CELL_TYPES: Dict[str, CellType] = {}
+UNKNOWN_CELL_TYPE = CellType(None, UnknownRecord, 'cells.unknown:UnknownCell')
+
+
+def register_cell_type(cell_type: CellType):
+    CELL_TYPES[cell_type.tag] = cell_type
+    CELL_RECORDS[cell_type.tag] = cell_type.record
+
+
+def get_cell_type(tag: str) -> CellType:
+    """
+    :return: registered cell type, cells of unknown types get a placeholder widget
+    """
+    return CELL_TYPES.get(tag, UNKNOWN_CELL_TYPE)
+
+
+def creatable_cell_types() -> List[CellType]:
+    return [cell_type for cell_type in CELL_TYPES.values() if cell_type.icon]
+
+
+def _text_height(record: PlainTextRecord) -> int:
+    lines = record.text.count('\n') + len(record.text) // 60 + 1
+    return 20 + 30 * lines
+
+
+def first_line(text) -> str:
+    """
+    first non blank line of text, stripped
+    """
+    if not isinstance(text, str):
+        return ''
+    return next((line.strip() for line in text.splitlines() if line.strip()), '')
+
+
+def _flashcards_title(record: FlashcardsRecord) -> str:
+    if not record.cards:
+        return 'no cards'
+    return f'{first_line(record.cards[0].front)} ({len(record.cards)} cards)'
+
+
+register_cell_type(CellType('plain text', PlainTextRecord, 'cells.plain_text:PlainTextCell', icon='text',
+                            estimate_height=_text_height, title=lambda record: first_line(record.text)))
+register_cell_type(CellType('quiz', QuizRecord, 'cells.quiz:QuizCell', icon='quiz',
+                            estimate_height=lambda record: 110 + 40 * len(record.answers),
+                            title=lambda record: first_line(record.text)))
+register_cell_type(CellType('flash cards', FlashcardsRecord, 'cells.flashcards:FlashcardCell',
+                            estimate_height=lambda record: 375, title=_flashcards_title))
+register_cell_type(CellType('image', ImageRecord, 'cells.image:ImageCell', icon='image',
+                            estimate_height=lambda record: 310,
+                            title=lambda record: os.path.basename(record.path) if isinstance(record.path, str) else ''))
@@ -0,0 +1,244 @@
+from abc import ABC, abstractmethod
+
+import customtkinter as ctk
+
+from document import CellRecord
+
+
+class Cell(ABC):
+    """
+    Base class for all cells in file
+
+    every instance of this class must realize _open_ and _edit_ methods that changes current layout,
+    data itself is kept in a headless record (see document.py), the cell is only a view over it
+
+    recyclable cells build their view and edit frames once and only reconfigure them afterwards,
+    so CellPool can rebind them to another record instead of building a new widget
+    """
+    recyclable: bool = False
+
+    @abstractmethod
+    def __init__(self, record: CellRecord):
+        self.record: CellRecord = record
+        self.view_frame: [ctk.CTkFrame, ctk.CTkScrollableFrame] = self._open_()  # showing data
+        self.edit_frame: [ctk.CTkFrame, ctk.CTkScrollableFrame] = None
+        self._render_()  # rendering data
+        ...
+
+    def _import_(self) -> dict:
+        """
+        returns formated tuple which will be saved into file
+        {
+            "cell_type": <type>,
+            "data": <data>
+        }
+        :return: dictionary
+        """
+        return self.record._import_()
+
+    @abstractmethod
+    def _render_(self):
+        """
+        creates new view frame based on record
+        :return:
+        """
+        ...
+
+    @abstractmethod
+    def _save_(self):
+        """
+        saves changes into record (through Document.update, so observers are notified)
+        :return:
+        """
+        ...
+
+    @abstractmethod
+    def _open_(self) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
+        """
+        changes current layout to view mode and renders it again
+
+        :return: CTkFrame[Scrollable] object with rendered information ( rather not editable )
+        """
+        ...
+
+    @abstractmethod
+    def _edit_(self) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
+        """
+        changes current layout to edit mode
+
+        :return:  CTkFrame[Scrollable] object allows to edit data in it
+        """
+        ...
+
+    def bind_record(self, record: CellRecord):
+        """
+        shows another record of the same type in this (recycled) cell
+        """
+        self.record = record
+        self._render_()
+        self._open_()
+
+    def recycle(self):
+        """
+        called when the cell is put into the pool, unsaved edits are dropped
+        """
+        self.configure(border_width=0)
+
+
+def extends_selection(event) -> bool:
+    """
+    clicks with shift held extend the selection of cells instead of replacing it
+    """
+    return event is not None and bool(event.state & 0x0001)
+
+
+class CellPool:
+    """
+    widgets of cells which were scrolled away or deleted, kept hidden (up to max_per_type for each
+    cell type) and rebound to the next record of their type instead of building a new widget
+
+        widget = pool.acquire(PlainTextCell, viewer, record)
+        ...
+        pool.release(widget)
+    """
+
+    def __init__(self, max_per_type: int = 16):
+        self.max_per_type = max_per_type
+        self.free: dict = {}  # widget class -> hidden widgets
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, widget_class: type, parent, record: CellRecord) -> Cell:
+        free = self.free.get(widget_class)
+        while free:
+            widget = free.pop()
+            if widget.winfo_exists() and widget.master is parent:
+                self.reused += 1
+                widget.bind_record(record)
+                return widget
+        self.created += 1
+        return widget_class(parent, record)
+
+    def release(self, widget: Cell):
+        free = self.free.setdefault(type(widget), [])
+        if widget.recyclable and len(free) < self.max_per_type:
+            widget.grid_forget()
+            widget.recycle()
+            free.append(widget)
+        else:
+            widget.destroy()
+
+    def clear(self):
+        for free in self.free.values():
+            for widget in free:
+                widget.destroy()
+        self.free.clear()
+
+    def stats(self) -> dict:
+        return {"created": self.created, "reused": self.reused,
+                "pooled": sum(len(free) for free in self.free.values())}
+
+
+class WrapManager:
+    """
+    coalesces <Configure> events of all AutoWrappingCTkLabels into one idle-time pass
+
+    labels whose width didn't change since their last wrap are skipped, offscreen labels are
+    deferred until they get scrolled into view (see refresh)
+    """
+
+    def __init__(self):
+        self.pending: dict = {}  # labels waiting for a pass (dict keeps them ordered)
+        self._job = None
+        self._widget = None  # any living widget, used for scheduling
+
+        self.events = 0
+        self.reflows = 0
+        self.skipped_unchanged = 0
+        self.skipped_offscreen = 0
+
+    def request(self, label: 'AutoWrappingCTkLabel'):
+        self.events += 1
+        self.pending[label] = None
+        self._widget = label
+        self.refresh()
+
+    def forget(self, label: 'AutoWrappingCTkLabel'):
+        self.pending.pop(label, None)
+        if self._widget is label:
+            self._widget = next(iter(self.pending), None)
+
+    def refresh(self):
+        """
+        schedules a pass over pending labels, e.g. after scrolling brought deferred ones into view
+        """
+        if self._job is None and self.pending and self._widget is not None:
+            self._job = self._widget.after_idle(self._wrap_pending)
+
+    @staticmethod
+    def _on_screen(label: ctk.CTkLabel) -> bool:
+        if not label.winfo_ismapped():
+            return False
+        window = label.winfo_toplevel()
+        y = label.winfo_rooty() - window.winfo_rooty()
+        return y + label.winfo_height() >= 0 and y <= window.winfo_height()
+
+    def _wrap_pending(self):
+        self._job = None
+        pending, self.pending = self.pending, {}
+        for label in pending:
+            if not label.winfo_exists():
+                continue
+            width = label.winfo_width()
+            if width == label.wrapped_width:
+                self.skipped_unchanged += 1
+            elif not self._on_screen(label):
+                self.skipped_offscreen += 1
+                self.pending[label] = None
+            else:
+                label.apply_wraplength(width)
+                self.reflows += 1
+        self._widget = next(iter(self.pending), None)
+
+    def stats(self) -> dict:
+        return {
+            "events": self.events,
+            "reflows": self.reflows,
+            "avoided": self.events - self.reflows,
+            "skipped_unchanged": self.skipped_unchanged,
+            "skipped_offscreen": self.skipped_offscreen,
+        }
+
+
+wrap_manager = WrapManager()
+
+
+class AutoWrappingCTkLabel(ctk.CTkLabel):
+    def __init__(self, master=None, **kwargs):
+        self.text = kwargs.pop("text", "")
+        self.wrapped_width = None  # width the current wraplength was computed for
+        super().__init__(master, **kwargs)
+        self.bind("<Configure>", self.on_resize)
+        self.configure(text=self.text)
+        self.update_wraplength()
+
+    def on_resize(self, event):
+        wrap_manager.request(self)
+
+    def destroy(self):
+        wrap_manager.forget(self)
+        super().destroy()
+
+    def update_wraplength(self):
+        self.apply_wraplength(self.winfo_width())
+
+    def apply_wraplength(self, width: int):
+        current_width = int(width / 1.2)
+        if current_width > 1:  # Avoid wraplength of 0
+            self.configure(wraplength=current_width)
+            self.wrapped_width = width
+
+    def set_text(self, new_text):
+        self.text = new_text
+        self.configure(text=self.text)
+        self.update_wraplength()
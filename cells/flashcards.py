@@ -0,0 +1,177 @@
+import customtkinter as ctk
+
+from cells.base import AutoWrappingCTkLabel, Cell, extends_selection
+from document import Flashcard, FlashcardsRecord
+
+
+class FlashCard(ctk.CTkFrame):
+    """
+    single card of the deck, the back side label is created on the first flip
+
+    card widgets are reused for other cards when the deck is paged (see show)
+    """
+
+    def __init__(self, parent, card: Flashcard):
+        super().__init__(parent, fg_color='transparent')
+        self.card: Flashcard = card
+        self.current_side = 'front'  # Flag to track if currently showing back side
+
+        # front side
+        self.front_label = AutoWrappingCTkLabel(self, text=card.front, font=('Arial', 20), width=175,
+                                                height=300, fg_color=card.color, corner_radius=15)
+        self.front_label.pack(fill='both', expand=True, padx=5, pady=5)
+        self.front_label.bind('<Button-1>', self.flip)
+
+        # back side (created when needed)
+        self.back_label: AutoWrappingCTkLabel = None
+
+    def show(self, card: Flashcard):
+        """
+        shows another card, front side up
+        """
+        if self.current_side == 'back':
+            self.flip()
+        if card is not self.card:
+            self.card = card
+            self.front_label.configure(fg_color=card.color)
+            self.front_label.set_text(card.front)
+            if self.back_label is not None:
+                self.back_label.configure(fg_color=card.color)
+                self.back_label.set_text(card.back)
+
+    def flip(self, event=None):
+        if self.current_side == 'front':
+            if self.back_label is None:
+                self.back_label = AutoWrappingCTkLabel(self, text=self.card.back, font=('Arial', 20), width=175,
+                                                       height=300, fg_color=self.card.color, corner_radius=15)
+                self.back_label.bind('<Button-1>', self.flip)
+            self.front_label.pack_forget()
+            self.back_label.pack(fill='both', expand=True, padx=5, pady=5)
+
+        else:
+            self.back_label.pack_forget()
+            self.front_label.pack(fill='both', expand=True, padx=5, pady=5)
+
+        self.current_side = 'front' if self.current_side == 'back' else 'back'
+
+
+class FlashcardCell(ctk.CTkFrame, Cell):
+    """
+    deck of flashcards shown a page at a time, only cards of the current page have widgets
+    (reused when paging), so decks of thousands of cards cost the same as small ones
+    """
+    recyclable = True
+    cards_per_page = 4
+
+    def __init__(self, parent, record: FlashcardsRecord):
+        super().__init__(parent, height=230)
+        self.bind("<Double-Button-1>", self._edit_)
+        self.bind("<Button-1>", self.on_click)
+        self.record: FlashcardsRecord = record
+
+        self.view_frame = None
+        self.edit_frame = None
+        self.cards: list[FlashCard] = []  # widgets of the current page
+        self.first_card = 0  # index of the first card on the current page
+
+        self._render_()  # Rendering data
+        self._open_()  # Showing data
+
+    def on_click(self, event=None):
+        self.master.select_frame(self, extend=extends_selection(event))
+
+    def _render_(self):
+        if self.view_frame is None:
+            self.view_frame = ctk.CTkFrame(self, corner_radius=15, width=125, height=225)
+            self.view_frame.bind("<Double-Button-1>", self._edit_)
+            self.view_frame.bind("<Button-1>", self.on_click)
+
+            self.cards_frame = ctk.CTkFrame(self.view_frame, fg_color='transparent')
+            self.cards_frame.grid(row=0, column=0, columnspan=4, sticky='W')
+
+            self.previous_button = ctk.CTkButton(self.view_frame, text="<", width=32, command=self.previous_page)
+            self.previous_button.grid(row=1, column=0, padx=5, pady=5)
+            self.page_label = ctk.CTkLabel(self.view_frame, text="")
+            self.page_label.grid(row=1, column=1, padx=5)
+            self.next_button = ctk.CTkButton(self.view_frame, text=">", width=32, command=self.next_page)
+            self.next_button.grid(row=1, column=2, padx=5, pady=5)
+            self.jump_entry = ctk.CTkEntry(self.view_frame, placeholder_text="Go to card", width=90)
+            self.jump_entry.grid(row=1, column=3, padx=5, pady=5, sticky='W')
+            self.jump_entry.bind('<Return>', self._jump_from_entry)
+
+        self.show_page(min(self.first_card, max(len(self.record.cards) - 1, 0)))
+
+    def show_page(self, first_card: int):
+        """
+        shows cards_per_page cards starting at first_card
+        """
+        deck = self.record.cards
+        self.first_card = first_card = max(0, min(first_card, len(deck) - 1)) if deck else 0
+        page = deck[first_card:first_card + self.cards_per_page]
+
+        for i, card in enumerate(page):
+            if i == len(self.cards):
+                self.cards.append(FlashCard(self.cards_frame, card))
+            else:
+                self.cards[i].show(card)
+            self.cards[i].grid(row=0, column=i, pady=2, padx=5, sticky='NS')
+        for card_widget in self.cards[len(page):]:
+            card_widget.grid_remove()
+
+        last_card = first_card + len(page)
+        self.page_label.configure(text=f"{first_card + 1}-{last_card} / {len(deck)}" if page else "no cards")
+        self.previous_button.configure(state='normal' if first_card > 0 else 'disabled')
+        self.next_button.configure(state='normal' if last_card < len(deck) else 'disabled')
+
+    def show_card(self, index: int):
+        """
+        jumps to the page which starts with the card at index
+        """
+        self.show_page(index)
+
+    def next_page(self):
+        self.show_page(self.first_card + self.cards_per_page)
+
+    def previous_page(self):
+        self.show_page(max(self.first_card - self.cards_per_page, 0))
+
+    def _jump_from_entry(self, event=None):
+        try:
+            number = int(self.jump_entry.get())
+        except ValueError:
+            return
+        self.show_card(number - 1)  # cards are numbered from 1 for the user
+
+    def bind_record(self, record: FlashcardsRecord):
+        self.first_card = 0
+        super().bind_record(record)
+
+    def _open_(self):
+        if self.edit_frame:
+            self.edit_frame.destroy()
+            self.edit_frame = None
+
+        self.view_frame.pack(fill='both', expand=True, pady=2, padx=2)
+
+    def _edit_(self, event=None):
+        pass
+
+    def _save_(self, card: Flashcard, new_front, new_back):
+        card.front = new_front
+        card.back = new_back
+        self.master.document.update(self.record)
+        self._show_changes()
+
+    def _delete_(self, card: Flashcard):
+        """
+        removes the card from the deck, paging stays at the same position (within the smaller deck)
+        """
+        self.record.cards.remove(card)
+        self.master.document.update(self.record)
+        self._show_changes()
+
+    def _show_changes(self):
+        for card_widget in self.cards:
+            card_widget.card = None  # texts are refreshed even for the same card
+        self._render_()
+        self._open_()  # closes the edit frame too
@@ -0,0 +1,100 @@
+import customtkinter as ctk
+from PIL import Image
+
+from cells.base import Cell, extends_selection
+from document import ImageRecord
+from image_cache import decode_width, image_decoder, scaled_size
+
+BLANK_IMAGE = ctk.CTkImage(Image.new('RGBA', (1, 1)), size=(1, 1))
+
+
+class ImageCell(ctk.CTkFrame, Cell):
+    recyclable = True
+
+    def __init__(self, parent, record: ImageRecord):
+        super().__init__(parent)
+        self.record: ImageRecord = record
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+
+        self.view_frame: ctk.CTkImage = None
+        self.edit_frame: ctk.CTkFrame = None
+        self.decode_ticket = None  # pending background decode of the image
+
+        self._render_()  # rendering data
+        self._open_()  # showing data
+
+    @classmethod
+    def new_record(cls, viewer) -> ImageRecord:
+        filename = ctk.filedialog.askopenfilename(title="Select a file",
+                                                  filetypes=(("Image format", "*.png"), ("All files", "*.*")))
+        return ImageRecord(filename) if filename else None
+
+    def _cancel_decode(self):
+        if self.decode_ticket:
+            self.decode_ticket.cancel()
+            self.decode_ticket = None
+
+    def destroy(self):
+        # cell scrolled out of view or deleted, its image isn't needed anymore
+        self._cancel_decode()
+        super().destroy()
+
+    def recycle(self):
+        super().recycle()
+        self._cancel_decode()
+
+    def _edit_(self) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
+        pass
+
+    def _open_(self) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
+        self.view_frame.grid(row=0, column=0, padx=3, pady=3, sticky="SWEN")
+
+    def on_click(self, event=None):
+        self.master.select_frame(self, extend=extends_selection(event))
+
+    def _display_width(self) -> int:
+        # images are downscaled to the width of the viewer
+        width = self.master.winfo_width()
+        return width - 20 if width > 1 else 800
+
+    def _render_(self):
+        width = decode_width(self._display_width())  # the width the decoder is going to use
+
+        # placeholder of the final size is shown until the image is decoded in background
+        try:
+            path = self.master.document.image_path(self.record)
+            if not isinstance(path, str) or not path:
+                raise ValueError(f'image cell has no path: {path!r}')
+            placeholder_width, placeholder_height = scaled_size(path, width)
+            error = None
+        except (OSError, ValueError) as e:  # missing or unreadable image, or its packed copy can't be extracted
+            placeholder_width, placeholder_height = width, 300
+            error = e
+        self.image_frame = None
+        if self.view_frame is None:
+            self.view_frame = ctk.CTkFrame(self)
+            self.image_label = ctk.CTkLabel(self.view_frame, text="", width=placeholder_width,
+                                            height=placeholder_height)
+            self.image_label.bind('<Button-1>', self.on_click)
+            self.image_label.pack()
+        else:  # recycled cell, previous image is cleared
+            self._cancel_decode()
+            # CTkLabel ignores image=None and keeps showing the old image, a blank one replaces it
+            self.image_label.configure(image=BLANK_IMAGE, text="", width=placeholder_width, height=placeholder_height)
+
+        if error is not None:
+            self._show_image(None, error)
+        else:
+            self.decode_ticket = image_decoder.request(self, path, width, self._show_image)
+
+    def _show_image(self, image: ctk.CTkImage, error: Exception):
+        self.decode_ticket = None
+        if error is not None:
+            self.image_label.configure(text=f"can't load {self.record.path}")
+            return
+        self.image_frame = image
+        self.image_label.configure(image=image)
+
+    def _save_(self):
+        pass
@@ -0,0 +1,77 @@
+import customtkinter as ctk
+
+from cells.base import AutoWrappingCTkLabel, Cell, extends_selection
+from document import PlainTextRecord
+
+
+class PlainTextCell(ctk.CTkFrame, Cell):
+    recyclable = True
+
+    def __init__(self, parent, record: PlainTextRecord):
+        super().__init__(parent)
+        self.root = parent
+
+        self.configure()
+        self.record: PlainTextRecord = record
+        self.view_frame: [ctk.CTkFrame, ctk.CTkScrollableFrame] = None
+        self.edit_frame: [ctk.CTkFrame, ctk.CTkScrollableFrame] = None
+        self._render_()  # rendering data
+        self._open_()  # showing data
+
+    @classmethod
+    def new_record(cls, viewer) -> PlainTextRecord:
+        return PlainTextRecord("")
+
+    def on_click(self, event=None):
+        self.root.select_frame(self, extend=extends_selection(event))
+
+    def _render_(self):
+        # view frame is built once, later renders only change the text
+        if self.view_frame is not None:
+            self.text_label.set_text(self.record.text)
+            return
+
+        self.view_frame = ctk.CTkFrame(self, corner_radius=15, border_width=2)
+        self.view_frame.columnconfigure(0, weight=1)
+        self.view_frame.rowconfigure(0, weight=1)
+
+        text = self.record.text
+        self.text_label = AutoWrappingCTkLabel(master=self.view_frame, text=text, font=('Arial', 20), justify='left',
+                                               corner_radius=15)
+        self.text_label.grid(row=0, column=0, sticky='NSEW')
+        self.text_label.bind('<Double-Button-1>', self._edit_)
+        self.text_label.bind("<Button-1>", self.on_click)
+
+    def _open_(self, event=None) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
+        if self.edit_frame:
+            self.edit_frame.pack_forget()
+        self.view_frame.pack(fill='both', padx=2, pady=2)
+
+    def _save_(self):
+        new_text = self.entry_frame.get("0.0", "end")
+        self.root.document.update(self.record, text=new_text)
+
+    def _exit_edit_mode(self, event=None):
+        self._save_()
+        self._render_()
+        self._open_()
+
+    def _edit_(self, event=None) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
+        if self.edit_frame is None:
+            self.edit_frame = ctk.CTkFrame(self, corner_radius=8, border_width=2)
+            self.edit_frame.columnconfigure(0, weight=1)
+            self.edit_frame.rowconfigure(0, weight=1)
+
+            self.entry_frame = ctk.CTkTextbox(self.edit_frame, font=('Arial', 20), wrap='word')
+            self.entry_frame.grid(row=0, column=0, sticky='NSEW')
+            self.entry_frame.bind('<Shift-Return>', self._exit_edit_mode)
+
+        self.entry_frame.delete('0.0', 'end')
+        self.entry_frame.insert('0.0', self.record.text)
+        self.view_frame.pack_forget()
+        self.edit_frame.pack(fill='both', expand=True, side='top')
+
+    def recycle(self):
+        super().recycle()
+        if self.edit_frame:
+            self.edit_frame.pack_forget()
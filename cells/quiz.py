@@ -0,0 +1,197 @@
+import customtkinter as ctk
+
+from cells.base import Cell, extends_selection
+from document import QuizRecord
+
+
+class AnswerRow:
+    """
+    widgets editing a single answer of QuizCell, hidden rows are kept for reuse
+    """
+
+    def __init__(self, cell: 'QuizCell', frame: ctk.CTkScrollableFrame):
+        self.entry = ctk.CTkEntry(frame)
+        self.correct_var = ctk.BooleanVar(value=False)
+        self.correct_checkbox = ctk.CTkCheckBox(frame, variable=self.correct_var, text="Correct")
+        self.delete_button = ctk.CTkButton(frame, text="Delete", command=lambda: cell._delete_answer_row(self))
+
+    def set(self, answer_text: str, is_correct: bool):
+        self.entry.delete(0, 'end')
+        self.entry.insert(0, answer_text)
+        self.correct_var.set(is_correct)
+
+    def grid(self, row: int):
+        self.entry.grid(row=row, column=0, padx=10, pady=2, sticky='W')
+        self.correct_checkbox.grid(row=row, column=1, padx=10, pady=2, sticky='W')
+        self.delete_button.grid(row=row, column=2, padx=10, pady=2, sticky='W')
+
+    def grid_remove(self):
+        self.entry.grid_remove()
+        self.correct_checkbox.grid_remove()
+        self.delete_button.grid_remove()
+
+
+class QuizCell(ctk.CTkFrame, Cell):
+    recyclable = True
+
+    def __init__(self, parent, record: QuizRecord):
+        super().__init__(parent)
+        self.bind("<Button-1>", self.on_click)
+        self.configure()
+        self.record: QuizRecord = record
+        self.view_frame = None
+        self.edit_frame = None
+        self.answer_vars = []
+        self.answer_checkboxes = []  # view mode, checkboxes past len(record.answers) are hidden
+        self.answer_rows = []  # edit mode, rows of the answers being edited
+        self.spare_rows = []  # edit mode, hidden rows
+        self._render_()  # rendering data
+        self._open_()  # showing data
+
+    @classmethod
+    def new_record(cls, viewer) -> QuizRecord:
+        return QuizRecord("Question", ["A", "B", "C", "D"], [])
+
+    def on_click(self, event=None):
+        self.master.select_frame(self, extend=extends_selection(event))
+
+    def _render_(self):
+        record = self.record
+
+        if self.view_frame is None:
+            self.view_frame = ctk.CTkFrame(self, corner_radius=8, width=500, height=300)
+            self.view_frame.columnconfigure(0, weight=1)
+            self.view_frame.bind("<Button-1>", self.on_click)
+            self.view_frame.bind("<Double-Button-1>", self._edit_)
+
+            self.question_label = ctk.CTkLabel(self.view_frame, font=('Arial', 20))
+            self.question_label.bind("<Button-1>", self.on_click)
+            self.question_label.grid(row=0, column=0, sticky='W', padx=10, pady=5)
+
+            self.check_button = ctk.CTkButton(self.view_frame, text="Check Answer", command=self.check_answer)
+            self.result_label = ctk.CTkLabel(self.view_frame, text="", font=('Arial', 20))
+
+        # Display the question text
+        self.question_label.configure(text=record.text)
+
+        # Display the answers with checkboxes, existing ones are reused
+        answers = record.answers
+        for idx, answer in enumerate(answers):
+            if idx == len(self.answer_checkboxes):
+                answer_var = ctk.IntVar(value=0)
+                self.answer_vars.append(answer_var)
+                self.answer_checkboxes.append(ctk.CTkCheckBox(self.view_frame, variable=answer_var, font=('Arial', 20)))
+            self.answer_vars[idx].set(0)
+            self.answer_checkboxes[idx].configure(text=answer)
+            self.answer_checkboxes[idx].grid(row=idx + 1, column=0, padx=20, pady=2, sticky='W')
+        for answer_checkbox in self.answer_checkboxes[len(answers):]:
+            answer_checkbox.grid_remove()
+
+        # button to check answers and the result of the last check
+        self.check_button.grid(row=len(answers) + 1, column=0, pady=10)
+        self.result_label.grid_remove()
+
+    def _open_(self):
+        if self.edit_frame:
+            self.edit_frame.pack_forget()
+        self.view_frame.pack(fill='both', expand=True, pady=2, padx=2)
+
+    def _save_(self):
+        # Save edited data
+        new_question_text = self.question_entry.get()
+        new_answers = []
+        new_correct_answers = []
+
+        for row in self.answer_rows:
+            answer = row.entry.get()
+            if answer:
+                new_answers.append(answer)
+                if row.correct_var.get():
+                    new_correct_answers.append(answer)
+
+        self.master.document.update(self.record, text=new_question_text, answers=new_answers,
+                                    correct_answers=new_correct_answers)
+
+        self._render_()
+        self._open_()
+
+    def _edit_(self, event=None):
+        if self.edit_frame is None:
+            self.edit_frame = ctk.CTkScrollableFrame(self, corner_radius=8, border_width=2, width=500,
+                                                     height=300)  # Adjust size as needed
+            self.question_entry = ctk.CTkEntry(self.edit_frame, width=400)
+            self.question_entry.grid(row=0, column=0, columnspan=3, padx=10, pady=5)
+            self.save_button = ctk.CTkButton(self.edit_frame, text="Save", command=self._save_)
+            self.add_answer_button = ctk.CTkButton(self.edit_frame, text="Add Answer", command=self._add_new_answer)
+
+        # Display editable question
+        self.question_entry.delete(0, 'end')
+        self.question_entry.insert(0, self.record.text)
+
+        # Display editable answers
+        for row in self.answer_rows:
+            row.grid_remove()
+        self.spare_rows.extend(reversed(self.answer_rows))
+        self.answer_rows = []
+        correct_answers = self.record.correct_answers
+        for answer in self.record.answers:
+            self._add_answer_row(answer, answer in correct_answers)
+        self._place_buttons()
+
+        self.view_frame.pack_forget()
+        self.edit_frame.pack(expand=True, fill='both')
+
+    def _add_answer_row(self, answer_text='', is_correct=False):
+        row = self.spare_rows.pop() if self.spare_rows else AnswerRow(self, self.edit_frame)
+        row.set(answer_text, is_correct)
+        row.grid(len(self.answer_rows) + 1)
+        self.answer_rows.append(row)
+
+    def _delete_answer_row(self, row: AnswerRow):
+        idx = self.answer_rows.index(row)
+        row.grid_remove()
+        self.answer_rows.pop(idx)
+        self.spare_rows.append(row)
+
+        # Adjust remaining rows
+        for i in range(idx, len(self.answer_rows)):
+            self.answer_rows[i].grid(i + 1)
+
+        self._place_buttons()
+
+    def _add_new_answer(self):
+        self._add_answer_row()
+        self._place_buttons()
+
+    def _place_buttons(self):
+        # save and add answer buttons go below the last answer
+        self.save_button.grid(row=len(self.answer_rows) + 1, column=0, pady=10)
+        self.add_answer_button.grid(row=len(self.answer_rows) + 2, column=0, pady=10)
+
+    def recycle(self):
+        super().recycle()
+        if self.edit_frame:
+            self.edit_frame.pack_forget()
+
+    def check_answer(self):
+        from grading import AnswerKey
+
+        # Grade the selected answers, the same way whole exam runs are graded
+        key = AnswerKey([self.record])
+        selected = [idx for idx, var in enumerate(self.answer_vars[:len(self.record.answers)]) if var.get()]
+        report = key.grade(key.encode([[selected]]))
+        score = report.scores[0, 0]
+
+        if report.exact[0, 0]:
+            result_text = "Correct!!!"
+            result_color = "#00FF00"
+        elif score > 0:
+            result_text = f"Partially correct ({score:.0%})"
+            result_color = "#FFA500"
+        else:
+            result_text = "Incorrect!"
+            result_color = "#FF0000"
+
+        # Display result, the same label is reused by every check
+        self.result_label.configure(text=result_text, text_color=result_color)
+        self.result_label.grid(row=len(self.record.answers) + 2, column=0, pady=10)
@@ -0,0 +1,35 @@
+import customtkinter as ctk
+
+from cells.base import Cell, extends_selection
+from document import UnknownRecord
+
+
+class UnknownCell(ctk.CTkFrame, Cell):
+    """
+    placeholder for cells of a type this version doesn't know, the cell is saved back unchanged
+    """
+
+    def __init__(self, parent, record: UnknownRecord):
+        super().__init__(parent)
+        self.record: UnknownRecord = record
+        self.view_frame = None
+        self.edit_frame = None
+        self._render_()
+        self._open_()
+
+    def on_click(self, event=None):
+        self.master.select_frame(self, extend=extends_selection(event))
+
+    def _render_(self):
+        self.view_frame = ctk.CTkLabel(self, text=f"unsupported cell type {self.record.cell_type!r}",
+                                       font=('Arial', 16), text_color='gray')
+        self.view_frame.bind('<Button-1>', self.on_click)
+
+    def _open_(self):
+        self.view_frame.pack(fill='both', expand=True, padx=10, pady=10)
+
+    def _edit_(self, event=None):
+        pass
+
+    def _save_(self):
+        pass
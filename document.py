@@ -0,0 +1,413 @@
+import json
+import os
+from typing import Callable, Dict, Iterator, List, NamedTuple
+
+from sequence import IndexedSequence, SequenceNode
+
+
+class CellRecord:
+    """
+    Base class for headless cell records
+
+    records hold only the data saved into file, widgets (see main.py) are thin views over them
+    """
+    __slots__ = ()
+    cell_type: str = None
+    fields: tuple = ()  # attributes saved as "data"
+    required: tuple = ()  # keys which must be present in "data"
+
+    def to_data(self):
+        """
+        :return: "data" part of the cell as saved in file
+        """
+        return {field: getattr(self, field) for field in self.fields}
+
+    @classmethod
+    def from_data(cls, data) -> 'CellRecord':
+        """
+        creates record from "data" part of the cell, raises ValueError if data is malformed
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f'{cls.cell_type!r} cell data must be an object')
+        missing = [field for field in cls.required if field not in data]
+        if missing:
+            raise ValueError(f'{cls.cell_type!r} cell data is missing {", ".join(missing)}')
+        return cls(**{field: data[field] for field in cls.fields if field in data})
+
+    def _import_(self) -> dict:
+        return {"cell_type": self.cell_type, "data": self.to_data()}
+
+    def validate(self) -> List[str]:
+        """
+        checks values of the fields beyond what from_data needs to create the record
+
+        :return: descriptions of the problems, empty if the record is valid
+        """
+        return []
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{f}={getattr(self, f)!r}" for f in self.fields)})'
+
+
+class PlainTextRecord(CellRecord):
+    """
+    data: {"text": <some text>}
+    """
+    __slots__ = ('text',)
+    cell_type = 'plain text'
+    fields = ('text',)
+    required = ('text',)
+
+    def __init__(self, text: str = ''):
+        self.text: str = text
+
+    def validate(self) -> List[str]:
+        return [] if isinstance(self.text, str) else ['text must be a string']
+
+
+class QuizRecord(CellRecord):
+    """
+    data: {"text": <some text>, "answers": [<answer1>, ...], "correct_answers": [<correct1>, ...]}
+    """
+    __slots__ = ('text', 'answers', 'correct_answers')
+    cell_type = 'quiz'
+    fields = ('text', 'answers', 'correct_answers')
+    required = ('text',)
+
+    def __init__(self, text: str = 'Question', answers: List[str] = None, correct_answers: List[str] = None):
+        self.text: str = text
+        self.answers: List[str] = list(answers) if answers is not None else []
+        self.correct_answers: List[str] = list(correct_answers) if correct_answers is not None else []
+
+    def validate(self) -> List[str]:
+        problems = [] if isinstance(self.text, str) else ['text must be a string']
+        for field in ('answers', 'correct_answers'):
+            if not all(isinstance(answer, str) for answer in getattr(self, field)):
+                problems.append(f'{field} must be a list of strings')
+        unknown = [answer for answer in self.correct_answers if answer not in self.answers]
+        if unknown:
+            problems.append(f'correct answers {unknown} are not among the answers')
+        return problems
+
+
+class Flashcard:
+    """
+    single card of FlashcardsRecord
+    """
+    __slots__ = ('front', 'back', 'color')
+
+    def __init__(self, front: str, back: str, color: str):
+        self.front: str = front
+        self.back: str = back
+        self.color: str = color
+
+    def to_data(self) -> dict:
+        return {"front": self.front, "back": self.back, "color": self.color}
+
+
+class FlashcardsRecord(CellRecord):
+    """
+    data: [{"front": <front side text>, "back": <back side text>, "color": <color>}, ...]
+    """
+    __slots__ = ('cards',)
+    cell_type = 'flash cards'
+    fields = ('cards',)
+
+    def __init__(self, cards: List[Flashcard] = None):
+        self.cards: List[Flashcard] = cards if cards is not None else []
+
+    def to_data(self) -> list:
+        return [card.to_data() for card in self.cards]
+
+    def validate(self) -> List[str]:
+        return [f'card {i} {side} must be a string' for i, card in enumerate(self.cards)
+                for side in Flashcard.__slots__ if not isinstance(getattr(card, side), str)]
+
+    @classmethod
+    def from_data(cls, data) -> 'FlashcardsRecord':
+        if not isinstance(data, list):
+            raise ValueError(f'{cls.cell_type!r} cell data must be a list of cards')
+        cards = []
+        for i, card in enumerate(data):
+            if not isinstance(card, dict) or not {"front", "back", "color"} <= card.keys():
+                raise ValueError(f'card {i} must have front, back and color')
+            cards.append(Flashcard(card["front"], card["back"], card["color"]))
+        return cls(cards)
+
+
+class ImageRecord(CellRecord):
+    """
+    data: {"path": <path to the image>, "media": <sha256 of the image embedded in packed book, optional>}
+    """
+    __slots__ = ('path', 'media')
+    cell_type = 'image'
+    fields = ('path', 'media')
+    required = ('path',)
+
+    def __init__(self, path: str, media: str = None):
+        self.path: str = path
+        self.media: str = media
+
+    def validate(self) -> List[str]:
+        return [] if isinstance(self.path, str) and self.path else ['path must be a non empty string']
+
+    def to_data(self) -> dict:
+        data = {"path": self.path}
+        if self.media:
+            data["media"] = self.media
+        return data
+
+
+class UnknownRecord(CellRecord):
+    """
+    cell of a type no record class is registered for, its data is kept untouched so saving
+    the book doesn't lose it
+    """
+    __slots__ = ('cell_type', 'data')
+    fields = ('data',)
+
+    def __init__(self, cell_type: str, data):
+        self.cell_type: str = cell_type
+        self.data = data
+
+    def to_data(self):
+        return self.data
+
+
+# cell type saved in file -> record class, cell types registered in cells/__init__.py are added here
+CELL_RECORDS = {record.cell_type: record for record in (PlainTextRecord, QuizRecord, FlashcardsRecord, ImageRecord)}
+
+
+def record_from_dict(cell: dict, keep_unknown: bool = False) -> CellRecord:
+    """
+    :param cell: cell as saved in file {"cell_type": <type>, "data": <data>}
+    :param keep_unknown: return UnknownRecord for unknown types instead of raising
+    :return: record, raises ValueError for malformed cells and unknown types
+    """
+    if not isinstance(cell, dict) or 'cell_type' not in cell or 'data' not in cell:
+        raise ValueError('cell must be an object with cell_type and data')
+    record_class = CELL_RECORDS.get(cell['cell_type'])
+    if record_class is None:
+        if keep_unknown:
+            return UnknownRecord(cell['cell_type'], cell['data'])
+        raise ValueError(f'unknown cell type {cell["cell_type"]!r}')
+    return record_class.from_data(cell['data'])
+
+
+def validate_file_data(file_data, keep_unknown: bool = False) -> List[str]:
+    """
+    checks every cell of the book, unlike from_file_data doesn't stop at the first malformed cell
+
+    :param file_data: content of .ibf file (list of cells)
+    :param keep_unknown: don't report cells of unknown type
+    :return: problems as 'cell <position> (<cell type>): <problem>', empty if the book is valid
+    """
+    if not isinstance(file_data, list):
+        return ['.ibf file must contain a list of cells']
+    problems = []
+    for i, cell in enumerate(file_data):
+        cell_type = cell.get('cell_type') if isinstance(cell, dict) else None
+        try:
+            record = record_from_dict(cell, keep_unknown)
+        except (ValueError, TypeError) as e:  # TypeError: e.g. answers which aren't a list
+            problems.append(f'cell {i} ({cell_type}): {e}')
+            continue
+        problems.extend(f'cell {i} ({cell_type}): {problem}' for problem in record.validate())
+    return problems
+
+
+class Change(NamedTuple):
+    """
+    notification sent to document observers
+
+    kind is one of 'load', 'insert', 'delete', 'move', 'update'
+    """
+    kind: str
+    index: int = None  # first affected position (new position for 'move')
+    count: int = 1  # number of inserted/deleted/moved cells
+    old_index: int = None  # previous position for 'move'
+    record: CellRecord = None  # updated record for 'update'
+    records: List[CellRecord] = None  # removed records for 'delete'
+
+
+class RecordNode(SequenceNode):
+    """
+    position of a record in Document
+    """
+    __slots__ = ('record',)
+
+    def __init__(self, record: CellRecord):
+        super().__init__()
+        self.record = record
+
+
+class Document:
+    """
+    ordered list of cell records with load/save and structural edits
+
+    records are kept in IndexedSequence, so indexing, index(), inserts, deletes and block moves take
+    O(log n) (plus the size of the change) in books of any length. cells is a copy of the whole list,
+    for readers of the whole book (e.g. saving)
+
+    observers (e.g. Viewer) are notified about every change with a Change tuple
+    """
+
+    def __init__(self, cells: List[CellRecord] = None):
+        self._nodes: Dict[int, RecordNode] = {}  # id(record) -> node
+        self._sequence = IndexedSequence(self._add_nodes(cells or ()))
+        self.observers: List[Callable[[Change], None]] = []
+        self.pack = None  # ibf_pack.PackedBook the document was loaded from, if any
+
+    def subscribe(self, observer: Callable[[Change], None]):
+        self.observers.append(observer)
+
+    def unsubscribe(self, observer: Callable[[Change], None]):
+        self.observers.remove(observer)
+
+    def _notify(self, change: Change):
+        for observer in self.observers:
+            observer(change)
+
+    def _add_nodes(self, records: List[CellRecord]) -> List[RecordNode]:
+        nodes = [RecordNode(record) for record in records]
+        self._nodes.update((id(node.record), node) for node in nodes)
+        return nodes
+
+    @property
+    def cells(self) -> List[CellRecord]:
+        return list(self)
+
+    def __len__(self) -> int:
+        return len(self._sequence)
+
+    def __iter__(self) -> Iterator[CellRecord]:
+        return (node.record for node in self._sequence)
+
+    def __getitem__(self, index):
+        """
+        record at index, or list of records for slices (without step)
+        """
+        if isinstance(index, slice):
+            return [node.record for node in self._sequence[index]]
+        return self._sequence[index].record
+
+    def index(self, record: CellRecord) -> int:
+        """
+        raises ValueError if the record isn't in the document
+        """
+        node = self._nodes.get(id(record))
+        if node is None or node.record is not record:
+            raise ValueError('record is not in the document')
+        return self._sequence.index(node)
+
+    def image_path(self, record: ImageRecord) -> str:
+        """
+        path the image can be opened from, images embedded in packed books are extracted on demand
+        """
+        if self.pack is not None:
+            return self.pack.image_path(record)
+        return record.path
+
+    # loading and saving
+
+    @classmethod
+    def from_file_data(cls, file_data: list, skip_unknown: bool = False, keep_unknown: bool = False) -> 'Document':
+        """
+        :param skip_unknown: silently drop cells of unknown type instead of raising ValueError
+        :param keep_unknown: keep cells of unknown type as UnknownRecords instead of raising ValueError
+        """
+        if not isinstance(file_data, list):
+            raise ValueError('.ibf file must contain a list of cells')
+        cells = []
+        for cell in file_data:
+            if skip_unknown and isinstance(cell, dict) and cell.get('cell_type') not in CELL_RECORDS:
+                continue
+            cells.append(record_from_dict(cell, keep_unknown))
+        return cls(cells)
+
+    @classmethod
+    def load(cls, filename: str, skip_unknown: bool = False, keep_unknown: bool = False) -> 'Document':
+        with open(filename, 'r') as file:
+            return cls.from_file_data(json.load(file), skip_unknown, keep_unknown)
+
+    def to_file_data(self) -> list:
+        return [record._import_() for record in self]
+
+    def save(self, filename: str, indent: int = 4):
+        self.write_file_data(filename, self.to_file_data(), indent)
+
+    @staticmethod
+    def file_text(file_data: list, indent: int = 4) -> str:
+        """
+        :param indent: None gives the most compact json
+        """
+        return json.dumps(file_data, indent=indent, separators=(',', ':') if indent is None else None)
+
+    @staticmethod
+    def write_file_data(filename: str, file_data: list, indent: int = 4):
+        """
+        writes cells into a temporary file first, so a crash never leaves a half written book
+        """
+        tmp_filename = f'{filename}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_filename, 'w') as file:
+                file.write(Document.file_text(file_data, indent))
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_filename, filename)
+        except BaseException:
+            # the old book stays as it was, no half written temporary file is left next to it
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+            raise
+
+    def replace(self, cells: List[CellRecord]):
+        """
+        replaces all cells (e.g. when another file is opened)
+        """
+        self._nodes.clear()
+        self._sequence = IndexedSequence(self._add_nodes(cells))
+        self._notify(Change('load', 0, len(self)))
+
+    # structural edits
+
+    def insert(self, index: int, record: CellRecord):
+        self.insert_many(index, [record])
+
+    def insert_many(self, index: int, records: List[CellRecord]):
+        if not records:
+            return
+        index = max(0, min(index, len(self)))
+        self._sequence.insert(index, self._add_nodes(records))
+        self._notify(Change('insert', index, len(records)))
+
+    def append(self, record: CellRecord):
+        self.insert_many(len(self), [record])
+
+    def delete(self, index: int, count: int = 1) -> List[CellRecord]:
+        removed = [node.record for node in self._sequence.delete(index, count)]
+        for record in removed:
+            del self._nodes[id(record)]
+        self._notify(Change('delete', index, len(removed), records=removed))
+        return removed
+
+    def move(self, old_index: int, new_index: int, count: int = 1):
+        """
+        moves count cells from old_index so the first of them ends up at new_index
+        """
+        count = min(count, len(self) - old_index)
+        new_index = max(0, min(new_index, len(self) - count))
+        if old_index == new_index or count < 1:
+            return
+        self._sequence.move(old_index, new_index, count)
+        self._notify(Change('move', new_index, count, old_index=old_index))
+
+    def update(self, record: CellRecord, **fields):
+        """
+        changes fields of a record, e.g. document.update(record, text="new text")
+        """
+        for field, value in fields.items():
+            setattr(record, field, value)
+        self._notify(Change('update', record=record))
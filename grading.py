@@ -0,0 +1,186 @@
+"""
+grading of quiz answers
+
+answers of every quiz are encoded as bitmasks (bit k is answer k, 64 answers per word), so grading
+a whole batch of submissions over all quizzes of a book is a few vectorized operations on arrays of
+shape (submissions, quizzes, words):
+
+    key = AnswerKey.from_document(document)
+    report = key.grade(key.encode([[[0, 2], [1]], [[0], []]]))  # two submissions of a two quiz book
+    report.totals                 # points of every submission
+    report.question_stats()       # difficulty and discrimination of every quiz
+
+submissions of an exam run can be graded from the command line:
+
+    python grading.py course.ibf submissions.json
+
+where submissions.json holds [{"id": <id>, "answers": [[<answer index>, ...] for every quiz]}, ...]
+"""
+import json
+import sys
+from typing import Iterable, List, NamedTuple, Sequence
+
+import numpy as np
+
+from document import Document, QuizRecord
+
+WORD_BITS = 64
+SCHEMES = ('partial', 'all_or_nothing')
+
+
+class QuestionStats(NamedTuple):
+    mean_score: np.ndarray  # (quizzes,) average score, 1 is the easiest
+    exact_rate: np.ndarray  # (quizzes,) share of submissions with exactly the correct answers
+    pick_rates: List[np.ndarray]  # share of submissions which picked each answer, for every quiz
+    discrimination: np.ndarray  # (quizzes,) correlation of the quiz score with the rest of the test, nan if constant
+
+
+class GradeReport(NamedTuple):
+    selections: np.ndarray  # (submissions, quizzes, words) bitmasks of the picked answers
+    scores: np.ndarray  # (submissions, quizzes) points for every quiz, between 0 and 1
+    exact: np.ndarray  # (submissions, quizzes) True where the picked answers are exactly the correct ones
+    answer_counts: np.ndarray  # (quizzes,) number of answers of every quiz
+
+    @property
+    def totals(self) -> np.ndarray:
+        return self.scores.sum(axis=1)
+
+    def question_stats(self) -> QuestionStats:
+        scores = self.scores
+        # correlation of every quiz with the total of the other quizzes
+        rest = self.totals[:, None] - scores
+        scores_centered = scores - scores.mean(axis=0)
+        rest_centered = rest - rest.mean(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            discrimination = (scores_centered * rest_centered).sum(axis=0) / np.sqrt(
+                (scores_centered ** 2).sum(axis=0) * (rest_centered ** 2).sum(axis=0))
+
+        answer_counts = self.answer_counts
+        picks = np.zeros((scores.shape[1], self.selections.shape[2] * WORD_BITS))
+        for bit in range(int(answer_counts.max(initial=0))):
+            word, shift = divmod(bit, WORD_BITS)
+            picks[:, bit] = ((self.selections[:, :, word] >> np.uint64(shift)) & np.uint64(1)).mean(axis=0)
+        return QuestionStats(scores.mean(axis=0), self.exact.mean(axis=0),
+                             [picks[i, :count] for i, count in enumerate(answer_counts)], discrimination)
+
+
+class AnswerKey:
+    """
+    correct answers of a list of quizzes as bitmasks
+    """
+
+    def __init__(self, quizzes: Sequence[QuizRecord]):
+        self.quizzes = list(quizzes)
+        self.answer_counts = np.array([len(quiz.answers) for quiz in self.quizzes], dtype=np.int64)
+        self.words = max(1, -(-int(self.answer_counts.max(initial=0)) // WORD_BITS))
+        self.correct = np.zeros((len(self.quizzes), self.words), dtype=np.uint64)
+        self.valid = np.zeros((len(self.quizzes), self.words), dtype=np.uint64)  # bits of existing answers
+        for i, quiz in enumerate(self.quizzes):
+            correct = set(quiz.correct_answers)
+            self.correct[i] = self._mask(k for k, answer in enumerate(quiz.answers) if answer in correct)
+            self.valid[i] = self._mask(range(len(quiz.answers)))
+        self.correct_counts = np.bitwise_count(self.correct).sum(axis=1).astype(np.int64)
+
+    @classmethod
+    def from_document(cls, document: Document) -> 'AnswerKey':
+        return cls([record for record in document if record.cell_type == 'quiz'])
+
+    def __len__(self) -> int:
+        return len(self.quizzes)
+
+    def _mask(self, answers: Iterable[int]) -> np.ndarray:
+        mask = np.zeros(self.words, dtype=np.uint64)
+        for answer in answers:
+            mask[answer // WORD_BITS] |= np.uint64(1) << np.uint64(answer % WORD_BITS)
+        return mask
+
+    def answer_index(self, quiz: int, answer) -> int:
+        """
+        :param answer: index of the answer or its text
+        """
+        if isinstance(answer, str):
+            return self.quizzes[quiz].answers.index(answer)
+        if not 0 <= answer < self.answer_counts[quiz]:
+            raise ValueError(f'quiz {quiz} has no answer {answer}')
+        return answer
+
+    def encode(self, submissions: Iterable[Sequence[Iterable]]) -> np.ndarray:
+        """
+        :param submissions: for every submission, picked answers (indexes or texts) of every quiz,
+            submissions may leave out trailing quizzes
+        :return: (submissions, quizzes, words) bitmasks of the picked answers
+        """
+        rows, quizzes, answers = [], [], []
+        count = 0
+        for row, submission in enumerate(submissions):
+            count += 1
+            if len(submission) > len(self.quizzes):
+                raise ValueError(f'submission {row} answers {len(submission)} quizzes, there are {len(self.quizzes)}')
+            for quiz, picked in enumerate(submission):
+                picked = [self.answer_index(quiz, answer) if isinstance(answer, str) else answer for answer in picked]
+                rows.extend([row] * len(picked))
+                quizzes.extend([quiz] * len(picked))
+                answers.extend(picked)
+        return self.encode_picks(count, np.array(rows, dtype=np.int64), np.array(quizzes, dtype=np.int64),
+                                 np.array(answers, dtype=np.int64))
+
+    def encode_picks(self, count: int, rows: np.ndarray, quizzes: np.ndarray, answers: np.ndarray) -> np.ndarray:
+        """
+        encodes picks given as parallel arrays (e.g. read from a table of answers), duplicates are ignored
+
+        :param count: number of submissions
+        """
+        invalid = np.flatnonzero((answers < 0) | (answers >= self.answer_counts[quizzes]))
+        if len(invalid):
+            raise ValueError(f'quiz {quizzes[invalid[0]]} has no answer {answers[invalid[0]]}')
+        selections = np.zeros((count, len(self.quizzes), self.words), dtype=np.uint64)
+        bits = np.left_shift(np.uint64(1), (answers % WORD_BITS).astype(np.uint64))
+        np.bitwise_or.at(selections, (rows, quizzes, answers // WORD_BITS), bits)
+        return selections
+
+    def grade(self, selections: np.ndarray, scheme: str = 'partial') -> GradeReport:
+        """
+        :param selections: (submissions, quizzes, words) bitmasks from encode
+        :param scheme: 'partial' gives (right picks - wrong picks) / correct answers (at least 0) for
+            every quiz, 'all_or_nothing' gives 1 only for exactly the correct answers. Quizzes without
+            correct answers give 1 for picking nothing
+        """
+        if scheme not in SCHEMES:
+            raise ValueError(f'scheme must be one of {", ".join(SCHEMES)}')
+        selections = selections & self.valid
+        right = np.bitwise_count(selections & self.correct).sum(axis=2, dtype=np.int64)
+        wrong = np.bitwise_count(selections & ~self.correct).sum(axis=2, dtype=np.int64)
+        exact = (right == self.correct_counts) & (wrong == 0)
+        if scheme == 'all_or_nothing':
+            scores = exact.astype(np.float64)
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                scores = np.clip((right - wrong) / self.correct_counts, 0, 1)
+            scores = np.where(self.correct_counts == 0, (wrong == 0).astype(np.float64), scores)
+        return GradeReport(selections, scores, exact, self.answer_counts)
+
+
+def format_stats(key: AnswerKey, report: GradeReport) -> str:
+    stats = report.question_stats()
+    lines = ['quiz  mean  exact  discrimination  question']
+    for i, quiz in enumerate(key.quizzes):
+        question = quiz.text.strip().splitlines()[0][:60] if quiz.text.strip() else ''
+        lines.append(f'{i:4}  {stats.mean_score[i]:.2f}  {stats.exact_rate[i]:5.2f}  {stats.discrimination[i]:14.2f}  '
+                     f'{question}')
+        lines.extend(f'{"":6}{rate:5.2f}  {answer}' for answer, rate in zip(quiz.answers, stats.pick_rates[i]))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    from journal import load_book
+
+    if len(sys.argv) != 3:
+        sys.exit(f'usage: {sys.argv[0]} <book> <submissions.json>')
+    key = AnswerKey.from_document(load_book(sys.argv[1]))
+    with open(sys.argv[2]) as file:
+        submissions = json.load(file)
+    report = key.grade(key.encode(submission['answers'] for submission in submissions))
+    print(format_stats(key, report))
+    totals = report.totals
+    for submission, total in zip(submissions, totals):
+        print(f'{submission.get("id", "")}: {total:.2f} / {len(key)}')
@@ -0,0 +1,336 @@
+"""
+export of books into static html sites
+
+    python html_export.py course.ibf site/
+
+writes site/index.html with every cell of the book, quizzes can be checked and flashcards flipped
+in the browser (site/book.js), images are resized into variants of VARIANT_WIDTHS and served with
+srcset, so browsers download only the size they need.
+
+rendering of cells runs in a process pool. Html of every cell is cached in site/.cache by the hash
+of the cell (and of the image file identity for image cells), so exporting the book again after an
+edit renders only the changed cells, image variants already in the site aren't encoded again.
+Cache entries and images no longer used by the book are removed after the export, files the export
+didn't write (e.g. the book's own images when exporting into the book's directory) are left alone.
+"""
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple
+
+from document import Document, ImageRecord, record_from_dict
+from ibf_pack import resolve_path
+from journal import load_book
+
+RENDER_VERSION = 1  # part of every cache key, bump it when the html of cells changes
+VARIANT_WIDTHS = (320, 640, 1280)
+IMAGE_SIZES = '(max-width: 840px) 100vw, 800px'  # width the image takes on the page, see STYLE
+CACHE_DIR = '.cache'
+IMAGES_DIR = 'images'
+COLOR_PATTERN = re.compile(r'#[0-9a-fA-F]{3,8}|[a-zA-Z]+')
+# names of the files the export writes, other files in the site (e.g. images of the book itself) are never removed
+EXPORTED_FILES = {CACHE_DIR: re.compile(r'[0-9a-f]{64}\.json'),
+                  IMAGES_DIR: re.compile(r'[0-9a-f]{20}-[0-9]+\.(png|jpg)')}
+
+STYLE = '''body { max-width: 800px; margin: 0 auto; padding: 20px; font-family: Arial, sans-serif; background: #2b2b2b;
+       color: #dce4ee; }
+.cell { margin: 10px 0; padding: 10px; border-radius: 15px; background: #333333; }
+.text { white-space: pre-wrap; font-size: 18px; margin: 0; }
+.quiz label { display: block; margin: 6px 0; }
+.quiz .result.correct { color: #00ff00; }
+.quiz .result.incorrect { color: #ff0000; }
+.deck { display: flex; flex-wrap: wrap; gap: 10px; }
+.card { width: 175px; min-height: 300px; border: none; border-radius: 15px; font-size: 20px; color: inherit;
+        background: var(--card-color, #1f6aa5); cursor: pointer; }
+.card .back, .card.flipped .front { display: none; }
+.card.flipped .back { display: inline; }
+.image img { max-width: 100%; height: auto; }
+.missing { color: #ff0000; }
+'''
+
+SCRIPT = '''document.addEventListener('submit', function (event) {
+    var quiz = event.target.closest('.quiz');
+    if (!quiz) return;
+    event.preventDefault();
+    var correct = JSON.parse(quiz.dataset.correct);
+    var selected = Array.prototype.filter.call(quiz.querySelectorAll('input'), function (input) {
+        return input.checked;
+    }).map(function (input) { return Number(input.value); });
+    var right = selected.length === correct.length && selected.every(function (i) { return correct.indexOf(i) >= 0; });
+    var result = quiz.querySelector('.result');
+    result.textContent = right ? 'Correct!!!' : 'Incorrect!';
+    result.className = 'result ' + (right ? 'correct' : 'incorrect');
+    result.hidden = false;
+});
+document.addEventListener('click', function (event) {
+    var card = event.target.closest('.card');
+    if (!card) return;
+    card.classList.toggle('flipped');
+    card.setAttribute('aria-pressed', card.classList.contains('flipped'));
+});
+'''
+
+PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title}</title>
+<link rel="stylesheet" href="book.css">
+<script src="book.js" defer></script>
+</head>
+<body>
+{cells}
+</body>
+</html>
+'''
+
+
+class RenderJob(NamedTuple):
+    key: str  # cache key of the cell
+    cell: dict  # cell as saved in file
+    image_path: str = None  # resolved path of the image of image cells
+    output_dir: str = None
+
+
+class Rendered(NamedTuple):
+    html: str
+    files: List[str]  # files of the site (relative to its directory) the html refers to
+    problems: List[str]
+
+
+# rendering of cells (runs in the workers)
+
+def render_text(record, job: RenderJob) -> Rendered:
+    return Rendered(f'<p class="text">{html.escape(record.text)}</p>', [], [])
+
+
+def render_quiz(record, job: RenderJob) -> Rendered:
+    correct = [i for i, answer in enumerate(record.answers) if answer in record.correct_answers]
+    answers = ''.join(f'<label><input type="checkbox" value="{i}"> {html.escape(answer)}</label>'
+                      for i, answer in enumerate(record.answers))
+    return Rendered(f'<form class="quiz" data-correct="{json.dumps(correct)}">'
+                    f'<p class="text">{html.escape(record.text)}</p>{answers}'
+                    f'<button type="submit">Check answer</button><p class="result" hidden></p></form>', [], [])
+
+
+def render_flashcards(record, job: RenderJob) -> Rendered:
+    cards = []
+    for card in record.cards:
+        style = f' style="--card-color: {card.color}"' if COLOR_PATTERN.fullmatch(card.color) else ''
+        cards.append(f'<button type="button" class="card" aria-pressed="false"{style}>'
+                     f'<span class="front">{html.escape(card.front)}</span>'
+                     f'<span class="back">{html.escape(card.back)}</span></button>')
+    return Rendered(f'<div class="deck">{"".join(cards)}</div>', [], [])
+
+
+def image_variants(path: str, output_dir: str) -> tuple:
+    """
+    writes resized variants of the image into output_dir/images, variants already there are reused
+
+    :return: ([(file relative to output_dir, width)], (width, height) of the original)
+    """
+    from PIL import Image
+    from image_cache import load_scaled
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    name = digest.hexdigest()[:20]
+
+    with Image.open(path) as image:
+        size = image.size
+        alpha = image.mode in ('RGBA', 'LA', 'P')
+    ext = '.png' if alpha else '.jpg'
+    widths = sorted({width for width in VARIANT_WIDTHS if width < size[0]} | {min(size[0], VARIANT_WIDTHS[-1])})
+    variants = []
+    for width in widths:
+        filename = f'{IMAGES_DIR}/{name}-{width}{ext}'
+        target = os.path.join(output_dir, filename)
+        if not os.path.exists(target):
+            image = load_scaled(path, width)
+            if not alpha:
+                image = image.convert('RGB')
+            tmp_target = f'{target}.{os.getpid()}.tmp'
+            image.save(tmp_target, 'PNG' if alpha else 'JPEG', optimize=True, **({} if alpha else {'quality': 85}))
+            os.replace(tmp_target, target)
+        variants.append((filename, width))
+    return variants, size
+
+
+def render_image(record, job: RenderJob) -> Rendered:
+    alt = html.escape(os.path.basename(record.path))
+    if job.image_path is None or not os.path.isfile(job.image_path):
+        return Rendered(f'<p class="missing">missing image {html.escape(record.path)}</p>', [],
+                        [f'image {record.path} not found'])
+    try:
+        variants, (width, height) = image_variants(job.image_path, job.output_dir)
+    except OSError as e:
+        return Rendered(f'<p class="missing">broken image {html.escape(record.path)}</p>', [],
+                        [f'image {record.path} can\'t be decoded: {e}'])
+    largest, largest_width = variants[-1]
+    srcset = ', '.join(f'{filename} {variant_width}w' for filename, variant_width in variants)
+    height = max(1, round(height * largest_width / width))
+    return Rendered(f'<img src="{largest}" srcset="{srcset}" sizes="{IMAGE_SIZES}" width="{largest_width}" '
+                    f'height="{height}" alt="{alt}" loading="lazy">', [filename for filename, _ in variants], [])
+
+
+def render_unknown(record, job: RenderJob) -> Rendered:
+    return Rendered(f'<!-- {html.escape(str(record.cell_type))} cells are not supported -->', [], [])
+
+
+# cell type -> function rendering its record, cell types without renderer are left out of the page
+RENDERERS: Dict[str, Callable[[object, RenderJob], Rendered]] = {
+    'plain text': render_text,
+    'quiz': render_quiz,
+    'flash cards': render_flashcards,
+    'image': render_image,
+}
+
+
+def render_cell(job: RenderJob) -> Rendered:
+    """
+    renders the cell and saves the result into the cache of the site
+    """
+    record = record_from_dict(job.cell, keep_unknown=True)
+    rendered = RENDERERS.get(record.cell_type, render_unknown)(record, job)
+    if not rendered.problems:  # cells with problems are rendered again next time, the image may be fixed
+        path = cache_path(job.output_dir, job.key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(rendered._asdict(), file)
+        os.replace(tmp_path, path)
+    return rendered
+
+
+# exporting (runs in the main process)
+
+def cache_path(output_dir: str, key: str) -> str:
+    return os.path.join(output_dir, CACHE_DIR, key + '.json')
+
+
+def image_identity(path: str) -> list:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def cell_key(cell: dict, image_path: str = None) -> str:
+    key = json.dumps([RENDER_VERSION, cell, image_identity(image_path) if image_path else None], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def write_if_changed(path: str, text: str) -> bool:
+    """
+    files which didn't change keep their mtime, so web servers and browsers keep their caches
+    """
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as file:
+            if file.read() == text:
+                return False
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+    return True
+
+
+def book_title(document: Document, default: str) -> str:
+    for record in document:
+        if record.cell_type == 'plain text' and record.text.strip():
+            return record.text.strip().splitlines()[0][:120]
+    return default
+
+
+def export_document(document: Document, output_dir: str, base_dir: str = None, title: str = 'Book',
+                    processes: int = None, on_progress: Callable[[int, int], None] = None) -> dict:
+    """
+    :param base_dir: directory relative image paths are resolved against (directory of the book)
+    :param processes: size of the rendering process pool (default: number of CPUs)
+    :param on_progress: called with (done, total) after every rendered cell
+    :return: {"cells", "rendered", "cached", "removed", "problems": [...]}
+    """
+    os.makedirs(os.path.join(output_dir, CACHE_DIR), exist_ok=True)
+    os.makedirs(os.path.join(output_dir, IMAGES_DIR), exist_ok=True)
+
+    jobs = []
+    for record in document:
+        image_path = None
+        if isinstance(record, ImageRecord):
+            image_path = resolve_path(document.image_path(record), base_dir)
+        cell = record._import_()
+        jobs.append(RenderJob(cell_key(cell, image_path), cell, image_path, output_dir))
+
+    results: Dict[str, Rendered] = {}
+    for job in jobs:
+        if job.key not in results and os.path.exists(cache_path(output_dir, job.key)):
+            with open(cache_path(output_dir, job.key)) as file:
+                results[job.key] = Rendered(**json.load(file))
+    cached = len(results)
+
+    stale = list({job.key: job for job in jobs if job.key not in results}.values())
+    if len(stale) > 1 and processes != 1:
+        # spawned workers don't inherit the GUI (export may run from the editor)
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            chunksize = max(1, len(stale) // ((processes or os.cpu_count() or 1) * 8))
+            for done, (job, rendered) in enumerate(zip(stale, executor.map(render_cell, stale, chunksize=chunksize))):
+                results[job.key] = rendered
+                if on_progress:
+                    on_progress(done + 1, len(stale))
+    else:
+        for done, job in enumerate(stale):
+            results[job.key] = render_cell(job)
+            if on_progress:
+                on_progress(done + 1, len(stale))
+
+    problems = []
+    cells = []
+    for i, job in enumerate(jobs):
+        rendered = results[job.key]
+        problems.extend(f'cell {i} ({job.cell["cell_type"]}): {problem}' for problem in rendered.problems)
+        cells.append(f'<section class="cell {html.escape(str(job.cell["cell_type"])).replace(" ", "-")}" '
+                     f'id="cell-{i}">{rendered.html}</section>')
+    write_if_changed(os.path.join(output_dir, 'book.css'), STYLE)
+    write_if_changed(os.path.join(output_dir, 'book.js'), SCRIPT)
+    write_if_changed(os.path.join(output_dir, 'index.html'),
+                     PAGE.format(title=html.escape(title), cells='\n'.join(cells)))
+
+    # cache entries and images of cells which aren't in the book anymore, only files named like the export's own
+    used_entries = {job.key + '.json' for job in jobs}
+    used_images = {os.path.basename(filename) for rendered in results.values() for filename in rendered.files}
+    removed = 0
+    for directory, used in ((CACHE_DIR, used_entries), (IMAGES_DIR, used_images)):
+        for name in os.listdir(os.path.join(output_dir, directory)):
+            if name not in used and EXPORTED_FILES[directory].fullmatch(name):
+                os.remove(os.path.join(output_dir, directory, name))
+                removed += 1
+    return {"cells": len(jobs), "rendered": len(stale), "cached": cached, "removed": removed, "problems": problems}
+
+
+def export_book(filename: str, output_dir: str, processes: int = None) -> dict:
+    document = load_book(filename)
+    try:
+        title = book_title(document, os.path.splitext(os.path.basename(filename))[0])
+        return export_document(document, output_dir, os.path.dirname(os.path.abspath(filename)), title, processes)
+    finally:
+        if document.pack is not None:
+            document.pack.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit(f'usage: {sys.argv[0]} <book> <output directory>')
+    started = time.perf_counter()
+    result = export_book(sys.argv[1], sys.argv[2])
+    for problem in result.pop('problems'):
+        print(problem)
+    print(result, f'in {time.perf_counter() - started:.2f}s')
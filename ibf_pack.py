@@ -0,0 +1,231 @@
+"""
+packed interactive book format (.ibfp)
+
+single file holding the cells and every image they use, laid out as
+
+    header   MAGIC, index offset (u64), index length (u64)
+    blobs    json of every cell followed by image files, each image stored once by its sha256
+    index    json {"version": 1, "cells": [[offset, length], ...], "media": {<sha256>: [offset, length, <ext>]}}
+
+the file is read through mmap. Images are touched only when their cell is shown. Cells are parsed one
+by one through the index, so tools can read single cells, but the editor still turns every cell of
+the book into a record while loading: search, the outline and the height estimates of the viewer
+need all of them
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from typing import Iterator, List
+
+from document import CellRecord, Document, ImageRecord, record_from_dict
+
+MAGIC = b'IBFPACK1'
+HEADER = struct.Struct('<8sQQ')
+VERSION = 1
+MEDIA_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.ibf_media')  # per user, extracted images by sha256
+
+
+def is_packed(filename: str) -> bool:
+    try:
+        with open(filename, 'rb') as file:
+            return file.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def resolve_path(path: str, base_dir: str = None) -> str:
+    """
+    image paths are relative to the working directory, or to the book itself if not found there
+    """
+    if os.path.isabs(path) or os.path.exists(path) or not base_dir:
+        return path
+    return os.path.join(base_dir, path)
+
+
+class PackedBook:
+    """
+    read access to .ibfp file, cells and media are read on demand from a memory map
+
+        book = PackedBook('course.ibfp')
+        book.cell(1500)  # parses only one cell
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, index_offset, index_length = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f'{filename} is not a packed interactive book')
+            index = json.loads(self._map[index_offset:index_offset + index_length])
+        except Exception:
+            self.close()
+            raise
+        if index.get('version') != VERSION:
+            self.close()
+            raise ValueError(f'unsupported packed book version {index.get("version")}')
+        self.cell_index: List[List[int]] = index['cells']
+        self.media_index: dict = index['media']
+        self._extracted = set()  # digests whose media_file was written or verified by this book
+
+    def __len__(self) -> int:
+        return len(self.cell_index)
+
+    def cell(self, i: int) -> dict:
+        """
+        :return: i-th cell as saved in file {"cell_type": <type>, "data": <data>}
+        """
+        offset, length = self.cell_index[i]
+        return json.loads(self._map[offset:offset + length])
+
+    def cells(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self.cell(i)
+
+    def media_bytes(self, digest: str) -> bytes:
+        offset, length, _ = self.media_index[digest]
+        return self._map[offset:offset + length]
+
+    def media_file(self, digest: str) -> str:
+        """
+        extracts image into a content addressed cache directory (once) and returns its path,
+        so it can be opened like any other image file
+        """
+        ext = self.media_index[digest][2]
+        path = os.path.join(MEDIA_CACHE_DIR, digest + ext)
+        if digest in self._extracted:
+            return path
+        # a file already in the cache is trusted only if it has the content its name promises
+        if not os.path.isfile(path) or sha256_file(path) != digest:
+            os.makedirs(MEDIA_CACHE_DIR, mode=0o700, exist_ok=True)
+            # unique temporary file, threads (thumbnails, export) may extract the same image at once
+            fd, tmp_path = tempfile.mkstemp(dir=MEDIA_CACHE_DIR, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as file:
+                    file.write(self.media_bytes(digest))
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+        self._extracted.add(digest)
+        return path
+
+    def image_path(self, record: ImageRecord) -> str:
+        if record.media and record.media in self.media_index:
+            return self.media_file(record.media)
+        return record.path
+
+    def to_document(self, keep_unknown: bool = False) -> Document:
+        document = Document([record_from_dict(cell, keep_unknown) for cell in self.cells()])
+        document.pack = self
+        return document
+
+    def close(self):
+        if getattr(self, '_map', None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+def write_packed(filename: str, records: List[CellRecord], base_dir: str = None, source: PackedBook = None):
+    """
+    writes cells into .ibfp file, images referenced by ImageRecords are embedded
+
+    :param base_dir: directory relative image paths are resolved against
+    :param source: packed book the records were loaded from, its media is copied if the original file is gone
+    """
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    cell_index = []
+    media_index = {}
+    try:
+        with open(tmp_filename, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, 0, 0))
+
+            for record in records:
+                cell = record._import_()
+                if isinstance(record, ImageRecord):
+                    digest = _write_media(file, record, media_index, base_dir, source)
+                    cell['data']['media'] = digest
+                blob = json.dumps(cell, separators=(',', ':')).encode()
+                cell_index.append([file.tell(), len(blob)])
+                file.write(blob)
+
+            index = json.dumps({"version": VERSION, "cells": cell_index, "media": media_index},
+                               separators=(',', ':')).encode()
+            index_offset = file.tell()
+            file.write(index)
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, index_offset, len(index)))
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        # e.g. an image is missing, the old book stays as it was and no temporary file is left behind
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
+
+
+def _write_media(file, record: ImageRecord, media_index: dict, base_dir: str, source: PackedBook) -> str:
+    path = resolve_path(record.path, base_dir)
+    if os.path.exists(path):
+        with open(path, 'rb') as image_file:
+            content = image_file.read()
+    elif source is not None and record.media in source.media_index:
+        content = source.media_bytes(record.media)
+    else:
+        raise FileNotFoundError(f'image {record.path} not found')
+
+    digest = hashlib.sha256(content).hexdigest()
+    if digest not in media_index:
+        media_index[digest] = [file.tell(), len(content), os.path.splitext(record.path)[1].lower()]
+        file.write(content)
+    return digest
+
+
+def pack(ibf_filename: str, packed_filename: str):
+    """
+    converts plain .ibf into .ibfp
+    """
+    document = Document.load(ibf_filename, keep_unknown=True)
+    write_packed(packed_filename, document.cells, base_dir=os.path.dirname(os.path.abspath(ibf_filename)))
+
+
+def unpack(packed_filename: str, ibf_filename: str, media_dir: str = None):
+    """
+    converts .ibfp back into plain .ibf, embedded images are extracted so none are lost on the way
+
+    :param media_dir: directory images are extracted into, <book>_media next to ibf_filename by default
+    """
+    if media_dir is None:
+        media_dir = os.path.splitext(ibf_filename)[0] + '_media'
+    book_dir = os.path.dirname(os.path.abspath(ibf_filename))
+    book = PackedBook(packed_filename)
+    try:
+        document = book.to_document(keep_unknown=True)
+        for record in document:
+            if isinstance(record, ImageRecord) and record.media:
+                os.makedirs(media_dir, exist_ok=True)
+                path = os.path.join(media_dir, record.media + book.media_index[record.media][2])
+                with open(path, 'wb') as file:
+                    file.write(book.media_bytes(record.media))
+                record.path = os.path.relpath(path, book_dir)  # found next to the book wherever it's opened from
+                record.media = None
+        document.save(ibf_filename)
+    finally:
+        book.close()
@@ -0,0 +1,242 @@
+"""
+command line tool for working with books without the editor
+
+    python ibf_tool.py validate books/            # checks every cell against its schema
+    python ibf_tool.py normalize --indent 2 a.ibf # rewrites books in canonical formatting
+    python ibf_tool.py minify books/              # rewrites books as compact json
+    python ibf_tool.py check-images books/        # checks that every image exists and can be decoded
+    python ibf_tool.py convert --to ibfp books/   # packs books (--to ibf unpacks them, images go to <book>_media)
+
+files and directories (searched recursively for .ibf and .ibfp) can be mixed, books are processed
+in a process pool (-j sets its size). Problems are printed as '<book>: <problem>', exit status is 1
+if any book has a problem.
+"""
+import argparse
+import functools
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple
+
+import cells  # registers every cell type, so their records are validated too
+from document import Document, ImageRecord, record_from_dict, validate_file_data
+from ibf_pack import PackedBook, is_packed, pack, resolve_path, unpack
+from library import BOOK_EXTENSIONS, find_books
+
+
+class Result(NamedTuple):
+    path: str
+    problems: List[str]  # the book has problems if not empty
+    note: str = ''  # what was done with the book
+
+
+def read_file_data(path: str) -> list:
+    """
+    :return: cells of the book as saved in file, raises ValueError if it isn't readable
+    """
+    if is_packed(path):
+        book = PackedBook(path)
+        try:
+            return list(book.cells())
+        finally:
+            book.close()
+    with open(path) as file:
+        try:
+            return json.load(file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'invalid json: {e}')
+
+
+def validate(path: str) -> Result:
+    return Result(path, validate_file_data(read_file_data(path)))
+
+
+def normalize(path: str, indent: int = 4) -> Result:
+    """
+    rewrites the book formatted with indent (None for minified json), books already formatted
+    this way are left untouched so their mtime doesn't change
+    """
+    if is_packed(path):
+        return Result(path, [], 'skipped, packed books are always compact')
+    with open(path) as file:
+        text = file.read()
+    try:
+        file_data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f'invalid json: {e}')
+    problems = validate_file_data(file_data, keep_unknown=True)
+    if problems:
+        return Result(path, problems, 'not rewritten')
+    file_data = Document.from_file_data(file_data, keep_unknown=True).to_file_data()
+    if Document.file_text(file_data, indent) == text:
+        return Result(path, [], 'unchanged')
+    Document.write_file_data(path, file_data, indent)
+    return Result(path, [], 'rewritten')
+
+
+def check_image(source) -> str:
+    """
+    :param source: image file path or file object
+    :return: description of the problem, None if the image can be decoded
+    """
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(source) as image:
+            image.verify()
+    except (OSError, UnidentifiedImageError, SyntaxError) as e:  # verify raises SyntaxError for broken pngs
+        return str(e) or type(e).__name__
+    return None
+
+
+def check_images(path: str) -> Result:
+    """
+    images embedded in packed books are checked in the pack, the others at their resolved path
+    """
+    file_data = read_file_data(path)
+    book = PackedBook(path) if is_packed(path) else None
+    base_dir = os.path.dirname(os.path.abspath(path))
+    problems = []
+    checked = 0
+    try:
+        for i, cell in enumerate(file_data):
+            if not isinstance(cell, dict) or cell.get('cell_type') != ImageRecord.cell_type:
+                continue
+            try:
+                record = record_from_dict(cell)
+            except (ValueError, TypeError) as e:
+                problems.append(f'cell {i} (image): {e}')
+                continue
+            record_problems = record.validate()
+            if record_problems:  # e.g. a path which isn't a string can't be looked up
+                problems.extend(f'cell {i} (image): {problem}' for problem in record_problems)
+                continue
+            checked += 1
+            if book is not None and record.media:
+                if record.media not in book.media_index:
+                    problems.append(f'cell {i} (image): embedded image {record.media} is missing in the pack')
+                    continue
+                problem = check_image(io.BytesIO(book.media_bytes(record.media)))
+            else:
+                image_path = resolve_path(record.path, base_dir)
+                if not os.path.isfile(image_path):
+                    problems.append(f'cell {i} (image): {record.path} not found')
+                    continue
+                problem = check_image(image_path)
+            if problem:
+                problems.append(f'cell {i} (image): {record.path} can\'t be decoded: {problem}')
+    finally:
+        if book is not None:
+            book.close()
+    return Result(path, problems, f'{checked} images')
+
+
+def convert(path: str, to: str = 'ibfp', output_dir: str = None) -> Result:
+    """
+    :param to: 'ibfp' packs plain books, 'ibf' unpacks packed ones
+    :param output_dir: directory converted books are written to (default: next to the source),
+        unpacked books get their embedded images extracted into <book>_media next to them
+    """
+    if is_packed(path) == (to == 'ibfp'):
+        return Result(path, [], f'skipped, already .{to}')
+    name = os.path.splitext(os.path.basename(path))[0] + '.' + to
+    output = os.path.join(output_dir or os.path.dirname(path), name)
+    problems = validate_file_data(read_file_data(path), keep_unknown=True)
+    if problems:  # a broken book would be carried over into the converted one
+        return Result(path, problems, 'not converted')
+    if to == 'ibfp':
+        pack(path, output)
+    else:
+        unpack(path, output)
+    return Result(path, [], f'-> {output}')
+
+
+def run(task, path: str) -> Result:
+    """
+    runs the task in a worker, errors are reported as problems of the book instead of stopping the batch
+    """
+    try:
+        return task(path)
+    except Exception as e:  # e.g. TypeError of a cell with fields of a wrong type
+        return Result(path, [str(e) or type(e).__name__])
+
+
+def collect_books(paths: List[str]) -> List[str]:
+    books = []
+    for path in paths:
+        if os.path.isdir(path):
+            books.extend(sorted(find_books(path)))
+        else:
+            books.append(path)
+    return books
+
+
+def process(task, paths: List[str], jobs: int = None):
+    """
+    yields Results of the task over the books in order, in a process pool unless jobs is 1
+    """
+    worker = functools.partial(run, task)
+    if jobs == 1 or len(paths) < 2:
+        yield from map(worker, paths)
+        return
+    with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+        chunksize = max(1, len(paths) // ((jobs or os.cpu_count() or 1) * 8))
+        yield from executor.map(worker, paths, chunksize=chunksize)
+
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='validate, reformat and convert interactive books')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: number of CPUs)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='report books without problems too')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name: str, help: str) -> argparse.ArgumentParser:
+        command = commands.add_parser(name, help=help)
+        command.add_argument('paths', nargs='+', help=f'books or directories with books ({", ".join(BOOK_EXTENSIONS)})')
+        return command
+
+    add_command('validate', 'check cells against their schemas')
+    add_command('normalize', 'rewrite books in canonical formatting').add_argument(
+        '--indent', type=int, default=4, help='indentation of the json (default: 4)')
+    add_command('minify', 'rewrite books as compact json')
+    add_command('check-images', 'check that every image exists and can be decoded')
+    convert_command = add_command('convert', 'pack .ibf books into .ibfp or unpack them back')
+    convert_command.add_argument('--to', choices=('ibfp', 'ibf'), default='ibfp')
+    convert_command.add_argument('--output-dir', help='directory for converted books (default: next to the source)')
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    args = parse_args(argv)
+    match args.command:
+        case 'validate':
+            task = validate
+        case 'normalize':
+            task = functools.partial(normalize, indent=args.indent)
+        case 'minify':
+            task = functools.partial(normalize, indent=None)
+        case 'check-images':
+            task = check_images
+        case 'convert':
+            if args.output_dir:
+                os.makedirs(args.output_dir, exist_ok=True)
+            task = functools.partial(convert, to=args.to, output_dir=args.output_dir)
+
+    paths = collect_books(args.paths)
+    started = time.perf_counter()
+    failed = 0
+    for result in process(task, paths, args.jobs):
+        failed += bool(result.problems)
+        for problem in result.problems:
+            print(f'{result.path}: {problem}')
+        if args.verbose and result.note:
+            print(f'{result.path}: {result.note}')
+    print(f'{len(paths)} books, {failed} with problems in {time.perf_counter() - started:.2f}s', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
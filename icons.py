@@ -0,0 +1,101 @@
+"""
+bundled toolbar icons
+
+all icons are packed into a single sprite sheet (assets/icons.png) with the position of every icon
+stored in its "icons" text chunk. The sheet is decoded once, the first time any icon is needed,
+and icons are cut out of it on demand. Sheet is found relative to this file, so the app can be
+started from any working directory.
+
+after changing the source images in assets/icons run
+
+    python icons.py
+
+to rebuild the sheet
+"""
+import json
+import os
+
+import customtkinter as ctk
+from PIL import Image, PngImagePlugin
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+SOURCE_DIR = os.path.join(ASSETS_DIR, 'icons')
+SHEET_FILE = os.path.join(ASSETS_DIR, 'icons.png')
+ICON_SIZE = 64  # size of icons in the sheet, enough for 20px buttons up to 3x scaling
+
+
+def build_sheet(source_dir: str = SOURCE_DIR, sheet_file: str = SHEET_FILE, icon_size: int = ICON_SIZE) -> dict:
+    """
+    packs every png in source_dir into one row of the sprite sheet, icon names are the file names
+
+    :return: {name: [x, y, width, height]}
+    """
+    names = sorted(os.path.splitext(name)[0] for name in os.listdir(source_dir) if name.endswith('.png'))
+    sheet = Image.new('RGBA', (icon_size * len(names), icon_size))
+    index = {}
+    for i, name in enumerate(names):
+        with Image.open(os.path.join(source_dir, name + '.png')) as icon:
+            icon = icon.convert('RGBA')
+            icon.thumbnail((icon_size, icon_size), Image.LANCZOS)
+        x = i * icon_size + (icon_size - icon.width) // 2
+        y = (icon_size - icon.height) // 2
+        sheet.paste(icon, (x, y))
+        index[name] = [i * icon_size, 0, icon_size, icon_size]
+
+    info = PngImagePlugin.PngInfo()
+    info.add_text('icons', json.dumps(index))
+    sheet.save(sheet_file, pnginfo=info, optimize=True)
+    return index
+
+
+class IconStore:
+    """
+    icons cut out of the sprite sheet, sheet is read and every icon created only on first use
+
+        icons = IconStore()
+        button = ctk.CTkButton(parent, image=icons.get('save'))
+    """
+
+    def __init__(self, sheet_file: str = SHEET_FILE, size: tuple = (20, 20)):
+        """
+        :param size: size of the CTkImages (before widget scaling)
+        """
+        self.sheet_file = sheet_file
+        self.size = size
+        self._sheet: Image.Image = None
+        self._index: dict = None
+        self._icons: dict = {}  # name -> CTkImage
+
+    def _load(self):
+        with Image.open(self.sheet_file) as sheet:
+            self._index = json.loads(sheet.text['icons'])
+            sheet.load()
+            self._sheet = sheet.copy()
+
+    def names(self) -> list:
+        if self._index is None:
+            self._load()
+        return list(self._index)
+
+    def image(self, name: str) -> Image.Image:
+        """
+        icon cut out of the sheet in full size, for widgets which don't take CTkImages
+        """
+        if self._sheet is None:
+            self._load()
+        x, y, width, height = self._index[name]
+        return self._sheet.crop((x, y, x + width, y + height))
+
+    def get(self, name: str) -> ctk.CTkImage:
+        icon = self._icons.get(name)
+        if icon is None:
+            icon = ctk.CTkImage(dark_image=self.image(name), size=self.size)
+            self._icons[name] = icon
+        return icon
+
+
+icons = IconStore()
+
+
+if __name__ == '__main__':
+    print(f'packed {", ".join(build_sheet())} into {SHEET_FILE}')
@@ -0,0 +1,255 @@
+import os
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
+import customtkinter as ctk
+from PIL import Image
+
+WIDTH_STEP = 64  # target widths are rounded down to a multiple of this, so small resizes hit the cache
+
+
+def load_scaled(path: str, max_width: int = None) -> Image.Image:
+    """
+    decodes image and downscales it (keeping aspect ratio) so it is not wider than max_width
+
+    :param max_width: None keeps native size
+    """
+    with Image.open(path) as img:
+        if max_width and img.width > max_width:
+            height = max(1, round(img.height * max_width / img.width))
+            img.draft(img.mode, (max_width, height))  # lets jpeg decoder skip unneeded pixels
+            img = img.resize((max_width, height), Image.LANCZOS)
+        else:
+            img.load()
+            img = img.copy()
+    return img
+
+
+def decode_width(max_width: int = None) -> int:
+    """
+    width images are actually decoded to for max_width, never wider, so images fit where they are shown
+    """
+    if not max_width:
+        return max_width
+    return max(max_width // WIDTH_STEP * WIDTH_STEP, min(max_width, WIDTH_STEP))
+
+
+def image_bytes(img: Image.Image) -> int:
+    return img.width * img.height * len(img.getbands())
+
+
+class ImageCache:
+    """
+    process-wide cache of decoded images shared between all ImageCells
+
+    entries are keyed by (path, mtime, target width) and evicted in least-recently-used order
+    when they take more than max_bytes
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries: OrderedDict[tuple, Tuple[ctk.CTkImage, int]] = OrderedDict()
+
+    @staticmethod
+    def key(path: str, max_width: int = None) -> tuple:
+        return os.path.abspath(path), os.stat(path).st_mtime_ns, decode_width(max_width)
+
+    def get(self, path: str, max_width: int = None) -> ctk.CTkImage:
+        """
+        :return: CTkImage of the image at path, not wider than max_width (rounded down to WIDTH_STEP)
+        """
+        key = self.key(path, max_width)
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+
+        img = load_scaled(path, key[2])
+        ctk_image = ctk.CTkImage(dark_image=img, light_image=img, size=img.size)
+        self.put(key, ctk_image, image_bytes(img))
+        return ctk_image
+
+    def lookup(self, key: tuple) -> ctk.CTkImage:
+        """
+        :return: cached image or None, counts as a hit or a miss
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: tuple, ctk_image: ctk.CTkImage, size: int):
+        if key in self._entries:
+            self.current_bytes -= self._entries[key][1]
+        self._entries[key] = (ctk_image, size)
+        self.current_bytes += size
+        self._evict()
+
+    def set_budget(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def _evict(self):
+        # the newest entry is kept even if it alone exceeds the budget
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.current_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.current_bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def scaled_size(path: str, max_width: int = None) -> Tuple[int, int]:
+    """
+    size the image will have after load_scaled, only the header of the file is read
+    """
+    with Image.open(path) as img:
+        width, height = img.size
+    if max_width and width > max_width:
+        return max_width, max(1, round(height * max_width / width))
+    return width, height
+
+
+class DecodeTicket:
+    """
+    handle for a pending ImageDecoder request, cancel() it when the result is no longer needed
+    """
+    __slots__ = ('job', 'callback')
+
+    def __init__(self, job: 'DecodeJob', callback):
+        self.job = job
+        self.callback = callback
+
+    def cancel(self):
+        if self.job is not None:
+            self.job.tickets.remove(self)
+            self.job = None
+
+
+class DecodeJob:
+    __slots__ = ('key', 'tickets')
+
+    def __init__(self, key: tuple):
+        self.key = key
+        self.tickets: list[DecodeTicket] = []
+
+
+class ImageDecoder:
+    """
+    decodes and downscales images in a thread pool, results are delivered on the Tk main thread
+
+    at most max_in_flight decodes run at the same time, the rest wait in a queue and are dropped
+    when all their tickets get cancelled (e.g. the cell was scrolled out of view)
+    """
+
+    def __init__(self, cache: ImageCache, max_workers: int = 2, max_in_flight: int = 4, poll_ms: int = 15):
+        self.cache = cache
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight
+        self.poll_ms = poll_ms
+
+        self._executor: ThreadPoolExecutor = None
+        self._jobs: dict[tuple, DecodeJob] = {}
+        self._waiting: deque[DecodeJob] = deque()
+        self._in_flight = 0
+        self._results = queue.SimpleQueue()
+        self._root = None
+        self._poll_job = None
+
+    def request(self, widget, path: str, max_width: int, callback) -> DecodeTicket:
+        """
+        :param widget: any Tk widget, used to schedule delivery on the main thread
+        :param callback: called as callback(ctk_image, error) on the main thread, one of them is None
+        :return: ticket that can be cancelled, None if the image was already cached (callback was called)
+        """
+        try:
+            key = self.cache.key(path, max_width)
+        except OSError as e:
+            callback(None, e)
+            return None
+        cached = self.cache.lookup(key)
+        if cached is not None:
+            callback(cached, None)
+            return None
+
+        job = self._jobs.get(key)
+        if job is None:
+            job = self._jobs[key] = DecodeJob(key)
+            self._waiting.append(job)
+        ticket = DecodeTicket(job, callback)
+        job.tickets.append(ticket)
+
+        self._root = widget._root()
+        self._submit_waiting()
+        self._schedule_poll()
+        return ticket
+
+    def _submit_waiting(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='image-decoder')
+        while self._waiting and self._in_flight < self.max_in_flight:
+            job = self._waiting.popleft()
+            if not job.tickets:  # everybody lost interest before decoding started
+                del self._jobs[job.key]
+                continue
+            self._in_flight += 1
+            future = self._executor.submit(load_scaled, job.key[0], job.key[2])
+            future.add_done_callback(lambda future, job=job: self._results.put((job, future)))
+
+    def _schedule_poll(self):
+        if self._poll_job is None and self._root is not None:
+            self._poll_job = self._root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        self._poll_job = None
+        while not self._results.empty():
+            job, future = self._results.get()
+            self._in_flight -= 1
+            del self._jobs[job.key]
+
+            error = future.exception()
+            ctk_image = None
+            if error is None:
+                img = future.result()
+                ctk_image = ctk.CTkImage(dark_image=img, light_image=img, size=img.size)
+                self.cache.put(job.key, ctk_image, image_bytes(img))
+            for ticket in list(job.tickets):
+                ticket.job = None
+                ticket.callback(ctk_image, error)
+
+        self._submit_waiting()
+        if self._jobs:
+            self._schedule_poll()
+
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_cache = ImageCache()
+image_decoder = ImageDecoder(image_cache)
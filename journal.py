@@ -0,0 +1,314 @@
+import json
+import os
+import threading
+from typing import List, Optional
+
+from document import CellRecord, Change, Document, record_from_dict
+from ibf_pack import PackedBook, is_packed, write_packed
+
+
+def file_identity(filename: str) -> list:
+    """
+    (size, mtime) of the book file, journal is only valid for the exact file it was written against
+    """
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_book(filename: str) -> Document:
+    if is_packed(filename):
+        return PackedBook(filename).to_document(keep_unknown=True)
+    return Document.load(filename, keep_unknown=True)
+
+
+def write_book(filename: str, file_data: list, source=None):
+    """
+    atomically writes whole book as plain .ibf or packed .ibfp (by extension)
+    """
+    if filename.endswith('.ibfp'):
+        write_packed(filename, [record_from_dict(cell, keep_unknown=True) for cell in file_data], source=source)
+    else:
+        Document.write_file_data(filename, file_data)
+
+
+def write_synced(filename: str, data: bytes):
+    """
+    atomically replaces the file with data, which is on disk once this returns
+    """
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_filename, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+        raise
+
+
+class BookJournal:
+    """
+    journaled saving of a book
+
+    document changes are tracked per cell, save() appends only the modified cells and structural
+    edits to <book>.journal (one json object per line), the whole book is rewritten atomically only
+    by compaction, which replays the journal onto the book file in a background thread (unsaved edits
+    of the open document are never written by it). When the book is opened again after a crash the
+    journal is replayed on top of it.
+
+    compaction writes <book>.journal.compacted before it replaces the book, so a crash before the
+    journal is started over (on the main thread) doesn't lose the entries saved meanwhile: the book is
+    recognized as the compacted one and only entries past the compacted offset are replayed.
+
+    journal entries:
+        {"op": "base", "identity": [<size>, <mtime_ns>]}   first line, identifies the book file
+        {"op": "insert", "index": <i>, "cells": [<cell>, ...]}
+        {"op": "delete", "index": <i>, "count": <n>}
+        {"op": "move", "from": <i>, "to": <j>, "count": <n, only if not 1>}
+        {"op": "update", "index": <i>, "cell": <cell>}
+
+    <book>.journal.compacted:
+        {"identity": <identity of the compacted book>, "base": <identity in the journal>, "offset": <bytes>}
+    """
+
+    def __init__(self, document: Document, filename: str, compact_after: int = 4 * 1024 * 1024):
+        """
+        :param compact_after: journal size (in bytes) after which needs_compaction() is True
+        """
+        self.document = document
+        self.filename = filename
+        self.journal_filename = filename + '.journal'
+        self.compacted_filename = filename + '.journal.compacted'
+        self.compact_after = compact_after
+
+        self.pending: list = []  # structural edits since last save, in order
+        self.dirty: dict[int, CellRecord] = {}  # id(record) -> record edited since last save
+        self._compaction: threading.Thread = None
+        self._compaction_result = None
+
+        # journal written against another version of the book (edited outside, or saved over with
+        # Save As) would make replay drop everything appended to it, it is kept aside instead
+        if self.journal_size():
+            start = self.journal_start(filename, self.journal_filename)
+            if start is None:
+                os.replace(self.journal_filename, self.journal_filename + '.stale')
+            elif os.path.exists(self.compacted_filename):
+                self._rebase(start)  # finishes compaction interrupted by a crash
+
+        document.subscribe(self._on_document_change)
+
+    @classmethod
+    def open(cls, document: Document, filename: str, **kwargs) -> 'BookJournal':
+        """
+        replays journal left by a previous session (if it matches the book file) and starts tracking changes
+
+        :param document: document loaded from filename
+        """
+        journal_filename = filename + '.journal'
+        if os.path.exists(journal_filename):
+            cls.replay(document, filename, journal_filename)
+        return cls(document, filename, **kwargs)
+
+    @staticmethod
+    def journal_start(filename: str, journal_filename: str) -> Optional[int]:
+        """
+        :return: offset of the first journal entry not in the current book file yet, None if the
+            journal was written against another version of the book
+        """
+        try:
+            identity = file_identity(filename)
+            with open(journal_filename, 'rb') as file:
+                header_line = file.readline()
+            header = json.loads(header_line)
+            if header.get('op') != 'base':
+                return None
+            if header.get('identity') == identity:
+                return len(header_line)
+            # book was replaced by compaction, but the journal wasn't started over
+            with open(journal_filename + '.compacted', 'rb') as file:
+                compacted = json.load(file)
+            if compacted.get('identity') == identity and compacted.get('base') == header.get('identity'):
+                return compacted['offset']
+            return None
+        except (OSError, ValueError, AttributeError, KeyError):
+            return None
+
+    @staticmethod
+    def replay(document: Document, filename: str, journal_filename: str, end: int = None) -> int:
+        """
+        applies journal entries onto document, stale journals (written against another version of
+        the book file) are ignored
+
+        :param end: replay only entries in the first end bytes of the journal
+        :return: number of applied entries
+        """
+        start = BookJournal.journal_start(filename, journal_filename)
+        if start is None:
+            return 0
+        with open(journal_filename, 'rb') as file:
+            file.seek(start)
+            lines = file.read(end - start if end is not None else -1).splitlines()
+
+        applied = 0
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                break  # last entry was cut by the crash
+            match entry['op']:
+                case 'insert':
+                    document.insert_many(entry['index'], [record_from_dict(cell, keep_unknown=True) for cell in entry['cells']])
+                case 'delete':
+                    document.delete(entry['index'], entry['count'])
+                case 'move':
+                    document.move(entry['from'], entry['to'], entry.get('count', 1))
+                case 'update':
+                    document.delete(entry['index'])
+                    document.insert(entry['index'], record_from_dict(entry['cell'], keep_unknown=True))
+            applied += 1
+        return applied
+
+    def close(self):
+        self.document.unsubscribe(self._on_document_change)
+
+    def _on_document_change(self, change: Change):
+        match change.kind:
+            case 'load':
+                self.pending.clear()
+                self.dirty.clear()
+            case 'insert':
+                self.pending.append(('insert', change.index, self.document[change.index:change.index + change.count]))
+            case 'delete':
+                self.pending.append(('delete', change.index, change.count))
+            case 'move':
+                self.pending.append(('move', change.old_index, change.index, change.count))
+            case 'update':
+                self.dirty[id(change.record)] = change.record
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self.pending or self.dirty)
+
+    def _entries(self) -> List[dict]:
+        entries = []
+        for op, *args in self.pending:
+            match op:
+                case 'insert':
+                    index, records = args
+                    entries.append({"op": "insert", "index": index, "cells": [record._import_() for record in records]})
+                case 'delete':
+                    index, count = args
+                    entries.append({"op": "delete", "index": index, "count": count})
+                case 'move':
+                    old_index, new_index, count = args
+                    entry = {"op": "move", "from": old_index, "to": new_index}
+                    if count != 1:
+                        entry["count"] = count
+                    entries.append(entry)
+
+        for record in self.dirty.values():
+            try:
+                index = self.document.index(record)  # O(log n)
+            except ValueError:
+                continue  # edited cells which got deleted afterwards are skipped
+            entries.append({"op": "update", "index": index, "cell": record._import_()})
+        return entries
+
+    def save(self):
+        """
+        appends changes since the last save to the journal, cost depends only on the size of the changes
+        """
+        if not self.is_dirty:
+            return
+        entries = self._entries()
+        new_journal = not os.path.exists(self.journal_filename) or not os.path.getsize(self.journal_filename)
+        with open(self.journal_filename, 'a') as file:
+            if new_journal:
+                file.write(json.dumps({"op": "base", "identity": file_identity(self.filename)}) + '\n')
+            file.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+            file.flush()
+            os.fsync(file.fileno())
+        self.pending.clear()
+        self.dirty.clear()
+
+    def journal_size(self) -> int:
+        try:
+            return os.path.getsize(self.journal_filename)
+        except OSError:
+            return 0
+
+    def needs_compaction(self) -> bool:
+        return self._compaction is None and self.journal_size() > self.compact_after
+
+    def compact(self):
+        """
+        rewrites the whole book with the changes saved in the journal, journal is emptied
+        """
+        self.start_compaction()
+        self._compaction.join()
+        self.finish_compaction()
+
+    def start_compaction(self):
+        """
+        rewrites the book in a background thread, call finish_compaction() from the main thread
+        once compaction_running is False
+        """
+        if self._compaction is not None:
+            return
+        journal_offset = self.journal_size()  # entries saved after this stay in the journal
+        self._compaction_result = None
+
+        def compact():
+            root, ext = os.path.splitext(self.filename)
+            compacted_book = f'{root}.{os.getpid()}.compacted{ext}'  # extension picks the format
+            try:
+                if journal_offset:
+                    with open(self.journal_filename, 'rb') as file:
+                        base = json.loads(file.readline())['identity']
+                    saved = load_book(self.filename)
+                    self.replay(saved, self.filename, self.journal_filename, end=journal_offset)
+                    write_book(compacted_book, saved.to_file_data(), source=saved.pack)
+                    if saved.pack is not None:
+                        saved.pack.close()
+                    # renaming keeps size and mtime, so the identity is known before the book is replaced
+                    write_synced(self.compacted_filename, json.dumps(
+                        {"identity": file_identity(compacted_book), "base": base, "offset": journal_offset}).encode())
+                    os.replace(compacted_book, self.filename)
+                self._compaction_result = journal_offset
+            except Exception as e:
+                if os.path.exists(compacted_book):
+                    os.remove(compacted_book)
+                self._compaction_result = e
+
+        self._compaction = threading.Thread(target=compact, name='journal-compaction', daemon=True)
+        self._compaction.start()
+
+    @property
+    def compaction_running(self) -> bool:
+        return self._compaction is not None and self._compaction.is_alive()
+
+    def finish_compaction(self):
+        if self._compaction is None or self._compaction.is_alive():
+            return
+        self._compaction = None
+        result = self._compaction_result
+        if isinstance(result, Exception):
+            raise result
+        self._rebase(result)
+
+    def _rebase(self, offset: int):
+        """
+        starts the journal over against the current book file, keeping entries past offset (the ones
+        saved during compaction)
+        """
+        newer_entries = b''
+        if os.path.exists(self.journal_filename):
+            with open(self.journal_filename, 'rb') as file:
+                file.seek(offset)
+                newer_entries = file.read()
+        header = json.dumps({"op": "base", "identity": file_identity(self.filename)}).encode() + b'\n'
+        write_synced(self.journal_filename, header + newer_entries if newer_entries else b'')
+        if os.path.exists(self.compacted_filename):
+            os.remove(self.compacted_filename)
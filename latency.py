@@ -0,0 +1,172 @@
+"""
+event loop latency watchdog
+
+a timer scheduled every interval_ms measures how late Tk runs it, which is the delay any input
+event would have seen at that moment. Late ticks (stalls) are recorded together with the slowest
+callback that ran since the previous tick and the callbacks that ran most often (e.g. a storm of
+<Configure> handlers).
+"""
+import json
+import time
+import tkinter
+from collections import Counter, deque
+from typing import List, NamedTuple
+
+# upper bounds (ms) of histogram buckets, last bucket is open
+BUCKETS_MS = (5, 10, 16, 33, 50, 100, 250, 500, 1000, 2000)
+
+
+def callback_name(func) -> str:
+    """
+    readable name of the python function behind a Tk command
+    """
+    if getattr(func, '__qualname__', '').endswith('after.<locals>.callit'):
+        # after() wraps the callback in a closure, look the original function up in it
+        for cell in func.__closure__ or ():
+            try:
+                contents = cell.cell_contents
+            except ValueError:
+                continue
+            if callable(contents) and getattr(contents, '__name__', None) == func.__name__:
+                func = contents
+                break
+    return getattr(func, '__qualname__', None) or type(func).__name__
+
+
+class Stall(NamedTuple):
+    time: float  # time.time() of the late tick
+    late_ms: float  # how much later than scheduled the tick ran
+    culprit: str  # slowest callback since the previous tick
+    culprit_ms: float
+    callbacks: int  # number of callbacks run since the previous tick
+    frequent: List[tuple]  # [(callback, times run)] of the most frequent callbacks since the previous tick
+
+
+class LatencyWatchdog:
+    """
+    measures responsiveness of the Tk main loop
+
+        watchdog = LatencyWatchdog(app)
+        watchdog.start()
+        ...
+        watchdog.histogram()  # {"<=5ms": 1200, "<=10ms": 30, ...}
+
+    callbacks are timed by hooking tkinter.CallWrapper, only commands registered after start()
+    (every after() call, bindings made later) are seen by it, so start it before building the widgets
+    """
+
+    def __init__(self, root: tkinter.Misc, interval_ms: int = 50, threshold_ms: float = 100, max_stalls: int = 1000):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self.stalls: deque[Stall] = deque(maxlen=max_stalls)
+        self.counts = [0] * (len(BUCKETS_MS) + 1)  # ticks per histogram bucket
+        self.ticks = 0
+        self.stall_count = 0
+        self.max_late_ms = 0.0
+
+        self._job = None
+        self._expected = 0.0
+        self._original_call = None
+        self._slowest = (0.0, None)  # (seconds, function) of the slowest callback since last tick
+        self._callbacks = Counter()  # function -> times run since last tick
+
+    @property
+    def running(self) -> bool:
+        return self._job is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._hook_callbacks()
+        self._schedule()
+
+    def stop(self):
+        if self._job is not None:
+            try:
+                self.root.after_cancel(self._job)
+            except tkinter.TclError:
+                pass
+            self._job = None
+        if self._original_call is not None:
+            tkinter.CallWrapper.__call__ = self._original_call
+            self._original_call = None
+
+    def _hook_callbacks(self):
+        original_call = self._original_call = tkinter.CallWrapper.__call__
+        perf_counter = time.perf_counter
+        watchdog = self
+
+        def __call__(wrapper, *args):
+            start = perf_counter()
+            try:
+                return original_call(wrapper, *args)
+            finally:
+                duration = perf_counter() - start
+                watchdog._callbacks[wrapper.func] += 1
+                if duration > watchdog._slowest[0]:
+                    watchdog._slowest = (duration, wrapper.func)
+
+        tkinter.CallWrapper.__call__ = __call__
+
+    def _schedule(self):
+        self._expected = time.perf_counter() + self.interval_ms / 1000
+        self._job = self.root.after(self.interval_ms, self._tick)
+
+    def _tick(self):
+        late_ms = max(0.0, (time.perf_counter() - self._expected) * 1000)
+        self.ticks += 1
+        self.max_late_ms = max(self.max_late_ms, late_ms)
+        bucket = 0
+        while bucket < len(BUCKETS_MS) and late_ms > BUCKETS_MS[bucket]:
+            bucket += 1
+        self.counts[bucket] += 1
+
+        if late_ms > self.threshold_ms:
+            self._record_stall(late_ms)
+        self._slowest = (0.0, None)
+        self._callbacks.clear()
+        self._schedule()
+
+    def _record_stall(self, late_ms: float):
+        self.stall_count += 1
+        seconds, func = self._slowest
+        names = Counter()
+        for callback, count in self._callbacks.items():
+            names[callback_name(callback)] += count
+        names.pop('LatencyWatchdog._tick', None)  # previous tick finished after the counter was cleared
+        self.stalls.append(Stall(time.time(), late_ms, callback_name(func) if func else 'unknown', seconds * 1000,
+                                 sum(names.values()), names.most_common(3)))
+
+    def histogram(self) -> dict:
+        labels = [f'<={bound}ms' for bound in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}ms']
+        return dict(zip(labels, self.counts))
+
+    def percentile(self, fraction: float) -> float:
+        """
+        upper bound (ms) of the bucket the given fraction of ticks falls into (the worst lateness for the open bucket)
+        """
+        if not self.ticks:
+            return 0.0
+        target = fraction * self.ticks
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= target:
+                return float(bound)
+        return self.max_late_ms
+
+    def stats(self) -> dict:
+        return {"ticks": self.ticks, "stalls": self.stall_count,
+                "p50_ms": self.percentile(0.5), "p95_ms": self.percentile(0.95), "p99_ms": self.percentile(0.99),
+                "max_ms": self.max_late_ms}
+
+    def dump(self, filename: str, **extra):
+        """
+        :param extra: other measurements saved along, e.g. startup time
+        """
+        with open(filename, 'w') as file:
+            json.dump({"interval_ms": self.interval_ms, "threshold_ms": self.threshold_ms, "stats": self.stats(),
+                       "histogram": self.histogram(), "stalls": [stall._asdict() for stall in self.stalls], **extra},
+                      file, indent=4)
+
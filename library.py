@@ -0,0 +1,245 @@
+"""
+catalog of the books in a directory tree
+
+metadata of every book (title, cell counts by type, quiz and flashcard counts, referenced images)
+is kept in a local SQLite database. Scanning indexes books in a process pool and only parses
+books whose mtime (and then content hash) changed since they were indexed.
+
+    catalog = Catalog()
+    catalog.scan('~/books')
+    catalog.books(text='biology', cell_type='quiz')
+
+the catalog can also be refreshed from the command line:
+
+    python library.py ~/books
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+
+from ibf_pack import resolve_path
+from journal import load_book
+
+DEFAULT_DATABASE = os.path.join(os.path.expanduser('~'), '.ibf_library.sqlite3')
+BOOK_EXTENSIONS = ('.ibf', '.ibfp')
+TITLE_LENGTH = 120
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS books (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    title TEXT NOT NULL,
+    cells INTEGER NOT NULL DEFAULT 0,
+    text_cells INTEGER NOT NULL DEFAULT 0,
+    quiz_cells INTEGER NOT NULL DEFAULT 0,
+    flashcard_cells INTEGER NOT NULL DEFAULT 0,
+    image_cells INTEGER NOT NULL DEFAULT 0,
+    other_cells INTEGER NOT NULL DEFAULT 0,
+    flashcards INTEGER NOT NULL DEFAULT 0,
+    images TEXT NOT NULL DEFAULT '[]',
+    missing_images INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS books_title ON books (title COLLATE NOCASE);
+'''
+COLUMNS = ('path', 'size', 'mtime_ns', 'sha256', 'title', 'cells', 'text_cells', 'quiz_cells', 'flashcard_cells',
+           'image_cells', 'other_cells', 'flashcards', 'images', 'missing_images', 'error', 'indexed_at')
+COUNT_COLUMNS = {'plain text': 'text_cells', 'quiz': 'quiz_cells', 'flash cards': 'flashcard_cells',
+                 'image': 'image_cells'}
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def book_metadata(path: str) -> dict:
+    """
+    reads the book and collects its catalog entry, errors are stored in the entry instead of raised,
+    so a single broken book never stops a scan
+    """
+    entry = {"path": path, "size": 0, "mtime_ns": 0, "sha256": '',
+             "title": os.path.splitext(os.path.basename(path))[0], "error": None, "indexed_at": time.time()}
+    try:
+        stat = os.stat(path)
+        entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, sha256=file_hash(path))
+        entry.update(_book_counts(path))
+    except Exception as e:
+        entry["error"] = str(e) or type(e).__name__
+        entry.update(cells=0, flashcards=0, images='[]', missing_images=0, other_cells=0)
+        entry.update(dict.fromkeys(COUNT_COLUMNS.values(), 0))
+    return entry
+
+
+def _book_counts(path: str) -> dict:
+    """
+    :return: cell counts, title and images of the book, raises if the book can't be read
+    """
+    counts = {"cells": 0, "flashcards": 0, "other_cells": 0}
+    counts.update(dict.fromkeys(COUNT_COLUMNS.values(), 0))
+    document = load_book(path)
+    try:
+        base_dir = os.path.dirname(path)
+        images = []
+        missing_images = 0
+        title = None
+        for record in document:
+            counts[COUNT_COLUMNS.get(record.cell_type, 'other_cells')] += 1
+            match record.cell_type:
+                case 'plain text':
+                    if title is None and record.text.strip():
+                        title = record.text.strip().splitlines()[0][:TITLE_LENGTH]
+                case 'flash cards':
+                    counts["flashcards"] += len(record.cards)
+                case 'image':
+                    images.append(record.path)
+                    if not (record.media and document.pack is not None) and \
+                            not os.path.exists(resolve_path(record.path, base_dir)):
+                        missing_images += 1
+    finally:
+        if document.pack is not None:
+            document.pack.close()
+
+    counts["cells"] = len(document)
+    if title:
+        counts["title"] = title
+    counts["images"] = json.dumps(images)
+    counts["missing_images"] = missing_images
+    return counts
+
+
+def _index_book(path: str, known_hash: str) -> dict:
+    """
+    worker of Catalog.scan, books whose content didn't change (only mtime did) aren't parsed again
+
+    :return: catalog entry, or {"path", "size", "mtime_ns", "unchanged": True} for unchanged content
+    """
+    if known_hash is not None:
+        try:
+            stat = os.stat(path)
+            if file_hash(path) == known_hash:
+                return {"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "unchanged": True}
+        except OSError:
+            pass  # book_metadata records the error
+    return book_metadata(path)
+
+
+def find_books(root: str) -> Dict[str, tuple]:
+    """
+    :return: {path: (size, mtime_ns)} of every book under root
+    """
+    books = {}
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(BOOK_EXTENSIONS):
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                books[path] = (stat.st_size, stat.st_mtime_ns)
+    return books
+
+
+class Catalog:
+    """
+    SQLite catalog of books, a connection can be used only from the thread which created the Catalog
+    """
+
+    def __init__(self, database: str = DEFAULT_DATABASE):
+        self.database = database
+        self.connection = sqlite3.connect(database)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+
+    def scan(self, root: str, processes: int = None, on_progress: Callable[[int, int], None] = None) -> dict:
+        """
+        brings the catalog of books under root up to date, books removed from disk are dropped
+
+        :param processes: size of the indexing process pool (default: number of CPUs)
+        :param on_progress: called with (done, total) after every indexed book
+        :return: {"indexed", "unchanged", "removed", "errors"} counts
+        """
+        root = os.path.abspath(os.path.expanduser(root))
+        on_disk = find_books(root)
+        known = {row['path']: row for row in self.connection.execute(
+            'SELECT path, size, mtime_ns, sha256 FROM books WHERE path >= ? AND path < ?',
+            (root + os.sep, root + chr(ord(os.sep) + 1)))}
+
+        removed = [path for path in known if path not in on_disk]
+        stale = [(path, known[path]['sha256'] if path in known else None) for path, (size, mtime_ns) in on_disk.items()
+                 if path not in known or (known[path]['size'], known[path]['mtime_ns']) != (size, mtime_ns)]
+
+        counts = {"indexed": 0, "unchanged": 0, "removed": len(removed), "errors": 0}
+        with self.connection:
+            self.connection.executemany('DELETE FROM books WHERE path = ?', [(path,) for path in removed])
+        if not stale:
+            return counts
+
+        # spawned workers don't inherit the GUI (scan may run from the editor)
+        with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('spawn')) as executor:
+            paths, hashes = zip(*stale)
+            chunksize = max(1, len(stale) // ((processes or os.cpu_count() or 1) * 8))
+            done = 0
+            for entry in executor.map(_index_book, paths, hashes, chunksize=chunksize):
+                with self.connection:
+                    if entry.get('unchanged'):
+                        counts["unchanged"] += 1
+                        self.connection.execute('UPDATE books SET size = ?, mtime_ns = ? WHERE path = ?',
+                                                (entry['size'], entry['mtime_ns'], entry['path']))
+                    else:
+                        counts["indexed"] += 1
+                        counts["errors"] += entry['error'] is not None
+                        self.connection.execute(
+                            f'INSERT OR REPLACE INTO books ({", ".join(COLUMNS)}) '
+                            f'VALUES ({", ".join("?" * len(COLUMNS))})', [entry[column] for column in COLUMNS])
+                done += 1
+                if on_progress:
+                    on_progress(done, len(stale))
+        return counts
+
+    def books(self, text: str = '', cell_type: str = None, order: str = 'title', limit: int = None) -> List[dict]:
+        """
+        books whose title or path contains text (case insensitive)
+
+        :param cell_type: only books with at least one cell of this type
+        :param order: column to sort by
+        """
+        if order not in COLUMNS:
+            raise ValueError(f'unknown column {order!r}')
+        query = 'SELECT * FROM books WHERE (title LIKE ? OR path LIKE ?)'
+        pattern = f'%{text}%'
+        parameters = [pattern, pattern]
+        if cell_type is not None:
+            query += f' AND {COUNT_COLUMNS[cell_type]} > 0'
+        query += f' ORDER BY {order} COLLATE NOCASE' if order in ('title', 'path') else f' ORDER BY {order} DESC'
+        if limit is not None:
+            query += ' LIMIT ?'
+            parameters.append(limit)
+        return [dict(row) for row in self.connection.execute(query, parameters)]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit(f'usage: {sys.argv[0]} <directory with books>')
+    catalog = Catalog()
+    started = time.perf_counter()
+    print(catalog.scan(sys.argv[1]), f'in {time.perf_counter() - started:.2f}s, {len(catalog)} books in catalog')
@@ -1,564 +1,486 @@
+import codecs
 import json
+import os
+import sys
+import time
+import threading
 import tkinter
 
-import customtkinter as ctk
-from CTkMessagebox import CTkMessagebox
-from typing import List, Tuple, Generator
-from abc import ABC, abstractmethod
-from PIL import Image, ImageTk
-
+STARTED = time.perf_counter()  # before the heavy imports, startup time is measured from here
 
-class Cell(ABC):
+import customtkinter as ctk
+from typing import Dict, List, Tuple, Generator
+from contextlib import contextmanager
+from tkinter import ttk
+
+from icons import icons
+from cells import CELL_TYPES, creatable_cell_types, get_cell_type
+from cells.base import AutoWrappingCTkLabel, Cell, CellPool, wrap_manager
+from ibf_pack import PackedBook, is_packed, write_packed
+from journal import BookJournal
+from search import SearchHit, SearchIndex
+from sequence import IndexedSequence, SequenceNode
+from study import ReviewStore, StudyItem, StudyQueue
+from library import Catalog
+from html_export import book_title, export_document
+from latency import LatencyWatchdog
+from outline import Outline
+from tracing import tracer
+from document import Change, CellRecord, Document, record_from_dict
+
+
+def message_box(**kwargs):
     """
-    Base class for all cells in file
-
-    every instance of this class must realize _open_ and _edit_ methods that changes current layout
+    CTkMessagebox with the given options, use .get() on it to wait for the answer
     """
+    from CTkMessagebox import CTkMessagebox  # imported on first use, it isn't needed for reading books
+    return CTkMessagebox(**kwargs)
 
-    @abstractmethod
-    def __init__(self, data):
-        self.__data__: dict = data
-        self.view_frame: [ctk.CTkFrame, ctk.CTkScrollableFrame] = self._open_()  # showing data
-        self.edit_frame: [ctk.CTkFrame, ctk.CTkScrollableFrame] = None
-        self._render_()  # rendering data
-        ...
-
-    @abstractmethod
-    def _import_(self) -> dict:
-        """
-        returns formated tuple which will be saved into file
-        {
-            "cell_type": <type>,
-            "data": <data>
-        }
-        :return: dictionary
-        """
-
-    @abstractmethod
-    def _render_(self):
-        """
-        creates new view frame based on __data__
-        :return:
-        """
-        ...
 
-    @abstractmethod
-    def _save_(self):
-        """
-        saves  changes into file
-        :return:
-        """
-        ...
+class CellSlot(SequenceNode):
+    """
+    view state of a single cell kept by Viewer for the whole book
 
-    @abstractmethod
-    def _open_(self) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
-        """
-        changes current layout to view mode and renders it again
+    widget is only built while the cell is in (or near) the viewport, height (the weight of the
+    slot in Viewer.cells) is an estimate until the widget has been measured at least once
+    """
+    __slots__ = ('record', 'widget', 'row')
 
-        :return: CTkFrame[Scrollable] object with rendered information ( rather not editable )
-        """
-        ...
+    def __init__(self, record: CellRecord):
+        super().__init__(get_cell_type(record.cell_type).estimate_height(record))
+        self.record: CellRecord = record
+        self.widget: Cell = None
+        self.row: int = None  # grid row the widget is currently placed in
 
-    @abstractmethod
-    def _edit_(self) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
-        """
-        changes current layout to edit mode
+    @property
+    def height(self) -> int:
+        return self.weight
 
-        :return:  CTkFrame[Scrollable] object allows to edit data in it
-        """
-        ...
 
+MAX_SPACER = 10000  # px, Tk can't lay out frames taller than ~32767 px, so the real frame stays well below
 
-class AutoWrappingCTkLabel(ctk.CTkLabel):
-    def __init__(self, master=None, **kwargs):
-        self.text = kwargs.pop("text", "")
-        super().__init__(master, **kwargs)
-        self.bind("<Configure>", self.on_resize)
-        self.configure(text=self.text)
-        self.update_wraplength()
 
-    def on_resize(self, event):
-        self.update_wraplength()
-
-    def update_wraplength(self):
-        current_width = int(self.winfo_width() / 1.2)
-        if current_width > 1:  # Avoid wraplength of 0
-            self.configure(wraplength=current_width)
+class Viewer(ctk.CTkScrollableFrame):
+    """
+    view over Document, keeps one CellSlot per record in the same order as document.cells
 
-    def set_text(self, new_text):
-        self.text = new_text
-        self.configure(text=self.text)
-        self.update_wraplength()
+    slots are kept in IndexedSequence, so finding the position of a cell, the cells at a scroll
+    offset and moving or deleting blocks of cells take O(log n) even in books of many thousands cells
 
+    positions of cells (weights of the slots) are virtual, the real frame holds only the built cells
+    between spacers of at most MAX_SPACER. The top of the frame is at virtual position _base, which
+    moves (and the view with it) whenever the top spacer would leave 0..MAX_SPACER, and the scrollbar
+    shows and sets virtual positions, so books of any length scroll from top to bottom
 
-class PlainTextCell(ctk.CTkFrame, Cell):
+    selection is a range of cells from selected_cell (clicked first, edits and new cells refer to it)
+    to selection_end (shift+clicked), moves and deletes apply to the whole range
+    """
 
-    def __init__(self, parent, data):
+    def __init__(self, parent, document: Document = None, virtualized: bool = True, overscan: float = 1.0):
         """
-        :param data: {"text": <some text> }
+        :param virtualized: if True only cells in or near the viewport have widgets built
+        :param overscan: how many viewport heights above and below the visible area are kept built
         """
         super().__init__(parent)
-        self.root = parent
-
-        self.configure()
-        self.__data__: dict = data
-        self.view_frame: [ctk.CTkFrame, ctk.CTkScrollableFrame] = None
-        self.edit_frame: [ctk.CTkFrame, ctk.CTkScrollableFrame] = None
-        self._render_()  # rendering data
-        self._open_()  # showing data
-
-    def _import_(self) -> dict:
-        return {"cell_type": "plain text", "data": self.__data__}
-
-    def on_click(self, event=None):
-        self.root.select_frame(self)
-
-    def _render_(self):
-        data = self.__data__
-
-        new_frame = ctk.CTkFrame(self, corner_radius=15, border_width=2)
-        new_frame.columnconfigure(0, weight=1)
-        new_frame.rowconfigure(0, weight=1)
-
-        if self.view_frame:
-            self.view_frame.destroy()
-            self.view_frame = None
-        self.view_frame = new_frame
-        self.view_frame.pack(fill='both', padx=2, pady=2)
-
-        text = data["text"]
-        text_frame = AutoWrappingCTkLabel(master=new_frame, text=text, font=('Arial', 20), justify='left', corner_radius=15)
-        text_frame.grid(row=0, column=0, sticky='NSEW')
-        text_frame.bind('<Double-Button-1>', self._edit_)
-        text_frame.bind("<Button-1>", self.on_click)
-
-    def _open_(self, event=None) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
-        # if self.edit_frame:
-        #     self.edit_frame.destroy()
-        if not self.view_frame:
-            self._render_()
-        if self.edit_frame:
-            self.edit_frame.destroy()
-            self.edit_frame = None
-        self.view_frame.tkraise()
-
-    def _save_(self):
-        new_text = self.entry_frame.get("0.0", "end")
-        self.__data__["text"] = new_text
-
-    def _edit_(self, event=None) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
-        data = self.__data__
-        new_frame = ctk.CTkFrame(self, corner_radius=8, border_width=2)
-        new_frame.columnconfigure(0, weight=1)
-        new_frame.rowconfigure(0, weight=1)
-
-        if self.edit_frame:
-            self.edit_frame.destroy()
-            self.edit_frame = None
-        if self.view_frame:
-            self.view_frame.destroy()
-            self.view_frame = None
-        self.edit_frame = new_frame
-        self.edit_frame.pack(fill='both', expand=True, side='top')
-
-        def exit_edit_mode(event=None):
-            self._save_()
-            self._open_()
-
-        self.entry_frame = ctk.CTkTextbox(new_frame, font=('Arial', 20), wrap='word')
-        self.entry_frame.insert('0.0', data["text"])
-        self.entry_frame.grid(row=0, column=0, sticky='NSEW')
-        self.entry_frame.bind('<Shift-Return>', exit_edit_mode)
-
-        self.edit_frame.tkraise()
-
-
-class QuizCell(ctk.CTkFrame, Cell):
-    def __init__(self, parent, data):
-        """
-        :param data: {"text": <some text>, "answers": [<answer1>, <answer2>, ...], "correct_answers": [<correct1>, <correct2>, ...] }
+        self.virtualized = virtualized
+        self.overscan = overscan
+        self.selected_cell: CellSlot = None  # currently selected cell
+        self.selection_end: CellSlot = None  # other end of the selected range
+
+        self.document: Document = None
+        self.cells: IndexedSequence = IndexedSequence()
+        self.slots: Dict[int, CellSlot] = {}  # id(record) -> its slot in cells
+        self.built: List[CellSlot] = []  # cells which have their widget currently built
+        self.pool = CellPool()  # widgets of cells which left the viewport, reused for the next ones
+        self._draw_job = None
+        self._batch_depth = 0
+        self._layout_pending = False
+        self._spacer_rows = [None, None]
+        self._spacer_heights = [None, None]
+        self._base = 0  # virtual position of the top of the frame
+        self._bottom_clipped = False  # bottom spacer is shorter than the cells below the built ones
+        self._target: float = None  # virtual position the view is going to be moved to after layout
+
+        self.columnconfigure(0, weight=99)
+        # spacers are standing in for cells above and below the built ones
+        self.top_spacer = ctk.CTkFrame(self, height=0, fg_color='transparent')
+        self.bottom_spacer = ctk.CTkFrame(self, height=0, fg_color='transparent')
+
+        # every scroll (scrollbar, mouse wheel, resize) ends up in yscrollcommand
+        self._parent_canvas.configure(yscrollcommand=self._on_scroll)
+        self._scrollbar.configure(command=self._on_scrollbar)
+        self.set_document(document if document is not None else Document())
+
+    @property
+    def selected_frame(self) -> ctk.CTkFrame:
+        return self.selected_cell.widget if self.selected_cell else None
+
+    def set_document(self, document: Document):
         """
-        super().__init__(parent)
-        self.bind("<Button-1>", self.on_click)
-        self.configure()
-        self.__data__ = data
-        self.view_frame = None
-        self.edit_frame = None
-        self.answer_vars = []
-        self._render_()  # rendering data
-        self._open_()  # showing data
-
-    def _import_(self) -> dict:
-        return {"cell_type": "quiz", "data": self.__data__}
-
-    def on_click(self, event=None):
-        self.master.select_frame(self)
-
-    def _render_(self):
-        if self.view_frame:
-            self.view_frame.pack_forget()
-
-        data = self.__data__
-
-        new_frame = ctk.CTkFrame(self, corner_radius=8, width=500, height=300)
-        new_frame.columnconfigure(0, weight=1)
-        new_frame.bind("<Button-1>", self.on_click)
-        self.view_frame = new_frame
-        self.view_frame.pack(fill='both', expand=True, pady=2, padx=2)
-
-        # Display the question text
-        question_text = data["text"]
-        question_label = ctk.CTkLabel(new_frame, text=question_text, font=('Arial', 20))
-        question_label.bind("<Button-1>", self.on_click)
-        question_label.grid(row=0, column=0, sticky='W', padx=10, pady=5)
-
-        # Display the answers with checkboxes
-        answers = data.get("answers", [])
-        self.answer_vars = []
-        for idx, answer in enumerate(answers):
-            answer_var = ctk.StringVar(value="")
-            self.answer_vars.append(answer_var)
-            answer_checkbox = ctk.CTkCheckBox(new_frame, text=answer, variable=answer_var, onvalue=answer, offvalue="",
-                                              font=('Arial', 20))
-            answer_checkbox.grid(row=idx + 1, column=0, padx=20, pady=2, sticky='W')
-
-        # Add a button to check answers
-        check_button = ctk.CTkButton(new_frame, text="Check Answer", command=self.check_answer)
-        check_button.grid(row=len(answers) + 1, column=0, pady=10)
-
-        # Bind double-click event
-        new_frame.bind("<Double-Button-1>", self._edit_)
-
-    def _open_(self):
-        self.view_frame.tkraise()
-
-    def _save_(self):
-        # Save edited data
-        new_question_text = self.question_entry.get()
-        new_answers = []
-        new_correct_answers = []
-
-        for entry, checkbox in zip(self.answer_entries, self.correct_checkboxes):
-            answer = entry.get()
-            if answer:
-                new_answers.append(answer)
-                if checkbox.get():
-                    new_correct_answers.append(answer)
-
-        self.__data__['text'] = new_question_text
-        self.__data__['answers'] = new_answers
-        self.__data__['correct_answers'] = new_correct_answers
-
-        self.edit_frame.pack_forget()
-        self._render_()
-
-    def _edit_(self, event=None):
-        if self.edit_frame:
-            self.edit_frame.pack_forget()
-
-        new_frame = ctk.CTkScrollableFrame(self, corner_radius=8, border_width=2, width=500,
-                                           height=300)  # Adjust size as needed
-        self.edit_frame = new_frame
-        self.edit_frame.pack(expand=True, fill='both')
-
-        # Display editable question
-        self.question_entry = ctk.CTkEntry(new_frame, width=400)
-        self.question_entry.insert(0, self.__data__['text'])
-        self.question_entry.grid(row=0, column=0, columnspan=3, padx=10, pady=5)
-
-        # Display editable answers
-        self.answer_entries = []
-        self.correct_checkboxes = []
-        answers = self.__data__.get("answers", [])
-        correct_answers = self.__data__.get("correct_answers", [])
-        for idx, answer in enumerate(answers):
-            self._add_answer_row(new_frame, idx, answer, answer in correct_answers)
-
-        # Add button to save changes
-        save_button = ctk.CTkButton(new_frame, text="Save", command=self._save_)
-        save_button.grid(row=len(answers) + 1, column=0, pady=10)
-
-        # Add button to add a new answer
-        add_answer_button = ctk.CTkButton(new_frame, text="Add Answer", command=self._add_new_answer)
-        add_answer_button.grid(row=len(answers) + 2, column=0, pady=10)
-
-    def _add_answer_row(self, frame, idx, answer_text='', is_correct=False):
-        answer_entry = ctk.CTkEntry(frame)
-        answer_entry.insert(0, answer_text)
-        answer_entry.grid(row=idx + 1, column=0, padx=10, pady=2, sticky='W')
-        self.answer_entries.append(answer_entry)
-
-        correct_var = ctk.BooleanVar(value=is_correct)
-        correct_checkbox = ctk.CTkCheckBox(frame, variable=correct_var, text="Correct")
-        correct_checkbox.grid(row=idx + 1, column=1, padx=10, pady=2, sticky='W')
-        self.correct_checkboxes.append(correct_checkbox)
-
-        # Add delete button for each answer
-        delete_button = ctk.CTkButton(frame, text="Delete", command=lambda: self._delete_answer_row(frame, idx))
-        delete_button.grid(row=idx + 1, column=2, padx=10, pady=2, sticky='W')
-
-    def _delete_answer_row(self, frame, idx):
-        self.answer_entries[idx].grid_forget()
-        self.correct_checkboxes[idx].grid_forget()
-        self.answer_entries.pop(idx)
-        self.correct_checkboxes.pop(idx)
-
-        # Adjust remaining rows
-        for i in range(idx, len(self.answer_entries)):
-            self.answer_entries[i].grid_configure(row=i + 1)
-            self.correct_checkboxes[i].grid_configure(row=i + 1)
-
-        # Redraw the save and add answer buttons
-        self._redraw_save_and_add_buttons()
-
-    def _add_new_answer(self):
-        idx = len(self.answer_entries)
-        self._add_answer_row(self.edit_frame, idx)
-
-        # Redraw the save and add answer buttons
-        self._redraw_save_and_add_buttons()
-
-    def _redraw_save_and_add_buttons(self):
-        # Remove existing buttons
-        for widget in self.edit_frame.grid_slaves():
-            if int(widget.grid_info()["row"]) >= len(self.answer_entries) + 1:
-                widget.grid_forget()
-
-        # Add button to save changes
-        save_button = ctk.CTkButton(self.edit_frame, text="Save", command=self._save_)
-        save_button.grid(row=len(self.answer_entries) + 1, column=0, pady=10)
-
-        # Add button to add a new answer
-        add_answer_button = ctk.CTkButton(self.edit_frame, text="Add Answer", command=self._add_new_answer)
-        add_answer_button.grid(row=len(self.answer_entries) + 2, column=0, pady=10)
-
-    def check_answer(self):
-        # Get the selected answers
-        selected_answers = [var.get() for var in self.answer_vars if var.get()]
-        correct_answers = self.__data__.get("correct_answers", [])
-
-        # Check if the selected answers match the correct answers
-        if set(selected_answers) == set(correct_answers):
-            result_text = "Correct!!!"
-            result_color = "#00FF00"
-        else:
-            result_text = "Incorrect!"
-            result_color = "#FF0000"
-
-        # Display result
-        result_label = ctk.CTkLabel(self.view_frame, text=result_text, font=('Arial', 20), text_color=result_color)
-        result_label.grid(row=len(self.answer_vars) + 2, column=0, pady=10)
-
-
-class FlashCard(ctk.CTkFrame):
-    def __init__(self, parent, data):
-        super().__init__(parent, fg_color='transparent')
-        self.__data__ = data
-        self.card_color = data["color"]
-
-        self.current_side = 'front'  # Flag to track if currently showing back side
-
-        # front side
-        self.front_text = data["front"]
-        self.front_label = AutoWrappingCTkLabel(self, text=self.front_text, font=('Arial', 20), width=175,
-                                                height=300, fg_color=self.card_color, corner_radius=15)
-        self.front_label.pack(fill='both', expand=True, padx=5, pady=5)
-        self.front_label.bind('<Button-1>', self.flip)
-
-        # back side  (initially hidden)
-        self.back_text = data["back"]
-        self.back_label = AutoWrappingCTkLabel(self, text=self.back_text, font=('Arial', 20), width=175,
-                                               height=300, fg_color=self.card_color, corner_radius=15)
-        self.back_label.bind('<Button-1>', self.flip)
-
-    def flip(self, event=None):
-        if self.current_side == 'front':
-            self.front_label.pack_forget()
-            self.back_label.pack(fill='both', expand=True, padx=5, pady=5)
+        starts showing another document
+        """
+        if self.document is not None:
+            self.document.unsubscribe(self._on_document_change)
+        self.document = document
+        document.subscribe(self._on_document_change)
+        self._on_document_change(Change('load', 0, len(document)))
+
+    def _on_document_change(self, change: Change):
+        match change.kind:
+            case 'load':
+                for slot in self.built:
+                    self._destroy_widget(slot)
+                self.built = []
+                self.selected_cell = self.selection_end = None
+                self.slots = {id(record): CellSlot(record) for record in self.document}
+                self.cells = IndexedSequence(self.slots.values())
+                self._base = 0
+                self._target = None
+                self._parent_canvas.yview_moveto(0)
+            case 'insert':
+                new_records = self.document[change.index:change.index + change.count]
+                new_slots = [CellSlot(record) for record in new_records]
+                self.slots.update((id(slot.record), slot) for slot in new_slots)
+                self.cells.insert(change.index, new_slots)
+            case 'delete':
+                removed = self.cells.delete(change.index, change.count)
+                for slot in removed:
+                    self._destroy_widget(slot)
+                    del self.slots[id(slot.record)]
+                if self.selected_cell is not None and self.selected_cell not in self.cells:
+                    self.selected_cell = self.selection_end = None
+                elif self.selection_end is not None and self.selection_end not in self.cells:
+                    self.selection_end = self.selected_cell
+                removed_ids = {id(slot) for slot in removed}
+                self.built = [slot for slot in self.built if id(slot) not in removed_ids]
+            case 'move':
+                self.cells.move(change.old_index, change.index, change.count)
+            case 'update':
+                return  # widgets update themselves, layout is fixed by the next measure
+        self._relayout()
+
+    @contextmanager
+    def batch(self):
+        """
+        groups many structural edits together, layout is done once in an idle callback
+        after the outermost batch ends
 
+            with viewer.batch():
+                for record in pasted_records:
+                    ...
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth and self._layout_pending:
+                self._schedule_draw()
+
+    def _relayout(self):
+        """
+        lays out cells after a structural edit, deferred if a batch is open
+        """
+        if self._batch_depth:
+            self._layout_pending = True
         else:
-            self.back_label.pack_forget()
-            self.front_label.pack(fill='both', expand=True, padx=5, pady=5)
-
-        self.current_side = 'front' if self.current_side == 'back' else 'back'
-
+            self.__draw__()
 
-class FlashcardCell(ctk.CTkFrame, Cell):
-    def __init__(self, parent, data):
+    def insert_cells(self, index: int, records: List[CellRecord]):
         """
-        :param data: [{"front": <front side text>, "back": <back side text>, "color": <color>}, ...]
+        inserts many records before index with a single layout pass
         """
-        super().__init__(parent, height=230)
-        self.bind("<Double-Button-1>", self._edit_)
-        self.bind("<Button-1>", self.on_click)
-        self.__data__ = data
-
-        self.view_frame = None
-        self.edit_frame = None
-
-        self._render_()  # Rendering data
-        self._open_()  # Showing data
-
-    def on_click(self, event=None):
-        self.master.select_frame(self)
-
-    def _import_(self) -> dict:
-        return {"cell_type": "flash cards", "data": self.__data__}
-
-    def _render_(self):
-
-        if self.view_frame:  # deleting old frame
-            self.view_frame.destroy()
-
-        new_frame = ctk.CTkFrame(self, corner_radius=15, width=125, height=225)
-        new_frame.bind("<Double-Button-1>", self._edit_)
-        new_frame.bind("<Button-1>", self.on_click)
-        self.view_frame = new_frame
+        with self.batch():
+            self.document.insert_many(index, records)
 
-        data = self.__data__
-        self.cards = []
-
-        for i, card_data in enumerate(data):
-            self.cards.append(FlashCard(self.view_frame, card_data))
-            self.cards[-1].grid(row=0, column=i, pady=2, padx=5, sticky='NS')
-
-    def _open_(self):
-        if self.edit_frame:
-            self.edit_frame.destroy()
-
-        self.view_frame.pack(fill='both', expand=True, pady=2, padx=2)
-
-    def _edit_(self, event=None):
-        pass
-
-    def _save_(self, new_front, new_back):
-        self.__data__["front"] = new_front
-        self.__data__["back"] = new_back
-        if self.edit_frame:
-            self.edit_frame.destroy()
-        self._render_()
-        self._open_()
-
-    def _delete_(self):
-        self.parent.remove_flashcard(self)
-        if self.edit_frame:
-            self.edit_frame.destroy()
-
-
-class Viewer(ctk.CTkScrollableFrame):
+    def selected_range(self) -> Tuple[int, int]:
+        """
+        :return: (first, last) indexes of selected cells, last is exclusive, (0, 0) if nothing is selected
+        """
+        if not self.selected_cell:
+            return 0, 0
+        start = self.cells.index(self.selected_cell)
+        end = self.cells.index(self.selection_end) if self.selection_end is not self.selected_cell else start
+        return min(start, end), max(start, end) + 1
 
-    def __init__(self, parent):
-        super().__init__(parent)
-        self.selected_frame: ctk.CTkFrame = None  # currently selected frame
+    def index_of(self, record: CellRecord) -> int:
+        """
+        position of the record in the document in O(log n), raises ValueError if it isn't there
+        """
+        slot = self.slots.get(id(record))
+        if slot is None or slot.record is not record:
+            raise ValueError('record is not in the document')
+        return self.cells.index(slot)
+
+    def _insert_cell(self, record: CellRecord):
+        if not self.selected_cell:
+            self.document.append(record)
+        else:
+            self.document.insert(self.selected_range()[1], record)
 
-        self.cells: List[Cell] = []
-        self.__draw__()
+    def move_selection(self, new_index: int):
+        """
+        moves selected cells so the first of them ends up at new_index, cells stay selected
+        """
+        first, last = self.selected_range()
+        if first == last:
+            return
+        new_index = max(0, min(new_index, len(self.cells) - (last - first)))
+        self.document.move(first, new_index, last - first)
 
     def shift_cell_down(self, event=None):
-        if not self.selected_frame:
+        if not self.selected_cell:
             return
 
-        selected_index = self.cells.index(self.selected_frame)
-        before, after = self.cells[:selected_index], self.cells[selected_index + 1:]
-        if not after:
+        first, last = self.selected_range()
+        if last >= len(self.cells):
             return
-        else:
-            after.insert(1, self.selected_frame)
-        self.cells = before + after
-        self.__draw__()
+        self.move_selection(first + 1)
 
     def shift_cell_up(self, event=None):
-        if not self.selected_frame:
+        if not self.selected_cell:
             return
 
-        selected_index = self.cells.index(self.selected_frame)
-        before, after = self.cells[:selected_index], self.cells[selected_index + 1:]
-        if not before:
-            return
-        else:
-            before.insert(-1, self.selected_frame)
-        self.cells = before + after
-        self.__draw__()
-
-    def create_text_cell(self, event=None):
-        if not self.selected_frame:
-            self.cells.append(PlainTextCell(self, {"text": ""}))
-            self.__draw__()
+        first, last = self.selected_range()
+        if not first:
             return
+        self.move_selection(first - 1)
 
-        selected_index = self.cells.index(self.selected_frame)
-        self.cells.insert(selected_index + 1, PlainTextCell(self, {"text": ""}))
-        self.__draw__()
-        return
-
-    def create_quiz_cell(self, event=None):
-        if not self.selected_frame:
-            self.cells.append(QuizCell(self, {"text": "Question", "answers": ["A", "B", "C", "D"],
-            "correct_answers": []}))
-            self.__draw__()
-            return
-
-        selected_index = self.cells.index(self.selected_frame)
-        self.cells.insert(selected_index + 1, QuizCell(self, {"text": "Question", "answers": ["A", "B", "C", "D"],
-            "correct_answers": []}))
-        self.__draw__()
-        return
+    def create_cell(self, cell_type: str):
+        """
+        inserts new cell of the registered type after the selected one
+        """
+        record = get_cell_type(cell_type).widget.new_record(self)
+        if record is not None:
+            self._insert_cell(record)
 
     def remove_cell(self, event=None):
-        if not self.selected_frame:
+        if not self.selected_cell:
             return
 
-        selected_index = self.cells.index(self.selected_frame)
-        msg_box = CTkMessagebox(title="Delete?", message="Do you want to delete this cell?",
-                        icon="question", option_1="No", option_2="Yes")
+        first, last = self.selected_range()
+        message = "Do you want to delete this cell?" if last - first == 1 else \
+            f"Do you want to delete {last - first} cells?"
+        msg_box = message_box(title="Delete?", message=message,
+                              icon="question", option_1="No", option_2="Yes")
         response = msg_box.get()
         if response == "Yes":
-            self.selected_frame.grid_forget()
-            self.selected_frame.destroy()
-            self.cells.remove(self.selected_frame)
-            self.selected_frame = None
-        self.__draw__()
+            self.document.delete(first, last - first)
         return
 
-    def create_img_cell(self, event=None):
+    def _visible_range(self) -> Tuple[int, int]:
+        """
+        :return: (first, last) indexes of cells that should have widgets built, last is exclusive
+        """
+        if not self.virtualized:
+            return 0, len(self.cells)
 
-        filename = ctk.filedialog.askopenfilename( title="Select a file",
-                                                   filetypes=(("Image format", "*.png"), ("All files", "*.*")))
+        view_height = self._view_height()
+        view_top = self._view_top()
+        top = view_top - view_height * self.overscan
+        bottom = view_top + view_height * (1 + self.overscan)
 
-        if not self.selected_frame:
-            self.cells.append(ImageCell(self, {"path": filename}))
-            self.__draw__()
+        first = self.cells.bisect_weight(top)
+        last = self.cells.bisect_weight(bottom, right=False) + 1
+        return first, min(last, len(self.cells))
+
+    def _view_height(self) -> int:
+        canvas = self._parent_canvas
+        return max(canvas.winfo_height(), canvas.winfo_reqheight())
+
+    def _view_top(self) -> float:
+        """
+        virtual position of the top of the viewport
+        """
+        if self._target is not None:
+            return self._target
+        return self._parent_canvas.canvasy(0) + self._base
+
+    def _build_widget(self, slot: CellSlot):
+        slot.widget = self.pool.acquire(get_cell_type(slot.record.cell_type).widget, self, slot.record)
+        first, last = self.selected_range()
+        if first < last and first <= self.cells.index(slot) < last:
+            slot.widget.configure(border_width=2, border_color='#5584e0')
+
+    def _destroy_widget(self, slot: CellSlot):
+        if slot.widget:
+            slot.widget.grid_forget()
+            self.pool.release(slot.widget)
+            slot.widget = None
+        slot.row = None
+
+    def _is_pinned(self, slot: CellSlot) -> bool:
+        # selected cell and cells being edited keep their widgets, otherwise unsaved edits would be lost
+        edit_frame = slot.widget.edit_frame
+        return slot is self.selected_cell or bool(edit_frame and edit_frame.winfo_exists() and edit_frame.winfo_manager())
+
+    def __draw__(self):
+        """
+        lays out cells incrementally, only rows whose position changed are gridded again
+        """
+        self._layout_pending = False
+        first, last = self._visible_range()
+        wanted = self.cells[first:last]
+        wanted_ids = {id(slot) for slot in wanted}
+
+        # releasing widgets of cells that left the viewport
+        still_built = []
+        for slot in self.built:
+            if id(slot) in wanted_ids:
+                continue
+            if slot.widget and self._is_pinned(slot) and slot in self.cells:
+                if slot.row is not None:
+                    slot.widget.grid_forget()
+                    slot.row = None
+                still_built.append(slot)
+            else:
+                self._destroy_widget(slot)
+
+        for cell_num, slot in enumerate(wanted, start=first):
+            if not slot.widget:
+                self._build_widget(slot)
+            if slot.row is None:
+                slot.widget.grid(row=cell_num + 1, column=0, sticky='WE', pady=5)
+            elif slot.row != cell_num + 1:
+                slot.widget.grid_configure(row=cell_num + 1)
+            slot.row = cell_num + 1
+        self.built = still_built + wanted
+
+        above = self.cells.weight_before(first)
+        below = self.cells.total_weight - above - sum(slot.height for slot in wanted)
+        if self.virtualized:
+            if not 0 <= above - self._base <= MAX_SPACER:
+                # frame is moved, the view has to stay at the same virtual position
+                if self._target is None:
+                    self._target = self._view_top()
+                self._base = max(0, above - MAX_SPACER // 2)
+            self._bottom_clipped = below > MAX_SPACER
+            below = min(below, MAX_SPACER)
+        self._place_spacer(0, self.top_spacer, 0, above - self._base)
+        self._place_spacer(1, self.bottom_spacer, len(self.cells) + 1, below)
+
+        self.after_idle(self._measure_built)
+        if self._target is not None:
+            self.after_idle(self._apply_target)
+
+    def _apply_target(self):
+        """
+        moves the view to _target once the built cells have been laid out
+        """
+        target, self._target = self._target, None
+        canvas = self._parent_canvas
+        region = canvas.bbox("all")
+        if target is None or not region or not len(self.cells):
             return
+        # cell at the target is positioned by its widget, heights above it may still be estimates
+        index = min(self.cells.bisect_weight(target), len(self.cells) - 1)
+        slot = self.cells[index]
+        offset = target - self.cells.weight_before(index)
+        if slot.widget and slot.widget.winfo_exists() and slot.row is not None:
+            y = slot.widget.winfo_y() + offset
+        else:
+            y = target - self._base
+        canvas.configure(scrollregion=region)
+        canvas.yview_moveto(y / max(region[3] - region[1], 1))
+
+    def _place_spacer(self, num: int, spacer: ctk.CTkFrame, row: int, height: int):
+        if self._spacer_heights[num] != height:
+            spacer.configure(height=self._reverse_widget_scaling(height))
+            self._spacer_heights[num] = height
+        if self._spacer_rows[num] != row:
+            spacer.grid(row=row, column=0)
+            self._spacer_rows[num] = row
+
+    def _measure_built(self):
+        # replacing estimated heights with real ones
+        for slot in self.built:
+            if slot.widget and slot.widget.winfo_ismapped():
+                height = slot.widget.winfo_height() + 10  # + pady
+                if height != slot.height:
+                    self.cells.set_weight(slot, height)
+
+    def _on_scroll(self, first, last):
+        if self._base or self._bottom_clipped:
+            # real fractions of the frame are turned into virtual ones of the whole book
+            region = self._parent_canvas.bbox("all")
+            height = region[3] - region[1] if region else 0
+            total = max(self.cells.total_weight, 1)
+            first = min(max((float(first) * height + self._base) / total, 0), 1)
+            last = min(max((float(last) * height + self._base) / total, 0), 1)
+        self._scrollbar.set(first, last)
+        wrap_manager.refresh()  # labels scrolled into view may still wait for wrapping
+        if self.virtualized:
+            self._schedule_draw()
+
+    def _on_scrollbar(self, command: str, *args):
+        if command == 'moveto' and self.virtualized and (self._base or self._bottom_clipped):
+            # dragged to a virtual position, cells there are built first
+            self._target = min(max(float(args[0]), 0), 1) * self.cells.total_weight
+            self._schedule_draw()
+        else:
+            self._parent_canvas.yview(command, *args)
 
-        selected_index = self.cells.index(self.selected_frame)
-        self.cells.insert(selected_index + 1, ImageCell(self, {"path": filename}))
+    def _schedule_draw(self):
+        if self._draw_job is None:
+            self._draw_job = self.after_idle(self._scheduled_draw)
+
+    def _scheduled_draw(self):
+        self._draw_job = None
+        if self._batch_depth:
+            self._layout_pending = True
+            return
         self.__draw__()
-        return
-    def __draw__(self):
-        [cell.grid_forget() for cell in self.cells]
-        for cell_num, cell in enumerate(self.cells):
-            self.columnconfigure(0, weight=99)
-            self.rowconfigure(0, weight=99)
-            cell.grid(row=cell_num, column=0, sticky='WE', pady=5)
 
-    def select_frame(self, frame: ctk.CTkFrame):
-        if self.selected_frame:
-            self.selected_frame.configure(border_width=0)  # unselect previous one ( delete boarding)
-        self.selected_frame = frame
+    def select_frame(self, frame: ctk.CTkFrame, extend: bool = False):
+        """
+        :param extend: selects the range from the selected cell to frame (shift+click)
+        """
+        slot = next(slot for slot in self.built if slot.widget is frame)
+        if extend and self.selected_cell:
+            self.selection_end = slot
+        else:
+            self.selected_cell = self.selection_end = slot
 
-        frame.configure(border_width=2, border_color='#5584e0')
+        # only built cells have borders to update, cells built later get theirs in _build_widget
+        first, last = self.selected_range()
+        for built in self.built:
+            if built.widget:
+                selected = first <= self.cells.index(built) < last
+                built.widget.configure(border_width=2 if selected else 0, border_color='#5584e0')
 
-    def save_file(self, event=None):
-        filename = ctk.filedialog.asksaveasfile().name
-        if not filename:
+    def scroll_to(self, index: int, select: bool = True):
+        """
+        scrolls so the cell at index is at the top of the viewport, building it if needed
+        """
+        if not 0 <= index < len(self.cells):
             return
+        slot = self.cells[index]
+        self._target = self.cells.weight_before(index)
+        self.__draw__()  # view is moved to the built cell in _apply_target
+        if select and slot.widget:
+            self.select_frame(slot.widget)
 
-        file_data = []
-        for cell in self.cells:
-            file_data.append(cell._import_())
+    def save_file(self, event=None) -> str:
+        """
+        asks for a file name and writes the whole document there
+
+        :return: chosen file name ('' if cancelled)
+        """
+        filename = ctk.filedialog.asksaveasfilename(filetypes=(("Open interactive book format", "*.ibf"),
+                                                               ("Packed interactive book format", "*.ibfp")))
+        if not filename:
+            return filename
 
-        with open(filename, 'w') as file:
-            json.dump(file_data, file, indent=4)
+        try:
+            if filename.endswith('.ibfp'):
+                write_packed(filename, self.document.cells, source=self.document.pack)
+            else:
+                self.document.save(filename)
+        except (OSError, ValueError, TypeError) as e:
+            # e.g. an image of the book which is going to be packed is gone, the file is left as it was
+            message_box(title="Save failed", message=f"Can't save {filename}:\n{e}", icon="cancel")
+            return ''
+        return filename
 
 
 class UpperMenu(ctk.CTkFrame):
@@ -574,90 +496,450 @@ class UpperMenu(ctk.CTkFrame):
         viewer = self.master.viewer
         app = self.master
 
-        load_texture = ctk.CTkImage(dark_image=Image.open('open.png'))
+        load_texture = icons.get('open')
         self.open_button = ctk.CTkButton(self, image=load_texture, text="", width=32, fg_color='transparent')
         self.open_button.pack(side='left', fill='y')
         self.open_button.bind('<Button-1>', app.open_file)
 
-        save_texture = ctk.CTkImage(dark_image=Image.open('save.png'))
+        save_texture = icons.get('save')
         self.save_button = ctk.CTkButton(self, image=save_texture, text="", width=32, fg_color='transparent')
         self.save_button.pack(side='left', fill='y')
-        self.save_button.bind('<Button-1>', viewer.save_file)
-
-        trash_bin_texture = ctk.CTkImage(dark_image=Image.open('trash_bin.png'))
+        self.save_button.bind('<Button-1>', app.save_file)
+        self.save_button.bind('<Button-3>', app.save_file_as)
+
+        self.search_entry = ctk.CTkEntry(self, placeholder_text="Search", width=200)
+        self.search_entry.pack(side='left', padx=10)
+        self.search_entry.bind('<KeyRelease>', app.on_search_typed)
+        self.search_entry.bind('<Return>', app.next_search_hit)
+        self.search_result_label = ctk.CTkLabel(self, text="")
+        self.search_result_label.pack(side='left')
+
+        self.study_button = ctk.CTkButton(self, text="Study", width=60, command=app.open_study)
+        self.study_button.pack(side='left', padx=10)
+        self.library_button = ctk.CTkButton(self, text="Library", width=60, command=app.open_library)
+        self.library_button.pack(side='left')
+        self.export_button = ctk.CTkButton(self, text="Export", width=60, command=app.export_html)
+        self.export_button.pack(side='left', padx=10)
+
+        trash_bin_texture = icons.get('trash_bin')
         self.delete_button = ctk.CTkButton(self, image=trash_bin_texture, text="", width=32, fg_color='transparent')
         self.delete_button.pack(side='right', fill='y')
         self.delete_button.bind('<Button-1>', viewer.remove_cell)
 
-        down_arrow_texture = ctk.CTkImage(dark_image=Image.open('down_arrow.png'))
+        down_arrow_texture = icons.get('down_arrow')
         self.down_arrow_button = ctk.CTkButton(self, image=down_arrow_texture, text="", width=32,
                                                fg_color='transparent')
         self.down_arrow_button.pack(side='right', fill='y')
         self.down_arrow_button.bind('<Button-1>', viewer.shift_cell_down)
 
-        upper_arrow_texture = ctk.CTkImage(dark_image=Image.open('uppper_arrow.png'))
+        upper_arrow_texture = icons.get('up_arrow')
         self.upper_arrow_button = ctk.CTkButton(self, image=upper_arrow_texture, text="", width=32,
                                                 fg_color='transparent')
         self.upper_arrow_button.pack(side='right', fill='y')
         self.upper_arrow_button.bind('<Button-1>', viewer.shift_cell_up)
 
-        image_texture = ctk.CTkImage(dark_image=Image.open('image.png'))
-        self.add_image_button = ctk.CTkButton(self, image=image_texture, text="", width=32, fg_color='transparent')
-        self.add_image_button.pack(side='right', fill='y')
-        self.add_image_button.bind('<Button-1>', viewer.create_img_cell)
-
-        quiz_texture = ctk.CTkImage(dark_image=Image.open('quiz.png'))
-        self.add_quiz_button = ctk.CTkButton(self, image=quiz_texture, text="", width=32, fg_color='transparent')
-        self.add_quiz_button.pack(side='right', fill='y')
-        self.add_quiz_button.bind('<Button-1>', viewer.create_quiz_cell)
+        # one button for every registered cell type which can be created, packed from the right
+        self.add_cell_buttons = {}
+        for cell_type in reversed(creatable_cell_types()):
+            texture = icons.get(cell_type.icon)
+            button = ctk.CTkButton(self, image=texture, text="", width=32, fg_color='transparent')
+            button.pack(side='right', fill='y')
+            button.bind('<Button-1>', lambda event, tag=cell_type.tag: viewer.create_cell(tag))
+            self.add_cell_buttons[cell_type.tag] = button
 
-        text_texture = ctk.CTkImage(dark_image=Image.open('text.png'))
-        self.add_text_button = ctk.CTkButton(self, image=text_texture, text="", width=32, fg_color='transparent')
-        self.add_text_button.pack(side='right', fill='y')
-        self.add_text_button.bind('<Button-1>', viewer.create_text_cell)
 
+class StudyWindow(ctk.CTkToplevel):
+    """
+    reviews due flashcards of the queue one by one, answers are graded by the user
+    """
+    GRADES = (("Again", 1), ("Hard", 3), ("Good", 4), ("Easy", 5))
+    SAVE_EVERY = 20  # grades between saves of the review state
 
-class ImageCell(ctk.CTkFrame, Cell):
+    def __init__(self, parent, queue: StudyQueue):
+        super().__init__(parent)
+        self.title("Study")
+        self.geometry('500x400')
+        self.queue = queue
+        self.item: StudyItem = None
+        self._unsaved = 0
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        self.due_label = ctk.CTkLabel(self, text="")
+        self.due_label.grid(row=0, column=0, pady=5)
+        self.card_label = AutoWrappingCTkLabel(self, text="", font=('Arial', 20), corner_radius=15)
+        self.card_label.grid(row=1, column=0, sticky='NSEW', padx=10, pady=5)
+
+        self.answer_button = ctk.CTkButton(self, text="Show answer", command=self.show_answer)
+        self.grade_frame = ctk.CTkFrame(self, fg_color='transparent')
+        for column, (text, quality) in enumerate(self.GRADES):
+            button = ctk.CTkButton(self.grade_frame, text=text, width=80,
+                                   command=lambda quality=quality: self.grade(quality))
+            button.grid(row=0, column=column, padx=5)
+
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        self.show_next()
+
+    def show_next(self):
+        self.item = self.queue.next_due()
+        self.grade_frame.grid_forget()
+        if self.item is None:
+            self.due_label.configure(text="")
+            self.card_label.configure(fg_color='transparent')
+            self.card_label.set_text("No cards are due, come back later")
+            self.answer_button.grid_forget()
+            return
+        self.due_label.configure(text=f"{self.queue.due_count()} cards due")
+        self.card_label.configure(fg_color=self.item.card.color)
+        self.card_label.set_text(self.item.card.front)
+        self.answer_button.grid(row=2, column=0, pady=10)
+
+    def show_answer(self):
+        self.card_label.set_text(f"{self.item.card.front}\n\n{self.item.card.back}")
+        self.answer_button.grid_forget()
+        self.grade_frame.grid(row=2, column=0, pady=10)
+
+    def grade(self, quality: int):
+        self.queue.grade(self.item, quality)
+        self._unsaved += 1
+        if self._unsaved >= self.SAVE_EVERY:
+            self.queue.save()
+            self._unsaved = 0
+        self.show_next()
+
+    def close(self):
+        self.queue.save()
+        self.destroy()
+
+
+class LibraryWindow(ctk.CTkToplevel):
+    """
+    browsing of the book catalog (see library.py), double click opens the book
+    """
+    COLUMNS = (("title", "Title", 300), ("cells", "Cells", 60), ("quiz_cells", "Quizzes", 60),
+               ("flashcards", "Cards", 60), ("image_cells", "Images", 60), ("path", "Path", 300))
+    MAX_ROWS = 2000  # rows shown at once, the filter narrows the rest down
 
-    def __init__(self, parent, data):
+    def __init__(self, parent, catalog: Catalog, on_open):
         """
-
-        :param parent:
-        :param data: {"path": <path to the image>}
+        :param on_open: called with the path of the book to open
         """
         super().__init__(parent)
-        self.__data__ = data
-        self.rowconfigure(0, weight=1)
+        self.title("Library")
+        self.geometry('900x600')
+        self.catalog = catalog
+        self.on_open = on_open
+        self._filter_job = None
+        self._scan_thread: threading.Thread = None
+        self._scan_progress = (0, 0)
+        self._scan_result = None
         self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        bar = ctk.CTkFrame(self, fg_color='transparent')
+        bar.grid(row=0, column=0, sticky='WE', padx=5, pady=5)
+        self.filter_entry = ctk.CTkEntry(bar, placeholder_text="Filter", width=250)
+        self.filter_entry.pack(side='left')
+        self.filter_entry.bind('<KeyRelease>', self._on_filter_typed)
+        self.scan_button = ctk.CTkButton(bar, text="Scan folder", width=100, command=self.choose_folder)
+        self.scan_button.pack(side='left', padx=10)
+        self.status_label = ctk.CTkLabel(bar, text="")
+        self.status_label.pack(side='left')
+
+        self.tree = ttk.Treeview(self, columns=[name for name, _, _ in self.COLUMNS], show='headings')
+        for name, heading, width in self.COLUMNS:
+            self.tree.heading(name, text=heading, command=lambda name=name: self.refresh(order=name))
+            self.tree.column(name, width=width, stretch=name in ('title', 'path'))
+        self.tree.grid(row=1, column=0, sticky='NSEW')
+        scrollbar = ctk.CTkScrollbar(self, command=self.tree.yview)
+        scrollbar.grid(row=1, column=1, sticky='NS')
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.bind('<Double-Button-1>', self._open_selected)
+
+        self.order = 'title'
+        self.refresh()
+
+    def refresh(self, order: str = None):
+        self._filter_job = None
+        self.order = order or self.order
+        books = self.catalog.books(self.filter_entry.get(), order=self.order, limit=self.MAX_ROWS + 1)
+        self.tree.delete(*self.tree.get_children())
+        for book in books[:self.MAX_ROWS]:
+            self.tree.insert('', 'end', iid=book['path'], values=[book[name] for name, _, _ in self.COLUMNS])
+        total = len(self.catalog)
+        shown = min(len(books), self.MAX_ROWS)
+        if not self.scanning:
+            self.status_label.configure(text=f"{shown} of {total} books" if len(books) > self.MAX_ROWS
+                                        else f"{shown} books")
+
+    def _on_filter_typed(self, event=None):
+        if self._filter_job:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(150, self.refresh)
+
+    def _open_selected(self, event=None):
+        selection = self.tree.selection()
+        if selection:
+            self.on_open(selection[0])
+
+    @property
+    def scanning(self) -> bool:
+        return self._scan_thread is not None
+
+    def choose_folder(self):
+        root = ctk.filedialog.askdirectory(title="Select a folder with books")
+        if root and not self.scanning:
+            self.scan(root)
+
+    def scan(self, root: str):
+        """
+        indexes books under root in background, the catalog has its own connection in the scanning thread
+        """
+        database = self.catalog.database
 
-        self.view_frame: ctk.CTkImage = None
-        self.edit_frame: ctk.CTkFrame = None
+        def scan():
+            catalog = Catalog(database)
+            try:
+                self._scan_result = catalog.scan(root, on_progress=lambda *progress: setattr(self, '_scan_progress',
+                                                                                                 progress))
+            except Exception as e:
+                self._scan_result = e
+            finally:
+                catalog.close()
+
+        self._scan_result = None
+        self._scan_thread = threading.Thread(target=scan, name='library-scan', daemon=True)
+        self._scan_thread.start()
+        self.scan_button.configure(state='disabled')
+        self._poll_scan()
+
+    def _poll_scan(self):
+        if self._scan_thread.is_alive():
+            done, total = self._scan_progress
+            self.status_label.configure(text=f"indexing {done}/{total}" if total else "looking for books")
+            self.after(100, self._poll_scan)
+            return
+        self._scan_thread = None
+        self.scan_button.configure(state='normal')
+        self.refresh()
+        result = self._scan_result
+        if isinstance(result, Exception):
+            self.status_label.configure(text=f"scan failed: {result}")
+        elif result:
+            self.status_label.configure(text=f"{result['indexed']} indexed, {result['removed']} removed, "
+                                             f"{result['errors']} unreadable")
+
+
+class CellStream:
+    """
+    parses cells of .ibf file one by one instead of loading the whole json array at once
 
-        self._render_()  # rendering data
-        self._open_()  # showing data
+        with open(filename, 'rb') as file:
+            for cell in CellStream(file):
+                ...
+    """
 
-    def _edit_(self) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
-        pass
+    def __init__(self, file, chunk_size: int = 1 << 16):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.bytes_read = 0  # for progress reporting
+
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read_more(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self.file.read(self.chunk_size)
+        self.bytes_read += len(chunk)
+        self._eof = not chunk
+        self._buffer = self._buffer[self._pos:] + self._text_decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+        return True
+
+    def _next_char(self) -> str:
+        """
+        skips whitespaces and returns next character without consuming it ('' at the end of file)
+        """
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos].isspace():
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read_more():
+                return ''
+
+    def __iter__(self) -> Generator[dict, None, None]:
+        if self._next_char() != '[':
+            raise ValueError('.ibf file must contain a list of cells')
+        self._pos += 1
+
+        if self._next_char() == ']':
+            return
+        while True:
+            if self._next_char() != '{':
+                raise ValueError('every cell must be a json object')
+            try:
+                cell, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._read_more():  # cell is cut by the end of the chunk
+                    continue
+                raise
+            self._pos = end
+            yield cell
+
+            separator = self._next_char()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError(f'unexpected {separator!r} between cells')
+            self._pos += 1
+
+
+class BookLoader:
+    """
+    loads .ibf (or packed .ibfp) file into Viewer progressively
 
-    def _open_(self) -> [ctk.CTkFrame, ctk.CTkScrollableFrame]:
-        self.view_frame.grid(row=0, column=0, padx=3, pady=3, sticky="SWEN")
+    first screenful of cells is shown right away, the rest is added in small time-budgeted
+    batches scheduled with after(), so the window stays responsive while loading. Every cell
+    becomes a record (packed books too), only images of packed books are read on demand
+    """
+
+    def __init__(self, viewer: 'Viewer', filename: str, budget_ms: int = 15,
+                 on_progress=None, on_finish=None):
+        """
+        :param budget_ms: how long a single batch may take
+        :param on_progress: called with loaded fraction (0..1) after every batch
+        :param on_finish: called with the loader when loading ends, is also called on error or cancel
+        """
+        self.viewer = viewer
+        self.filename = filename
+        self.budget_ms = budget_ms
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+
+        self.file_size = max(os.path.getsize(filename), 1)
+        self.document = Document()
+        self.loaded = 0
+        self.finished = False
+        self.cancelled = False
+        self.error: Exception = None
+
+        self._file = None
+        self._stream: CellStream = None
+        self._cells = None
+        self._job = None
+
+    def start(self):
+        if is_packed(self.filename):
+            # packed books have an index, images are extracted only when their cell gets built
+            self.document.pack = PackedBook(self.filename)
+            self._cells = self.document.pack.cells()
+        else:
+            self._file = open(self.filename, 'rb')
+            self._stream = CellStream(self._file)
+            self._cells = iter(self._stream)
+        self.viewer.set_document(self.document)
+
+        # first screenful is loaded synchronously
+        canvas = self.viewer._parent_canvas
+        self._step(fill_height=max(canvas.winfo_height(), canvas.winfo_reqheight()))
 
-    def on_click(self, event=None):
-        self.master.select_frame(self)
+    def cancel(self):
+        if self.finished:
+            return
+        self.cancelled = True
+        if self._job:
+            self.viewer.after_cancel(self._job)
+            self._job = None
+        self._finish()
+
+    @property
+    def progress(self) -> float:
+        if self.document.pack is not None:
+            return self.loaded / max(len(self.document.pack), 1)
+        return min(self._stream.bytes_read / self.file_size, 1.0)
+
+    def _step(self, fill_height: int = 0):
+        self._job = None
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        batch = []
+        height = 0
+        try:
+            for cell in self._cells:
+                # cells of unknown types are kept (and saved back) as they are
+                record = record_from_dict(cell, keep_unknown=True)
+                problems = record.validate()
+                if problems:  # e.g. text which isn't a string would break the viewer, search and outline
+                    raise ValueError(f'cell {self.loaded + len(batch)} ({record.cell_type}): {problems[0]}')
+                batch.append(record)
+                height += get_cell_type(record.cell_type).estimate_height(record)
+                if height >= fill_height and time.perf_counter() >= deadline:
+                    break
+            else:
+                self.finished = True
+        except Exception as e:
+            print(f'got {e} while reading file {self.filename}')
+            self.error = e
+            self.finished = True
+
+        try:
+            self.viewer.insert_cells(len(self.document), batch)
+        except Exception as e:  # an observer failed, loading ends like on a read error so the loader finishes
+            print(f'got {e} while showing cells of file {self.filename}')
+            self.error = e
+            self.finished = True
+        self.loaded += len(batch)
+        if self.on_progress:
+            self.on_progress(1.0 if self.finished else self.progress)
+
+        if self.finished:
+            self._finish()
+        else:
+            self._job = self.viewer.after(1, self._step)
 
-    def _render_(self):
-        img = Image.open(self.__data__['path'])
-        self.image_frame = ctk.CTkImage(dark_image=img, size=img.size)
-        self.view_frame = ctk.CTkFrame(self)
-        self.image_label = ctk.CTkLabel(self.view_frame, text="", image=self.image_frame)
-        self.image_label.bind('<Button-1>', self.on_click)
-        self.image_label.pack()
+    def _finish(self):
+        self.finished = True
+        if self._file:
+            self._file.close()
+            self._file = None
+        if self.on_finish:
+            self.on_finish(self)
 
-    def _save_(self):
-        pass
 
-    def _import_(self) -> dict:
-        return {"cell_type": "image", "data": self.__data__}
+def install_tracing():
+    """
+    wraps cell lifecycle, viewer operations, file I/O and image decoding in timing spans of tracing.tracer
+    """
+    import image_cache
+    import outline
+    import cells.image
+
+    # widget modules get imported here (instead of on first use) so their classes can be wrapped
+    tracer.instrument(Cell, ('_import_',), 'cell')
+    for cell_type in CELL_TYPES.values():
+        tracer.instrument(cell_type.widget, ('__init__', '_render_', '_open_', '_edit_', '_save_'), 'cell')
+    tracer.instrument(Viewer, ('set_document', 'insert_cells', 'move_selection', 'shift_cell_down', 'shift_cell_up',
+                               'create_cell', 'remove_cell', '_build_widget', '__draw__', 'scroll_to', 'save_file'),
+                      'viewer')
+    tracer.instrument(outline.Outline, ('_draw',), 'viewer')
+    tracer.instrument(BookLoader, ('start', '_step'), 'io')
+    tracer.instrument(CellStream, ('_read_more',), 'io')
+    tracer.instrument(Document, ('load', 'save', 'write_file_data'), 'io')
+    tracer.instrument(PackedBook, ('cell', 'to_document', 'media_file'), 'io')
+    tracer.instrument(BookJournal, ('save', 'replay', 'finish_compaction'), 'io')
+    tracer.instrument(sys.modules[__name__], ('write_packed',), 'io')
+    # decoding runs in worker threads, these spans show up on their own rows of the trace
+    tracer.instrument(image_cache, ('load_scaled',), 'image')
+    tracer.instrument(cells.image, ('scaled_size',), 'image')
+    tracer.instrument(outline, ('load_thumbnail',), 'image')
+
+
+COMPACTION_INTERVAL_MS = 60 * 1000
+LATENCY_LOG = os.environ.get('IBF_LATENCY')  # file the event loop latency histogram is saved to on exit
 
 
 class App(ctk.CTk):
@@ -665,6 +947,10 @@ class App(ctk.CTk):
     def __init__(self):
         self.window = super().__init__()
 
+        # measures how responsive the event loop is, started first so it sees callbacks of all widgets
+        self.watchdog = LatencyWatchdog(self)
+        self.watchdog.start()
+
         # gridding viewer
         viewer_coords = (1, 0)
         self.grid_columnconfigure(viewer_coords[1], weight=14)
@@ -679,51 +965,265 @@ class App(ctk.CTk):
         self.upper_menu = UpperMenu(self)
         self.upper_menu.grid(row=upper_menu_coords[0], column=upper_menu_coords[1], columnspan=2, sticky='SWEN', pady=5)
 
+        # gridding outline next to the viewer, clicking a cell there scrolls the viewer to it
+        self.outline = Outline(self, on_select=self.viewer.scroll_to)
+        self.outline.grid(row=viewer_coords[0], column=viewer_coords[1] + 1, sticky='NS', padx=(5, 0))
+        self.outline.attach(self.viewer.document)
+
+        # time from start of main.py until the window is first drawn
+        self.first_paint_ms: float = None
+        self._first_map = self.bind('<Map>', self._on_first_map, add='+')
+
+        # journaled saving of the currently opened file
+        self.journal: BookJournal = None
+        self.bind_all('<Control-s>', self.save_file)
+        self.bind_all('<Control-S>', self.save_file_as)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.after(COMPACTION_INTERVAL_MS, self._compaction_tick)
+
+        # full text search over the opened document
+        self.search_index = SearchIndex(self.viewer.document)
+        self.search_hits: List[SearchHit] = []
+        self.search_hit_num = 0
+        self._search_job = None
+
+        self.library_window: LibraryWindow = None
+        self._export_thread: threading.Thread = None
+
+        # loading progress (gridded only while a file is being loaded)
+        self.loader: BookLoader = None
+        self.load_bar_frame = ctk.CTkFrame(self, fg_color='transparent')
+        self.load_bar_frame.columnconfigure(0, weight=1)
+        self.load_bar = ctk.CTkProgressBar(self.load_bar_frame)
+        self.load_bar.grid(row=0, column=0, sticky='WE', padx=10)
+        self.cancel_load_button = ctk.CTkButton(self.load_bar_frame, text="Cancel", width=60, command=self.cancel_loading)
+        self.cancel_load_button.grid(row=0, column=1, padx=5, pady=5)
+
+    def _on_first_map(self, event):
+        if event.widget is not self:
+            return  # children map events go through the toplevel bindings too
+        self.unbind('<Map>', self._first_map)
+
+        def painted():
+            self.update_idletasks()  # pending redraws of the widgets
+            self.first_paint_ms = (time.perf_counter() - STARTED) * 1000
+
+        self.after_idle(painted)
+
     def open_file(self, event=None):
         filename = ctk.filedialog.askopenfilename( title="Select a file",
-                                                   filetypes=(("Open interactive book format", "*.ibf"), ("All files", "*.*")))
+                                                   filetypes=(("Open interactive book format", "*.ibf"),
+                                                              ("Packed interactive book format", "*.ibfp"),
+                                                              ("All files", "*.*")))
         if not filename:
             return
 
-        if not filename.split('.')[-1] == 'ibf':
-            print('file must have .ibf extension')
+        if filename.split('.')[-1] not in ('ibf', 'ibfp'):
+            print('file must have .ibf or .ibfp extension')
             return
 
-        # reading cells from file
-        with open(filename, 'r') as file:
+        self.load_file(filename)
+
+    def load_file(self, filename: str):
+        """
+        starts loading file progressively, loading of previous file (if any) is cancelled
+        """
+        self.cancel_loading()
+
+        self.load_bar.set(0)
+        self.load_bar_frame.grid(row=2, column=0, columnspan=2, sticky='WE')
+        self.loader = BookLoader(self.viewer, filename, on_progress=self.load_bar.set, on_finish=self._loading_finished)
+        self.search_index.attach(self.loader.document)  # cells are indexed as they are loaded
+        self.outline.attach(self.loader.document)
+        try:
+            self.loader.start()
+        except (OSError, ValueError) as e:
+            print(f'got {e} while reading file {filename}')
+            self.loader = None
+            self.load_bar_frame.grid_forget()
+
+    def cancel_loading(self, event=None):
+        if self.loader:
+            self.loader.cancel()
+
+    def _loading_finished(self, loader: BookLoader):
+        if loader is not self.loader:
+            return
+        self.loader = None
+        self.load_bar_frame.grid_forget()
+
+        self._close_journal()
+        if not loader.cancelled and not loader.error:  # partially loaded book mustn't be saved over the file
+            # replays changes saved before a crash, if there are any
+            self.journal = BookJournal.open(loader.document, loader.filename)
+
+    def save_file(self, event=None):
+        """
+        saves only the changes into the journal of the opened file, asks for a file name if there is none
+        """
+        if self.journal and self.journal.document is self.viewer.document:
+            self.journal.save()
+        else:
+            self.save_file_as()
+
+    def save_file_as(self, event=None):
+        filename = self.viewer.save_file()
+        if filename:
+            self._close_journal()
+            self.journal = BookJournal(self.viewer.document, filename)
+
+    def _close_journal(self):
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def _compaction_tick(self):
+        # journal is folded back into the book file in background once it grows big
+        journal = self.journal
+        if journal:
             try:
-                file_data = json.load(file)
-                loaded_cells: List[Cell] = []
-                for cell in file_data:
-                    cell_type = cell['cell_type']
-                    cell_data = cell['data']
-                    match cell_type:
-                        case 'image':
-                            loaded_cells.append(ImageCell(self.viewer, cell_data))
-                        case 'plain text':
-                            loaded_cells.append(PlainTextCell(self.viewer, cell_data))
-                        case 'quiz':
-                            loaded_cells.append(QuizCell(self.viewer, cell_data))
-                        case 'flash cards':
-                            loaded_cells.append(FlashcardCell(self.viewer, cell_data))
-
-                # clearing viewer
-                for cell in self.viewer.cells:
-                    cell.grid_forget()
-                    cell.destroy()
-                self.viewer.selected_frame = None
-                self.viewer.cells.clear()
-
-                # adding cells from file data
-                self.viewer.cells = loaded_cells
-                self.viewer.__draw__()
+                journal.finish_compaction()
+            except Exception as e:
+                # saved changes stay in the journal, compaction is tried again on a later tick
+                print(f'got {e} while compacting journal of {journal.filename}')
+            if journal.needs_compaction():
+                journal.start_compaction()
+        self.after(COMPACTION_INTERVAL_MS if not (journal and journal.compaction_running) else 100,
+                   self._compaction_tick)
+
+    def open_study(self, event=None):
+        """
+        opens study of the flashcards of the current book, review state is saved next to the book file
+        """
+        document = self.viewer.document
+        store = ReviewStore.for_book(self.journal.filename) if self.journal else ReviewStore()
+        queue = StudyQueue()
+        queue.add_book(document, store)
+        StudyWindow(self, queue)
+
+    def open_library(self, event=None):
+        if self.library_window is None or not self.library_window.winfo_exists():
+            self.library_window = LibraryWindow(self, Catalog(), on_open=self.load_file)
+        self.library_window.focus()
+
+    def export_html(self, event=None):
+        """
+        exports the book as a static html site into a chosen directory, rendering runs in background
+        """
+        if self._export_thread is not None:
+            return
+        output_dir = ctk.filedialog.askdirectory(title="Export book as html site into")
+        if not output_dir:
+            return
+
+        # the export works on a copy, so the book can be edited meanwhile
+        document = Document.from_file_data(self.viewer.document.to_file_data(), keep_unknown=True)
+        document.pack = self.viewer.document.pack
+        base_dir = os.path.dirname(os.path.abspath(self.journal.filename)) if self.journal else None
+        title = book_title(document, os.path.basename(output_dir))
+
+        def export():
+            try:
+                self._export_result = export_document(
+                    document, output_dir, base_dir, title,
+                    on_progress=lambda *progress: setattr(self, '_export_progress', progress))
+            except Exception as e:
+                self._export_result = e
+
+        self._export_result = None
+        self._export_progress = (0, 0)
+        self._export_thread = threading.Thread(target=export, name='html-export', daemon=True)
+        self._export_thread.start()
+        self.upper_menu.export_button.configure(state='disabled')
+        self._poll_export()
+
+    def _poll_export(self):
+        button = self.upper_menu.export_button
+        if self._export_thread.is_alive():
+            done, total = self._export_progress
+            button.configure(text=f"{done}/{total}" if total else "Export")
+            self.after(100, self._poll_export)
+            return
+        self._export_thread = None
+        button.configure(text="Export", state='normal')
+        result = self._export_result
+        if isinstance(result, Exception):
+            message = f"Export failed: {result}"
+        else:
+            message = f"Exported {result['cells']} cells, {result['rendered']} rendered again"
+            if result['problems']:
+                message += "\n" + "\n".join(result['problems'][:10])
+        message_box(title="Export", message=message, icon="warning" if isinstance(result, Exception) or
+                    result['problems'] else "check")
+
+    def on_search_typed(self, event=None):
+        if event is not None and event.keysym == 'Return':
+            return
+        # searching waits until the user stops typing for a moment
+        if self._search_job:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(120, self.search)
+
+    def search(self, query: str = None):
+        """
+        searches the document and scrolls to the best match
+        """
+        self._search_job = None
+        if query is None:
+            query = self.upper_menu.search_entry.get()
+        self.search_hits = self.search_index.search(query)
+        self.search_hit_num = 0
+        if not query.strip():
+            self.upper_menu.search_result_label.configure(text="")
+            return
+        self._show_search_hit()
 
+    def next_search_hit(self, event=None):
+        if self._search_job:  # enter pressed before the search of typed text ran
+            self.after_cancel(self._search_job)
+            self.search()
+            return
+        if self.search_hits:
+            self.search_hit_num = (self.search_hit_num + 1) % len(self.search_hits)
+            self._show_search_hit()
+
+    def _show_search_hit(self):
+        label = self.upper_menu.search_result_label
+        if not self.search_hits:
+            label.configure(text="no matches")
+            return
+        label.configure(text=f"{self.search_hit_num + 1}/{len(self.search_hits)}")
+        record = self.search_hits[self.search_hit_num].record
+        try:
+            index = self.viewer.index_of(record)
+        except ValueError:
+            return  # cell was deleted since searching
+        self.viewer.scroll_to(index)
+
+    def on_close(self):
+        if self.journal and self.journal.journal_size():
+            try:
+                self.journal.compact()
             except Exception as e:
-                print(f'got {e} while reading file {filename}')
+                # journal is replayed when the book is opened next time, nothing saved is lost
+                print(f'got {e} while compacting journal of {self.journal.filename}')
+        self.watchdog.stop()
+        if LATENCY_LOG:
+            self.watchdog.dump(LATENCY_LOG, first_paint_ms=self.first_paint_ms)
+        self.destroy()
 
 
 if __name__ == '__main__':
+    # IBF_TRACE=trace.json python main.py  records timing spans and saves them as Chrome trace on exit
+    trace_file = os.environ.get('IBF_TRACE')
+    if trace_file:
+        install_tracing()
+
     window = App()
     window.title("Open-IBF editor")
     window.minsize(800, 900)
     window.mainloop()
+
+    if trace_file:
+        tracer.export_chrome(trace_file)
+        print(tracer.format_summary(by_class=True))
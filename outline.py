@@ -0,0 +1,271 @@
+"""
+outline of the opened book, a sidebar listing every cell with its type icon and title
+
+rows have a fixed height, so the outline is virtualized the simple way: only rows in the visible
+part of the canvas are drawn, and the row under the mouse is found by dividing. Titles are taken
+straight from the document when a row is drawn, so an edit only redraws the visible rows, no matter
+how long the book is.
+
+image cells get a tiny thumbnail. Thumbnails are made in a thread pool and stored in THUMBNAIL_DIR
+keyed by the path, mtime and size of the image, so they are made once per image and not again on
+every start. Clicking a row scrolls the viewer to the cell, which builds the cell if it wasn't.
+"""
+import hashlib
+import os
+import queue
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+import customtkinter as ctk
+from PIL import Image, ImageTk
+
+from cells import get_cell_type
+from document import Change, CellRecord, Document, ImageRecord
+from icons import icons
+
+THUMBNAIL_DIR = os.path.join(os.path.expanduser('~'), '.ibf_thumbnails')
+THUMBNAIL_SIZE = (40, 24)
+ROW_HEIGHT = 30  # before widget scaling
+MAX_TITLE = 80  # characters
+# icons of cell types which have no toolbar button (CellType.icon), other types without one get 'unknown'
+TYPE_ICONS = {'flash cards': 'flashcards'}
+
+
+def thumbnail_file(path: str, cache_dir: str = THUMBNAIL_DIR, size: tuple = THUMBNAIL_SIZE) -> str:
+    """
+    file the thumbnail of the image at path is cached in, it changes whenever the image does
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = hashlib.sha1(f'{path}\0{stat.st_mtime_ns}\0{stat.st_size}\0{size}'.encode()).hexdigest()
+    return os.path.join(cache_dir, key + '.png')
+
+
+def load_thumbnail(path: str, cache_dir: str = THUMBNAIL_DIR, size: tuple = THUMBNAIL_SIZE) -> Image.Image:
+    """
+    thumbnail of the image at path from the cache, made (and cached) if there isn't one
+    """
+    cached = thumbnail_file(path, cache_dir, size)
+    try:
+        with Image.open(cached) as img:
+            img.load()
+            return img.copy()
+    except OSError:
+        pass
+
+    with Image.open(path) as img:
+        img.draft('RGB', size)  # lets jpeg decoder skip unneeded pixels
+        img = img.convert('RGBA')
+    img.thumbnail(size, Image.LANCZOS)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f'{cached}.{os.getpid()}.tmp'
+    img.save(tmp_file, format='PNG')
+    os.replace(tmp_file, cached)
+    return img
+
+
+class ThumbnailLoader:
+    """
+    makes thumbnails of image cells in a thread pool, results are delivered on the Tk main thread
+
+    finished thumbnails are kept per record (least recently used are dropped past max_entries),
+    a record is forgotten when it changes
+    """
+
+    def __init__(self, widget, cache_dir: str = THUMBNAIL_DIR, max_workers: int = 2, max_entries: int = 1000,
+                 poll_ms: int = 30):
+        """
+        :param widget: any Tk widget, used to schedule delivery on the main thread
+        """
+        self.widget = widget
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_entries = max_entries
+        self.poll_ms = poll_ms
+
+        self._executor: ThreadPoolExecutor = None
+        self._thumbnails: OrderedDict[CellRecord, ImageTk.PhotoImage] = OrderedDict()
+        self._pending: Dict[CellRecord, Callable] = {}  # record -> callback
+        self._failed = set()
+        self._results = queue.SimpleQueue()
+        self._poll_job = None
+
+    def get(self, document: Document, record: ImageRecord, callback: Callable[[], None]) -> ImageTk.PhotoImage:
+        """
+        :param callback: called (on the main thread) once the thumbnail is ready, if it isn't yet
+        :return: thumbnail, None if it isn't ready yet or the image can't be read
+        """
+        thumbnail = self._thumbnails.get(record)
+        if thumbnail is not None:
+            self._thumbnails.move_to_end(record)
+            return thumbnail
+        if record in self._failed or record in self._pending:
+            return None
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='thumbnails')
+        self._pending[record] = callback
+        # images embedded in packed books are extracted in the worker too
+        future = self._executor.submit(lambda: load_thumbnail(document.image_path(record), self.cache_dir))
+        future.add_done_callback(lambda future: self._results.put((record, future)))
+        if self._poll_job is None:
+            self._poll_job = self.widget.after(self.poll_ms, self._poll)
+        return None
+
+    def _poll(self):
+        self._poll_job = None
+        ready = []
+        while not self._results.empty():
+            record, future = self._results.get()
+            callback = self._pending.pop(record, None)
+            if callback is None:
+                continue  # record was forgotten meanwhile
+            if future.exception() is not None:
+                self._failed.add(record)
+                continue
+            self._thumbnails[record] = ImageTk.PhotoImage(future.result())
+            if len(self._thumbnails) > self.max_entries:
+                self._thumbnails.popitem(last=False)
+            ready.append(callback)
+        for callback in set(ready):
+            callback()
+        if self._pending:
+            self._poll_job = self.widget.after(self.poll_ms, self._poll)
+
+    def forget(self, record: CellRecord):
+        self._thumbnails.pop(record, None)
+        self._pending.pop(record, None)
+        self._failed.discard(record)
+
+    def clear(self):
+        self._thumbnails.clear()
+        self._pending.clear()
+        self._failed.clear()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class Outline(ctk.CTkFrame):
+    """
+    sidebar with one row per cell of the document, clicking a row calls on_select with its index
+    """
+
+    def __init__(self, parent, on_select: Callable[[int], None], width: int = 260):
+        super().__init__(parent, width=width)
+        self.on_select = on_select
+        self.document: Document = None
+        self.thumbnails = ThumbnailLoader(self)
+        self._icons: Dict[str, ImageTk.PhotoImage] = {}
+        self._draw_job = None
+
+        self.rowconfigure(0, weight=1)
+        self.columnconfigure(0, weight=1)
+        self.canvas = ctk.CTkCanvas(self, width=self._apply_widget_scaling(width), highlightthickness=0,
+                                    bg=self._apply_appearance_mode(self.cget('fg_color')),
+                                    yscrollincrement=self.row_height)  # wheel scrolls by rows
+        self.canvas.grid(row=0, column=0, sticky='NSEW')
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky='NS')
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+
+        self.canvas.bind('<Configure>', lambda event: self._schedule_draw())
+        self.canvas.bind('<Button-1>', self._on_click)
+        self.canvas.bind('<MouseWheel>', self._on_mouse_wheel)
+        self.canvas.bind('<Button-4>', lambda event: self._scroll(-3))
+        self.canvas.bind('<Button-5>', lambda event: self._scroll(3))
+
+    @property
+    def row_height(self) -> int:
+        return round(self._apply_widget_scaling(ROW_HEIGHT))
+
+    def attach(self, document: Document):
+        """
+        starts showing another document
+        """
+        if self.document is not None:
+            self.document.unsubscribe(self._on_document_change)
+        self.document = document
+        document.subscribe(self._on_document_change)
+        self._on_document_change(Change('load', 0, len(document)))
+
+    def _on_document_change(self, change: Change):
+        match change.kind:
+            case 'load':
+                self.thumbnails.clear()
+                self.canvas.yview_moveto(0)
+            case 'delete':
+                for record in change.records or ():
+                    self.thumbnails.forget(record)
+            case 'update':
+                self.thumbnails.forget(change.record)  # image may have been replaced
+        self._schedule_draw()
+
+    def _schedule_draw(self):
+        # many changes in a row (e.g. while a book is loading) are drawn once
+        if self._draw_job is None:
+            self._draw_job = self.after_idle(self._draw)
+
+    def _icon(self, name: str) -> ImageTk.PhotoImage:
+        icon = self._icons.get(name)
+        if icon is None:
+            size = round(self._apply_widget_scaling(20))
+            icon = self._icons[name] = ImageTk.PhotoImage(icons.image(name).resize((size, size), Image.LANCZOS))
+        return icon
+
+    def _draw(self):
+        """
+        draws rows in the visible part of the canvas
+        """
+        self._draw_job = None
+        canvas = self.canvas
+        row_height = self.row_height
+        count = len(self.document) if self.document is not None else 0
+        canvas.configure(scrollregion=(0, 0, canvas.winfo_width(), count * row_height))
+        canvas.delete('row')
+
+        top = canvas.canvasy(0)
+        first = max(int(top // row_height), 0)
+        last = min(int((top + canvas.winfo_height()) // row_height) + 1, count)
+        text_color = self._apply_appearance_mode(ctk.ThemeManager.theme['CTkLabel']['text_color'])
+        padding = self._apply_widget_scaling(6)
+        for index in range(first, last):
+            record = self.document[index]
+            cell_type = get_cell_type(record.cell_type)
+            y = index * row_height + row_height // 2
+            icon = cell_type.icon or TYPE_ICONS.get(cell_type.tag, 'unknown')
+            canvas.create_image(padding, y, image=self._icon(icon), anchor='w', tags='row')
+            x = padding * 2 + self._apply_widget_scaling(20)
+
+            if isinstance(record, ImageRecord):
+                thumbnail = self.thumbnails.get(self.document, record, self._schedule_draw)
+                if thumbnail is not None:
+                    canvas.create_image(x, y, image=thumbnail, anchor='w', tags='row')
+                x += self._apply_widget_scaling(THUMBNAIL_SIZE[0]) + padding
+
+            title = cell_type.title(record) or cell_type.tag or ''
+            canvas.create_text(x, y, text=title[:MAX_TITLE], anchor='w', fill=text_color, tags='row',
+                               font=('Arial', -round(self._apply_widget_scaling(13))))
+
+    def _on_scrollbar(self, *args):
+        self.canvas.yview(*args)
+        self._schedule_draw()
+
+    def _scroll(self, units: int):
+        self.canvas.yview_scroll(units, 'units')
+        self._schedule_draw()
+
+    def _on_mouse_wheel(self, event):
+        self._scroll(-3 if event.delta > 0 else 3)
+
+    def _on_click(self, event):
+        index = int(self.canvas.canvasy(event.y) // self.row_height)
+        if self.document is not None and 0 <= index < len(self.document):
+            self.on_select(index)
+
+    def destroy(self):
+        self.thumbnails.shutdown()
+        super().destroy()
@@ -0,0 +1,158 @@
+import heapq
+import math
+import re
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, NamedTuple
+
+from document import CellRecord, Change, Document
+
+TOKEN_RE = re.compile(r'\w+')
+MIN_PREFIX = 2  # shorter unfinished words are matched exactly, a single letter would match too much
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def record_text(record: CellRecord) -> str:
+    """
+    searchable text of a cell: plain text, quiz question and answers, both sides of flashcards
+    """
+    match record.cell_type:
+        case 'plain text':
+            return record.text
+        case 'quiz':
+            return '\n'.join([record.text, *record.answers])
+        case 'flash cards':
+            return '\n'.join(f'{card.front}\n{card.back}' for card in record.cards)
+    return ''
+
+
+class SearchHit(NamedTuple):
+    index: int  # position of the cell in document
+    record: CellRecord
+    score: float
+
+
+class SearchIndex:
+    """
+    inverted index over the text of all cells of a document
+
+    built while the document is loaded and updated incrementally from document changes
+    (cell saved, inserted or deleted), so searching never rescans the cells
+    """
+
+    def __init__(self, document: Document = None):
+        self.document: Document = None
+        self.postings: Dict[str, Dict[int, int]] = {}  # token -> {id(record): term frequency}
+        self.records: Dict[int, CellRecord] = {}  # id(record) -> record
+        self._terms: Dict[int, Counter] = {}  # id(record) -> its token counts, needed for removal
+        self._vocabulary: List[str] = None  # sorted tokens for prefix lookup, rebuilt lazily
+        if document is not None:
+            self.attach(document)
+
+    def attach(self, document: Document):
+        """
+        starts following another document, index is rebuilt from its current cells
+        """
+        if self.document is not None:
+            self.document.unsubscribe(self._on_document_change)
+        self.document = document
+        document.subscribe(self._on_document_change)
+        self.rebuild()
+
+    def rebuild(self):
+        self.postings.clear()
+        self.records.clear()
+        self._terms.clear()
+        self._vocabulary = None
+        for record in self.document:
+            self.add(record)
+
+    def add(self, record: CellRecord):
+        key = id(record)
+        terms = Counter(tokenize(record_text(record)))
+        self.records[key] = record
+        self._terms[key] = terms
+        for token, count in terms.items():
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                self._vocabulary = None
+            postings[key] = count
+
+    def remove(self, record: CellRecord):
+        key = id(record)
+        self.records.pop(key, None)
+        for token in self._terms.pop(key, ()):
+            postings = self.postings[token]
+            del postings[key]
+            if not postings:
+                del self.postings[token]
+                self._vocabulary = None
+
+    def _on_document_change(self, change: Change):
+        match change.kind:
+            case 'load':
+                self.rebuild()
+            case 'insert':
+                for record in self.document[change.index:change.index + change.count]:
+                    self.add(record)
+            case 'delete':
+                for record in change.records:
+                    self.remove(record)
+            case 'update':
+                self.remove(change.record)
+                self.add(change.record)
+
+    def _matching_tokens(self, token: str, prefix: bool) -> List[str]:
+        if not prefix or len(token) < MIN_PREFIX:
+            return [token] if token in self.postings else []
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        vocabulary = self._vocabulary
+        tokens = []
+        i = bisect_left(vocabulary, token)
+        while i < len(vocabulary) and vocabulary[i].startswith(token):
+            tokens.append(vocabulary[i])
+            i += 1
+        return tokens
+
+    def search(self, query: str, limit: int = 50) -> List[SearchHit]:
+        """
+        cells containing all words of the query, ranked by tf-idf, the last word may be unfinished
+        (it is matched as a prefix) so results can be shown while typing
+
+        :return: best hits first
+        """
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        prefix_last = not query[-1:].isspace()
+
+        total = max(len(self.records), 1)
+        scores: Dict[int, float] = None
+        for i, query_token in enumerate(query_tokens):
+            token_scores: Dict[int, float] = {}
+            for token in self._matching_tokens(query_token, prefix_last and i == len(query_tokens) - 1):
+                postings = self.postings[token]
+                idf = math.log(1 + total / len(postings))
+                exact_bonus = 1.0 if token == query_token else 0.5
+                for key, count in postings.items():
+                    token_scores[key] = token_scores.get(key, 0.0) + (1 + math.log(count)) * idf * exact_bonus
+            if scores is None:
+                scores = token_scores
+            else:
+                scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+            if not scores:
+                return []
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        hits = []
+        for key, score in best:  # only the returned hits are located, O(log n) each
+            try:
+                hits.append(SearchHit(self.document.index(self.records[key]), self.records[key], score))
+            except ValueError:
+                continue
+        return hits
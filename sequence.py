@@ -0,0 +1,302 @@
+"""
+sequence with O(log n) positional operations
+
+IndexedSequence is an implicit treap: a binary tree ordered by position, kept balanced (expected
+O(log n) depth) by random heap priorities. Every node knows the size and the total weight of its
+subtree, so the node at a position, the position of a node, the total weight before a position and
+the position at a weight offset are all found walking a single path. Blocks of nodes are moved and
+deleted by splitting and merging the tree, in O(log n) no matter how long the block is.
+
+items are the nodes themselves (subclasses of SequenceNode), so the position of an item is found
+without any lookup table:
+
+    class Row(SequenceNode):
+        __slots__ = ('text',)
+
+    rows = IndexedSequence([Row(height) for height in heights])
+    rows.index(row)                 # position of the row
+    rows.move(100, 20, count=500)   # rows 100..599 now start at position 20
+    rows.bisect_weight(scroll_y)    # number of rows which end above scroll_y
+"""
+import random
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple
+
+
+class SequenceNode:
+    """
+    item of IndexedSequence, a node can be in one sequence at a time
+    """
+    __slots__ = ('_weight', '_left', '_right', '_parent', '_priority', '_size', '_total')
+
+    def __init__(self, weight: float = 0):
+        """
+        :param weight: e.g. height of the item, sequence keeps running totals of weights
+        """
+        self._weight = weight
+        self._left: SequenceNode = None
+        self._right: SequenceNode = None
+        self._parent: SequenceNode = None
+        self._priority = random.random()
+        self._size = 1
+        self._total = weight
+
+    @property
+    def weight(self) -> float:
+        """
+        changed only through IndexedSequence.set_weight, so totals of the sequence stay correct
+        """
+        return self._weight
+
+
+def _update(node: SequenceNode):
+    size = 1
+    total = node._weight
+    if node._left is not None:
+        size += node._left._size
+        total += node._left._total
+    if node._right is not None:
+        size += node._right._size
+        total += node._right._total
+    node._size = size
+    node._total = total
+
+
+def _merge(first: SequenceNode, second: SequenceNode) -> SequenceNode:
+    """
+    joins two trees, nodes of first end up before nodes of second
+    """
+    if first is None:
+        return second
+    if second is None:
+        return first
+    if first._priority > second._priority:
+        first._right = child = _merge(first._right, second)
+        child._parent = first
+        _update(first)
+        return first
+    second._left = child = _merge(first, second._left)
+    child._parent = second
+    _update(second)
+    return second
+
+
+def _split(node: SequenceNode, count: int) -> Tuple[SequenceNode, SequenceNode]:
+    """
+    :return: trees of the first count nodes and of the rest, parent pointers of their roots aren't cleared
+    """
+    if node is None:
+        return None, None
+    left_size = node._left._size if node._left is not None else 0
+    if count <= left_size:
+        first, node._left = _split(node._left, count)
+        if node._left is not None:
+            node._left._parent = node
+        _update(node)
+        return first, node
+    node._right, rest = _split(node._right, count - left_size - 1)
+    if node._right is not None:
+        node._right._parent = node
+    _update(node)
+    return node, rest
+
+
+def _build(nodes: List[SequenceNode]) -> SequenceNode:
+    """
+    builds a tree of nodes in the given order in O(n), right spine of the tree is kept on the stack
+    """
+    stack = []
+    for node in nodes:
+        node._left = node._right = node._parent = None
+        last = None
+        while stack and stack[-1]._priority < node._priority:
+            last = stack.pop()
+            _update(last)
+        if last is not None:
+            node._left = last
+            last._parent = node
+        if stack:
+            stack[-1]._right = node
+            node._parent = stack[-1]
+        stack.append(node)
+    for node in reversed(stack):
+        _update(node)
+    return stack[0] if stack else None
+
+
+def _iterate(node: SequenceNode) -> Iterator[SequenceNode]:
+    stack = []
+    while stack or node is not None:
+        while node is not None:
+            stack.append(node)
+            node = node._left
+        node = stack.pop()
+        yield node
+        node = node._right
+
+
+class IndexedSequence:
+    """
+    list of SequenceNodes with O(log n) indexing, index(), insert, delete and block moves
+    """
+
+    def __init__(self, nodes: Iterable[SequenceNode] = ()):
+        self._root: SequenceNode = _build(list(nodes))
+
+    def _set_root(self, root: SequenceNode):
+        if root is not None:
+            root._parent = None
+        self._root = root
+
+    def __len__(self) -> int:
+        return self._root._size if self._root is not None else 0
+
+    def __iter__(self) -> Iterator[SequenceNode]:
+        return _iterate(self._root)
+
+    @property
+    def total_weight(self) -> float:
+        return self._root._total if self._root is not None else 0
+
+    def _iter_from(self, index: int) -> Iterator[SequenceNode]:
+        # ancestors the path turned left at follow the start node, so they are left on the stack
+        stack = []
+        node = self._root
+        while node is not None:
+            left_size = node._left._size if node._left is not None else 0
+            if index < left_size:
+                stack.append(node)
+                node = node._left
+            elif index == left_size:
+                stack.append(node)
+                break
+            else:
+                index -= left_size + 1
+                node = node._right
+        while stack:
+            node = stack.pop()
+            yield node
+            node = node._right
+            while node is not None:
+                stack.append(node)
+                node = node._left
+
+    def __getitem__(self, index):
+        """
+        node at index, or list of nodes for slices (without step)
+        """
+        length = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(length)
+            if step != 1:
+                raise ValueError('slice step is not supported')
+            return list(islice(self._iter_from(start), max(stop - start, 0)))
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('sequence index out of range')
+        node = self._root
+        while True:
+            left_size = node._left._size if node._left is not None else 0
+            if index < left_size:
+                node = node._left
+            elif index == left_size:
+                return node
+            else:
+                index -= left_size + 1
+                node = node._right
+
+    def index(self, node: SequenceNode) -> int:
+        """
+        position of the node, raises ValueError if it isn't in this sequence
+        """
+        position = node._left._size if node._left is not None else 0
+        while node._parent is not None:
+            parent = node._parent
+            if node is parent._right:
+                position += (parent._left._size if parent._left is not None else 0) + 1
+            node = parent
+        if node is not self._root:
+            raise ValueError('node is not in the sequence')
+        return position
+
+    def __contains__(self, node: SequenceNode) -> bool:
+        while node._parent is not None:
+            node = node._parent
+        return node is self._root
+
+    def insert(self, index: int, nodes: Iterable[SequenceNode]):
+        """
+        inserts nodes (which must not be in any sequence) before index
+        """
+        index = max(0, min(index, len(self)))
+        first, rest = _split(self._root, index)
+        self._set_root(_merge(_merge(first, _build(list(nodes))), rest))
+
+    def append(self, node: SequenceNode):
+        self.insert(len(self), [node])
+
+    def delete(self, index: int, count: int = 1) -> List[SequenceNode]:
+        """
+        :return: removed nodes
+        """
+        first, rest = _split(self._root, index)
+        removed, rest = _split(rest, count)
+        self._set_root(_merge(first, rest))
+        if removed is not None:
+            removed._parent = None  # removed nodes must not lead to the root anymore
+        return list(_iterate(removed))
+
+    def move(self, index: int, new_index: int, count: int = 1):
+        """
+        moves count nodes from index so the first of them ends up at new_index
+        """
+        if not 0 <= index <= index + count <= len(self) or not 0 <= new_index <= len(self) - count:
+            raise IndexError('sequence index out of range')
+        first, rest = _split(self._root, index)
+        block, rest = _split(rest, count)
+        first, rest = _split(_merge(first, rest), new_index)
+        self._set_root(_merge(_merge(first, block), rest))
+
+    def set_weight(self, node: SequenceNode, weight: float):
+        difference = weight - node._weight
+        node._weight = weight
+        while node is not None:
+            node._total += difference
+            node = node._parent
+
+    def weight_before(self, index: int) -> float:
+        """
+        total weight of the first index nodes
+        """
+        total = 0
+        node = self._root
+        while node is not None:
+            left_size = node._left._size if node._left is not None else 0
+            left_total = node._left._total if node._left is not None else 0
+            if index <= left_size:
+                node = node._left
+            else:
+                total += left_total + node._weight
+                index -= left_size + 1
+                node = node._right
+        return total
+
+    def bisect_weight(self, offset: float, right: bool = True) -> int:
+        """
+        like bisect_right (bisect_left if not right) over the running totals of weights, e.g. number
+        of nodes which end at or above the offset
+        """
+        count = 0
+        base = 0
+        node = self._root
+        while node is not None:
+            left_total = node._left._total if node._left is not None else 0
+            end = base + left_total + node._weight
+            if end <= offset if right else end < offset:
+                count += (node._left._size if node._left is not None else 0) + 1
+                base = end
+                node = node._right
+            else:
+                node = node._left
+        return count
@@ -0,0 +1,225 @@
+"""
+spaced repetition of flashcards
+
+cards are scheduled with the SM-2 algorithm, review state of a book is kept in <book>.review.json
+next to it. Cards are identified by the hash of their sides, so reordering or moving cards keeps
+their progress and editing a card starts it over.
+
+StudyQueue orders cards of one or many books by due time in a heap, picking the next card is O(log n)
+and building the queue is O(n), so sessions over 100k cards start right away.
+"""
+import hashlib
+import heapq
+import json
+import os
+import time
+from typing import Dict, Iterator, List, NamedTuple, Tuple
+
+from document import Document, Flashcard
+
+DAY = 24 * 60 * 60
+MIN_EASINESS = 1.3
+RETRY_DELAY = 10 * 60  # failed cards come back in the same session
+
+
+def card_key(card: Flashcard) -> str:
+    return hashlib.sha1(f'{card.front}\0{card.back}'.encode()).hexdigest()[:16]
+
+
+class ReviewState:
+    __slots__ = ('easiness', 'interval', 'repetitions', 'due')
+
+    def __init__(self, easiness: float = 2.5, interval: float = 0, repetitions: int = 0, due: float = 0):
+        """
+        :param interval: days until the next review
+        :param due: time.time() the card should be reviewed at, 0 for cards never studied
+        """
+        self.easiness = easiness
+        self.interval = interval
+        self.repetitions = repetitions
+        self.due = due
+
+    def to_data(self) -> list:
+        return [round(self.easiness, 3), self.interval, self.repetitions, self.due]
+
+    def grade(self, quality: int, now: float = None):
+        """
+        SM-2 update after a review
+
+        :param quality: 0 (complete blackout) .. 5 (perfect response), below 3 counts as forgotten
+        """
+        if not 0 <= quality <= 5:
+            raise ValueError('quality must be between 0 and 5')
+        now = time.time() if now is None else now
+        if quality < 3:
+            self.repetitions = 0
+            self.interval = 0
+            self.due = now + RETRY_DELAY
+        else:
+            self.repetitions += 1
+            if self.repetitions == 1:
+                self.interval = 1
+            elif self.repetitions == 2:
+                self.interval = 6
+            else:
+                self.interval = round(self.interval * self.easiness)
+            self.due = now + self.interval * DAY
+        self.easiness = max(MIN_EASINESS, self.easiness + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+
+class ReviewStore:
+    """
+    review states of cards of a single book
+    """
+
+    def __init__(self, filename: str = None):
+        """
+        :param filename: file states are saved to, None keeps them only in memory
+        """
+        self.filename = filename
+        self.states: Dict[str, ReviewState] = {}
+        self.dirty = False
+
+    @classmethod
+    def for_book(cls, book_filename: str) -> 'ReviewStore':
+        store = cls(book_filename + '.review.json')
+        if os.path.exists(store.filename):
+            with open(store.filename) as file:
+                store.states = {key: ReviewState(*data) for key, data in json.load(file).items()}
+        return store
+
+    def due(self, key: str) -> float:
+        state = self.states.get(key)
+        return state.due if state is not None else 0
+
+    def state(self, key: str) -> ReviewState:
+        """
+        review state of the card, created for cards studied for the first time
+        """
+        state = self.states.get(key)
+        if state is None:
+            state = self.states[key] = ReviewState()
+        return state
+
+    def save(self):
+        if not self.dirty or self.filename is None:
+            return
+        tmp_filename = f'{self.filename}.{os.getpid()}.tmp'
+        with open(tmp_filename, 'w') as file:
+            json.dump({key: state.to_data() for key, state in self.states.items()}, file, separators=(',', ':'))
+        os.replace(tmp_filename, self.filename)
+        self.dirty = False
+
+
+class StudyItem(NamedTuple):
+    book: int  # position of the book in StudyQueue.books
+    key: str
+    card: Flashcard
+
+
+def document_cards(document: Document) -> Iterator[Flashcard]:
+    for record in document:
+        if record.cell_type == 'flash cards':
+            yield from record.cards
+
+
+class StudyQueue:
+    """
+    cards of one or many books ordered by due time
+
+        queue = StudyQueue()
+        queue.add_book(document, ReviewStore.for_book(filename))
+        item = queue.next_due()
+        queue.grade(item, 4)
+        queue.save()
+
+    graded cards are pushed again with their new due time, older heap entries of them are skipped
+    when they reach the top (lazy deletion)
+
+    number of due cards is counted once, then kept up to date by grade() and by a second heap of
+    cards which weren't due yet when counted
+    """
+
+    def __init__(self):
+        self.books: List[ReviewStore] = []
+        self.heap: List[Tuple[float, int, StudyItem]] = []  # (due, sequence number, item)
+        self._sequence = 0  # keeps cards of equal due time in book order
+        self._due_count = 0  # cards due at _counted_until
+        self._counted_until: float = None  # None until due cards are first counted
+        self._upcoming: List[Tuple[float, int, StudyItem]] = []  # entries due after _counted_until
+
+    def add_book(self, document: Document, store: ReviewStore):
+        book = len(self.books)
+        self.books.append(store)
+        seen = set()
+        heap = self.heap
+        for card in document_cards(document):
+            key = card_key(card)
+            if key in seen:
+                continue  # duplicate cards share their progress
+            seen.add(key)
+            heap.append((store.due(key), self._sequence, StudyItem(book, key, card)))
+            self._sequence += 1
+        heapq.heapify(heap)
+        self._counted_until = None  # counted again with the new cards
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def _is_current(self, entry: Tuple[float, int, StudyItem]) -> bool:
+        due, _, item = entry
+        return self.books[item.book].due(item.key) == due
+
+    def next_due(self, now: float = None) -> StudyItem:
+        """
+        :return: card due soonest if it is due at now (default: current time), None otherwise
+        """
+        now = time.time() if now is None else now
+        heap = self.heap
+        while heap and not self._is_current(heap[0]):
+            heapq.heappop(heap)
+        if heap and heap[0][0] <= now:
+            return heap[0][2]
+        return None
+
+    def due_count(self, now: float = None) -> int:
+        """
+        number of cards due at now, the first call is O(n), later ones O(log n) per card which became due
+        """
+        now = time.time() if now is None else now
+        if self._counted_until is None or now < self._counted_until:
+            self._due_count = 0
+            self._upcoming = []
+            for entry in self.heap:
+                if self._is_current(entry):
+                    if entry[0] <= now:
+                        self._due_count += 1
+                    else:
+                        self._upcoming.append(entry)
+            heapq.heapify(self._upcoming)
+        else:
+            upcoming = self._upcoming
+            while upcoming and upcoming[0][0] <= now:
+                if self._is_current(heapq.heappop(upcoming)):
+                    self._due_count += 1
+        self._counted_until = now
+        return self._due_count
+
+    def grade(self, item: StudyItem, quality: int, now: float = None):
+        store = self.books[item.book]
+        state = store.state(item.key)
+        counted = self._counted_until is not None and store.due(item.key) <= self._counted_until
+        state.grade(quality, now)
+        store.dirty = True
+        entry = (state.due, self._sequence, item)
+        heapq.heappush(self.heap, entry)
+        self._sequence += 1
+
+        if self._counted_until is not None:
+            self._due_count += (state.due <= self._counted_until) - counted
+            if state.due > self._counted_until:
+                heapq.heappush(self._upcoming, entry)
+
+    def save(self):
+        for store in self.books:
+            store.save()
@@ -0,0 +1,128 @@
+"""
+opt-in timing spans for hot paths
+
+nothing is wrapped until instrument() is called, so there is no overhead while tracing is off.
+Spans can be exported as Chrome trace events (open in chrome://tracing or ui.perfetto.dev) or
+aggregated into a per-function summary.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterable
+
+
+class Span:
+    __slots__ = ('name', 'category', 'start_ns', 'duration_ns', 'thread')
+
+    def __init__(self, name: str, category: str, start_ns: int, duration_ns: int, thread: int):
+        self.name = name
+        self.category = category
+        self.start_ns = start_ns
+        self.duration_ns = duration_ns
+        self.thread = thread
+
+
+class Tracer:
+    def __init__(self, max_spans: int = 1_000_000):
+        self.spans: deque[Span] = deque(maxlen=max_spans)  # oldest spans are dropped
+        self._originals: list = []  # (owner, attribute, original value) for uninstrument()
+
+    def record(self, name: str, category: str, start_ns: int, duration_ns: int):
+        self.spans.append(Span(name, category, start_ns, duration_ns, threading.get_ident()))
+
+    @contextmanager
+    def span(self, name: str, category: str = 'custom'):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, category, start, time.perf_counter_ns() - start)
+
+    def _wrap(self, function, name: str, category: str, per_class: bool):
+        record = self.record
+        perf_counter_ns = time.perf_counter_ns
+
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                # methods inherited from a base class are reported under the concrete class name
+                span_name = f'{type(args[0]).__name__}.{name}' if per_class and args else name
+                record(span_name, category, start, perf_counter_ns() - start)
+        return traced
+
+    def instrument(self, owner, names: Iterable[str], category: str):
+        """
+        wraps functions (or methods if owner is a class) in timing spans
+
+        :param owner: class or module defining the functions
+        """
+        is_class = isinstance(owner, type)
+        for name in names:
+            original = owner.__dict__.get(name) if is_class else getattr(owner, name, None)
+            if original is None or getattr(getattr(original, '__func__', original), '__traced__', False):
+                continue
+            if isinstance(original, (staticmethod, classmethod)):
+                wrapped = type(original)(self._wrap(original.__func__, f'{owner.__name__}.{name}', category, False))
+            elif is_class:
+                wrapped = self._wrap(original, name, category, True)
+            else:
+                wrapped = self._wrap(original, f'{original.__module__}.{name}', category, False)
+            getattr(wrapped, '__func__', wrapped).__traced__ = True
+            setattr(owner, name, wrapped)
+            self._originals.append((owner, name, original))
+
+    def uninstrument(self):
+        while self._originals:
+            owner, name, original = self._originals.pop()
+            setattr(owner, name, original)
+
+    @property
+    def instrumented(self) -> bool:
+        return bool(self._originals)
+
+    def clear(self):
+        self.spans.clear()
+
+    def chrome_trace(self) -> dict:
+        pid = os.getpid()
+        return {"traceEvents": [
+            {"name": span.name, "cat": span.category, "ph": "X", "pid": pid, "tid": span.thread,
+             "ts": span.start_ns / 1000, "dur": span.duration_ns / 1000}
+            for span in list(self.spans)
+        ], "displayTimeUnit": "ms"}
+
+    def export_chrome(self, filename: str):
+        with open(filename, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+
+    def summary(self, by_class: bool = False) -> dict:
+        """
+        :param by_class: aggregate all methods of a class (e.g. a cell type) together
+        :return: {span name: {"count", "total_ms", "mean_ms", "max_ms"}}, slowest in total first
+        """
+        totals = {}
+        for span in list(self.spans):
+            name = span.name.rsplit('.', 1)[0] if by_class else span.name
+            entry = totals.setdefault(name, [0, 0, 0])
+            entry[0] += 1
+            entry[1] += span.duration_ns
+            entry[2] = max(entry[2], span.duration_ns)
+        return {name: {"count": count, "total_ms": total / 1e6, "mean_ms": total / count / 1e6, "max_ms": longest / 1e6}
+                for name, (count, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1])}
+
+    def format_summary(self, by_class: bool = False) -> str:
+        lines = [f'{"span":48} {"count":>7} {"total ms":>10} {"mean ms":>9} {"max ms":>9}']
+        for name, entry in self.summary(by_class).items():
+            lines.append(f'{name:48} {entry["count"]:>7} {entry["total_ms"]:>10.2f} {entry["mean_ms"]:>9.3f} '
+                         f'{entry["max_ms"]:>9.2f}')
+        return '\n'.join(lines)
+
+
+tracer = Tracer()